@@ -0,0 +1,72 @@
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from modules.Messages import PlainMessage
+
+# Original string-based implementation of PlainMessage.fromBytes, kept here as the reference
+def legacyFromBytes(messageString, groupSize):
+    bits = "".join([format(byte, "08b") for byte in messageString])
+
+    remainderBitNumber = len(bits) % groupSize
+    paddingLength = 0 if remainderBitNumber == 0 else groupSize - remainderBitNumber
+
+    bits += "0" * paddingLength
+    bits += "0" * (groupSize - paddingLength) + "1" * paddingLength
+
+    groups = [(bits[i:i+groupSize]) for i in range(0, len(bits), groupSize)]
+    groups.insert(0, format(len(groups), "0" + str(groupSize) + "b"))
+
+    return groups
+
+# Original string-based implementation of PlainMessage.getMessage, kept here as the reference
+def legacyGetMessage(groups):
+    lengthIndicator = int(groups[0], 2)
+    paddingSize = len([c for c in groups[lengthIndicator] if c == "1"])
+
+    bits = "".join(groups[1:lengthIndicator])
+    bits = bits if paddingSize == 0 else bits[:-paddingSize]
+
+    return bytes([int(bits[i:i+8], 2) for i in range(0, len(bits), 8)])
+
+# Returns the time in seconds needed to run "function" once
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Benchmark of the bytes <-> groups codec")
+    argParser.add_argument("--sizes", type=int, nargs="+", default=[10**3, 10**4, 10**5, 10**6, 10**7, 10**8],
+            help="Payload sizes in bytes")
+    argParser.add_argument("--group-size", type=int, default=24, help="Number of bits of each group")
+    argParser.add_argument("--legacy-limit", type=int, default=10**7,
+            help="Biggest payload measured with the string-based codec (it needs ~8 bytes of memory per bit)")
+    args = argParser.parse_args()
+
+    print("%12s %14s %14s %14s %14s %10s" % ("size", "legacy pack", "numpy pack", "legacy unpack", "numpy unpack", "speedup"))
+
+    for size in args.sizes:
+        payload = os.urandom(size)
+
+        packTime, message = measure(PlainMessage.fromBytes, payload, args.group_size)
+        unpackTime, output = measure(message.getMessage)
+
+        if output != payload:
+            print("ERROR: the numpy codec does not roundtrip a payload of", size, "bytes")
+            exit(1)
+
+        if size > args.legacy_limit:
+            print("%12d %14s %13.4fs %14s %13.4fs %10s" % (size, "-", packTime, "-", unpackTime, "-"))
+            continue
+
+        legacyPackTime, legacyGroups = measure(legacyFromBytes, payload, args.group_size)
+        legacyUnpackTime, legacyOutput = measure(legacyGetMessage, legacyGroups)
+
+        # Both codecs must produce exactly the same groups
+        if [int(group, 2) for group in legacyGroups] != message.groups.tolist() or legacyOutput != payload:
+            print("ERROR: the numpy codec is not compatible with the string-based codec")
+            exit(1)
+
+        speedup = (legacyPackTime + legacyUnpackTime) / (packTime + unpackTime)
+        print("%12d %13.4fs %13.4fs %13.4fs %13.4fs %9.1fx" % (size, legacyPackTime, packTime, legacyUnpackTime, unpackTime, speedup))
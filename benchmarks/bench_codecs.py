@@ -0,0 +1,94 @@
+import argparse, glob, io, os, shutil, sys, tempfile, time, zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import rsa
+
+from modules.Compressor import Compressor, CODECS, chooseCodec, zstandard
+from modules.GoogleDoc import GoogleDoc
+from modules.LocalBackend import LocalBackend
+from modules.Messages import PlainMessage, EncodedMessage
+from modules.PGP import PGP
+from modules.Set import Set
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+# Original compression of the tool (a ZIP file with deflate), kept here as the reference
+def legacyCompress(fileName):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        with open(fileName, "rb") as file:
+            zf.writestr(os.path.basename(fileName), file.read())
+
+    return buffer.getvalue()
+
+# Sends a file to a new local document and reads it back, like main.py does
+# Returns the compressed size, the slots used, the seconds spent compressing, and the total seconds
+def runEndToEnd(fileName, codec, keysDir, workDir):
+    myset = Set(24, "bench")
+
+    start = time.perf_counter()
+    if codec == "zip (original)":
+        compressed = legacyCompress(fileName)
+    else:
+        compressed = Compressor(codec).compress(fileName)
+    compressTime = time.perf_counter() - start
+
+    pgp = PGP()
+    pgp.addPublicKey(os.path.join(keysDir, "public.pem"))
+    encoded = PlainMessage.fromBytes(pgp.encrypt(compressed), myset.groupSize).encode(myset)
+
+    # A document with just enough spaces, in paragraphs of 1000 words
+    backend = LocalBackend(os.path.join(workDir, codec.split(" ")[0]))
+    paragraphCount = -(-len(encoded.colors) // 1000)
+    backend.createDocument("docs", "bench", ("word " * 1000 + "\n") * paragraphCount)
+
+    gdoc = GoogleDoc(backend=backend, requestsPerMinute=10**9)
+    encoded.sendToDoc(gdoc)
+
+    gdoc = GoogleDoc(backend=backend, requestsPerMinute=10**9)
+    pgp = PGP()
+    pgp.addPrivateKey(os.path.join(keysDir, "private.pem"))
+    plainText = pgp.decrypt(EncodedMessage.fromGoogleDoc(gdoc).decode(myset).getMessage())
+    outputFile = Compressor.decompress(plainText, os.path.join(workDir, "output-" + codec.split(" ")[0]))
+
+    totalTime = time.perf_counter() - start
+
+    with open(fileName, "rb") as original, open(outputFile, "rb") as output:
+        if original.read() != output.read():
+            print("ERROR: the file", fileName, "does not roundtrip with the codec", codec)
+            exit(1)
+
+    return len(compressed), len(encoded.colors), compressTime, totalTime
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Benchmark of the compression codecs: slots used and end-to-end time")
+    argParser.add_argument("files", nargs="*", help="Files to send (by default, the files in samples/)")
+    args = argParser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(SAMPLES_DIR, "*")))
+    codecs = ["zip (original)", "auto"] + [codec for codec in CODECS if codec != "zstd" or zstandard is not None]
+
+    workDir = tempfile.mkdtemp()
+    try:
+        # The size of the RSA key must match the one used by PGP
+        publicKey, privateKey = rsa.newkeys(1024)
+        with open(os.path.join(workDir, "public.pem"), "wb") as file:
+            file.write(publicKey.save_pkcs1())
+        with open(os.path.join(workDir, "private.pem"), "wb") as file:
+            file.write(privateKey.save_pkcs1())
+
+        print("%-14s %10s %-15s %12s %10s %12s %12s" % ("file", "size", "codec", "compressed", "slots", "compress", "end-to-end"))
+
+        for fileName in files:
+            size = os.path.getsize(fileName)
+            for codec in codecs:
+                runDir = tempfile.mkdtemp(dir=workDir)
+                compressedSize, slots, compressTime, totalTime = runEndToEnd(fileName, codec, workDir, runDir)
+                shutil.rmtree(runDir)
+
+                label = codec if codec != "auto" else "auto (" + chooseCodec(fileName) + ")"
+
+                print("%-14s %10d %-15s %12d %10d %11.4fs %11.4fs" % (os.path.basename(fileName)[:14], size, label, compressedSize, slots, compressTime, totalTime))
+    finally:
+        shutil.rmtree(workDir)
@@ -0,0 +1,81 @@
+import argparse, json, os, random, subprocess, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import modules.GoogleDoc as GoogleDoc
+
+# Writes a document resource where every space has its own color (as it happens after a
+# message is uploaded), with "spaceCount" spaces in paragraphs of "wordsPerParagraph" words
+def writeFragmentedDocument(path, spaceCount, wordsPerParagraph=100):
+    random.seed(0)
+    content = [{ "endIndex": 1, "sectionBreak": { "sectionStyle": {} } }]
+
+    index = 1
+    while spaceCount > 0:
+        paragraphStart = index
+        elements = []
+        for i in range(min(wordsPerParagraph, spaceCount)):
+            elements.append({ "startIndex": index, "endIndex": index + 5, "textRun": { "content": "lorem", "textStyle": {} } })
+            color = { "red": random.random(), "green": random.random(), "blue": random.random() }
+            elements.append({ "startIndex": index + 5, "endIndex": index + 6, "textRun": { "content": " ",
+                "textStyle": { "foregroundColor": { "color": { "rgbColor": color } } } } })
+            index += 6
+            spaceCount -= 1
+
+        elements.append({ "startIndex": index, "endIndex": index + 1, "textRun": { "content": "\n", "textStyle": {} } })
+        index += 1
+        content.append({ "startIndex": paragraphStart, "endIndex": index, "paragraph": { "elements": elements } })
+
+    with open(path, "w") as file:
+        json.dump({ "documentId": "bench", "title": "bench", "revisionId": "1", "body": { "content": content } }, file)
+
+# Returns the peak RSS of this process in MB. VmHWM is used instead of getrusage, because the
+# latter keeps the peak of the parent process after a fork
+def getPeakRss():
+    with open("/proc/self/status", "r") as file:
+        for line in file:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+# Parses the document in this process, and prints the time and the peak RSS as JSON
+def runChild(mode, path):
+    start = time.perf_counter()
+
+    if mode == "tree":
+        with open(path, "rb") as file:
+            slots = GoogleDoc.__dict__["__parseDocumentContent__"](json.load(file)["body"]["content"])
+    else:
+        with open(path, "rb") as file:
+            slots = GoogleDoc.__dict__["__parseDocumentStream__"](file)
+
+    elapsed = time.perf_counter() - start
+    print(json.dumps({ "slots": len(slots), "seconds": elapsed, "peakRssMB": getPeakRss() }))
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Benchmark of the fetch and parse of the document (full JSON tree vs streaming)")
+    argParser.add_argument("--spaces", type=int, nargs="+", default=[10**4, 10**5, 10**6], help="Number of spaces of the documents")
+    argParser.add_argument("--child", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = argParser.parse_args()
+
+    if args.child:
+        runChild(*args.child)
+        exit()
+
+    if GoogleDoc.ijson is None:
+        print("WARNING: ijson is not installed, so the streaming parser falls back to the full JSON tree")
+
+    print("%10s %10s %14s %14s %14s %14s" % ("spaces", "file MB", "tree time", "stream time", "tree RSS MB", "stream RSS MB"))
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        for spaceCount in args.spaces:
+            path = os.path.join(tempDir, "document.json")
+            writeFragmentedDocument(path, spaceCount)
+
+            # Each parse runs in its own process, so its peak RSS can be measured
+            results = {}
+            for mode in ["tree", "stream"]:
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", mode, path])
+                results[mode] = json.loads(output)
+
+            print("%10d %10.1f %13.3fs %13.3fs %14.1f %14.1f" % (spaceCount, os.path.getsize(path) / 2**20,
+                results["tree"]["seconds"], results["stream"]["seconds"], results["tree"]["peakRssMB"], results["stream"]["peakRssMB"]))
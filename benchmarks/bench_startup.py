@@ -0,0 +1,54 @@
+import argparse, os, shutil, statistics, subprocess, sys, tempfile, threading, time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_DIR)
+
+from modules.FakeServer import FakeServer
+from modules.GoogleBackend import GoogleBackend
+from modules.LocalBackend import LocalBackend
+
+# Returns the median wall time of running a command "repeat" times
+def timeCommand(command, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+# Returns the wall time of a function call
+def timeCall(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Benchmark of the start-up time of the tool")
+    argParser.add_argument("--repeat", type=int, default=5, help="Times each command is run (the median is reported)")
+    args = argParser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        storeDir = os.path.join(tempDir, "store")
+        backend = LocalBackend(storeDir)
+        documentId = backend.createDocument("docs", "cover", "lorem ipsum dolor sit amet\n" * 1000)
+
+        # Interpreter start-up and imports of main.py
+        print("%-52s %8.3fs" % ("main.py -h", timeCommand([sys.executable, "main.py", "-h"], args.repeat)))
+
+        # A whole small operation against a local document, with and without the slot cache
+        command = [sys.executable, "main.py", "compact", "key", "public.pem", "unused",
+                "--backend", "local:" + storeDir, "--cache-dir", os.path.join(tempDir, "cache")]
+        print("%-52s %8.3fs" % ("main.py compact (local document, no cache)", timeCommand(command + ["--no-cache"], args.repeat)))
+        print("%-52s %8.3fs" % ("main.py compact (local document, cached)", timeCommand(command, args.repeat)))
+
+        # Building the service objects (discovery document included) against the local stand-in of the APIs
+        server = FakeServer(backend)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        discoveryCacheDir = os.path.join(tempDir, "discovery")
+        googleBackend = GoogleBackend(apiEndpoint=server.getEndpoint(), discoveryCacheDir=discoveryCacheDir)
+        print("%-52s %8.3fs" % ("first API call (builds the service)", timeCall(lambda: googleBackend.getRevisionId(documentId))))
+        print("%-52s %8.3fs" % ("second API call (pooled service and connection)", timeCall(lambda: googleBackend.getRevisionId(documentId))))
+
+        server.shutdown()
@@ -0,0 +1,272 @@
+import argparse, json, os, platform, random, shutil, sys, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+import rsa
+
+import modules.GoogleDoc as GoogleDocModule
+
+from bench_parse import writeFragmentedDocument
+from modules.Compressor import Compressor
+from modules.GoogleDoc import GoogleDoc
+from modules.LocalBackend import buildDocument
+from modules.MemoryBackend import MemoryBackend
+from modules.Messages import PlainMessage, EncodedMessage
+from modules.PGP import PGP
+from modules.Profiler import Profiler
+from modules.SendPipeline import SendPipeline
+from modules.Set import Set
+
+# Sizes measured by default (about a minute), and with "--full" (which can take hours)
+QUICK_PAYLOADS = [10**3, 10**4, 10**5, 10**6]
+QUICK_SPACES = [10**3, 10**4, 10**5]
+FULL_PAYLOADS = QUICK_PAYLOADS + [10**7, 10**8]
+FULL_SPACES = QUICK_SPACES + [10**6, 10**7]
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Growth of the peak memory below this is not reported as a regression, as the small cases
+# are dominated by the noise of the allocator
+MEMORY_SLACK = 1 << 20
+
+# Words of each paragraph of the synthetic cover documents
+WORDS_PER_PARAGRAPH = 1000
+
+# Returns a deterministic payload of "size" bytes: half of it random (which can not be
+# compressed) and half of it text
+def makePayload(size):
+    generator = random.Random(size)
+    text = b"Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. "
+
+    randomPart = generator.randbytes(size // 2)
+    textPart = (text * (-(-(size - len(randomPart)) // len(text))))[:size - len(randomPart)]
+
+    return randomPart + textPart
+
+# Returns the text of a cover document with "spaceCount" spaces, in paragraphs of WORDS_PER_PARAGRAPH words
+def makeCoverText(spaceCount):
+    paragraphs = [("word " * WORDS_PER_PARAGRAPH + "\n")] * (spaceCount // WORDS_PER_PARAGRAPH)
+    if spaceCount % WORDS_PER_PARAGRAPH:
+        paragraphs.append("word " * (spaceCount % WORDS_PER_PARAGRAPH) + "\n")
+
+    return "".join(paragraphs)
+
+# Returns a MemoryBackend with a cover document of "spaceCount" spaces in the "docs" folder
+def makeBackend(spaceCount, applyUpdates=False):
+    backend = MemoryBackend(applyUpdates)
+    backend.createDocument(GoogleDocModule.DOCUMENTS_BASE_FOLDER_NAME, "bench", makeCoverText(spaceCount))
+    return backend
+
+# Runs "function" with the arguments returned by "setup" (which is not measured) "repeat" times,
+# and once more with the Python allocations traced. Returns the best wall time, the peak memory
+# allocated by "function", and the counters of the profiler
+def measure(setup, function, repeat):
+    bestTime = None
+    for _ in range(repeat):
+        args = setup()
+        profiler = Profiler().start()
+        with profiler.stage("case"):
+            function(*args)
+        profiler.stop()
+
+        report = profiler.getReport()
+        bestTime = report["stages"]["case"]["wallTime"] if bestTime is None else min(bestTime, report["stages"]["case"]["wallTime"])
+        del args
+
+    args = setup()
+    profiler = Profiler(traceMemory=True).start()
+    with profiler.stage("case"):
+        function(*args)
+    profiler.stop()
+
+    return bestTime, profiler.getReport()["stages"]["case"]["peakMemory"], report["counters"]
+
+# Measures each stage of the tool on its own with a payload of "size" bytes. Returns a dict
+# with the results of each stage
+def runPayloadCases(size, myset, keysDir, workDir, repeat):
+    fileName = os.path.join(workDir, "payload.bin")
+    payload = makePayload(size)
+    with open(fileName, "wb") as file:
+        file.write(payload)
+    del payload
+
+    publicKey = PGP()
+    publicKey.addPublicKey(os.path.join(keysDir, "public.pem"))
+    privateKey = PGP()
+    privateKey.addPrivateKey(os.path.join(keysDir, "private.pem"))
+
+    compressor = Compressor("auto")
+    compressed = compressor.compress(fileName)
+    encrypted = publicKey.encrypt(compressed)
+    plain = PlainMessage.fromBytes(encrypted, myset.groupSize)
+    encoded = plain.encode(myset)
+
+    # Each case: the measured function, the arguments that it receives, and the size of its input
+    cases = {
+        "compress":    (compressor.compress, (fileName,), size, "bytes"),
+        "encrypt":     (publicKey.encrypt, (compressed,), len(compressed), "bytes"),
+        "decrypt":     (privateKey.decrypt, (encrypted,), len(encrypted), "bytes"),
+        "fromBytes":   (PlainMessage.fromBytes, (encrypted, myset.groupSize), len(encrypted), "bytes"),
+        "getMessage":  (plain.getMessage, (), len(encrypted), "bytes"),
+        "encode":      (plain.encode, (myset,), len(plain.groups), "groups"),
+        "decode":      (encoded.decode, (myset,), len(plain.groups), "groups")
+    }
+
+    results = {}
+    for name, (function, args, inputSize, unit) in cases.items():
+        seconds, peakMemory, _ = measure(lambda: args, function, repeat)
+        results[name] = { "size": size, "seconds": seconds, "throughput": inputSize / seconds, "unit": unit + "/s", "peakMemory": peakMemory }
+
+    # The whole pipeline: the file is sent to a cover document with just enough spaces, and
+    # received from it
+    pipeline = SendPipeline(compressor, publicKey, myset)
+    spaceCount = pipeline.getMaxSlotCount(fileName)
+    outputDir = os.path.join(workDir, "output")
+
+    def setup():
+        shutil.rmtree(outputDir, ignore_errors=True)
+        return (makeBackend(spaceCount),)
+
+    def endToEnd(backend):
+        gdoc = GoogleDoc(backend=backend, requestsPerMinute=10**9)
+        pipeline.send(fileName, gdoc, 0, spaceCount)
+
+        chunks = EncodedMessage.fromGoogleDoc(gdoc).decodeChunks(myset)
+        return Compressor.decompressChunks(privateKey.decryptChunks(chunks), outputDir)
+
+    seconds, peakMemory, counters = measure(setup, endToEnd, repeat)
+    results["endToEnd"] = { "size": size, "seconds": seconds, "throughput": size / seconds, "unit": "bytes/s", "peakMemory": peakMemory,
+                            "requestsSent": counters.get("requestsSent", 0) }
+
+    with open(fileName, "rb") as original, open(os.path.join(outputDir, "payload.bin"), "rb") as output:
+        if original.read() != output.read():
+            print("ERROR: the payload of", size, "bytes does not roundtrip")
+            exit(1)
+
+    return results
+
+# Measures the parse of cover documents of "spaceCount" spaces (before and after a message is
+# written, when every space has its own color), and the building of the requests that write a
+# message to all of them. Returns a dict with the results of each stage
+def runCoverCases(spaceCount, myset, workDir, repeat):
+    plainPath = os.path.join(workDir, "plain.json")
+    with open(plainPath, "w") as file:
+        json.dump(buildDocument("bench", "bench", makeCoverText(spaceCount)), file)
+
+    coloredPath = os.path.join(workDir, "colored.json")
+    writeFragmentedDocument(coloredPath, spaceCount)
+
+    def parse(path):
+        with open(path, "rb") as file:
+            return GoogleDocModule.__dict__["__parseDocumentStream__"](file)
+
+    results = {}
+    for name, path in [("parse", plainPath), ("parseColored", coloredPath)]:
+        seconds, peakMemory, _ = measure(lambda: (path,), parse, repeat)
+        results[name] = { "size": spaceCount, "seconds": seconds, "throughput": spaceCount / seconds, "unit": "slots/s", "peakMemory": peakMemory }
+
+    os.remove(plainPath)
+    os.remove(coloredPath)
+
+    # The requests are built and sent to a backend that does not apply them, so the time spent
+    # emulating the service is not measured
+    generator = np.random.default_rng(spaceCount)
+
+    def setup():
+        gdoc = GoogleDoc(backend=makeBackend(spaceCount), requestsPerMinute=10**9)
+        return gdoc, myset.getElemsAt(generator.integers(0, 1 << myset.groupSize, spaceCount))
+
+    seconds, peakMemory, counters = measure(setup, lambda gdoc, colors: gdoc.commit(colors), repeat)
+    results["commit"] = { "size": spaceCount, "seconds": seconds, "throughput": spaceCount / seconds, "unit": "slots/s", "peakMemory": peakMemory,
+                          "requestsSent": counters.get("requestsSent", 0) }
+
+    return results
+
+# Returns the lines that describe the regressions of the results against a baseline
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+
+        reference = baseline[key]
+        if result["throughput"] < reference["throughput"] * (1 - tolerance):
+            regressions.append("REGRESSION: %s throughput %.4g %s (baseline %.4g, %+.1f%%)" % (key, result["throughput"], result["unit"],
+                               reference["throughput"], 100 * (result["throughput"] / reference["throughput"] - 1)))
+
+        if result["peakMemory"] > reference["peakMemory"] * (1 + tolerance) + MEMORY_SLACK:
+            regressions.append("REGRESSION: %s peak memory %.1f MB (baseline %.1f MB)" % (key, result["peakMemory"] / 2**20,
+                               reference["peakMemory"] / 2**20))
+
+    return regressions
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Benchmark of every stage of the tool and of the whole pipeline, compared against a baseline")
+    argParser.add_argument("--full", action="store_true", help="Measure payloads up to 100 MB and documents up to 10^7 spaces")
+    argParser.add_argument("--payloads", type=int, nargs="+", help="Sizes of the payloads, in bytes")
+    argParser.add_argument("--spaces", type=int, nargs="+", help="Number of spaces of the cover documents")
+    argParser.add_argument("--repeat", type=int, default=3, help="Runs of each measure (the best one is kept)")
+    argParser.add_argument("--output", help="JSON file where the results are written")
+    argParser.add_argument("--baseline", help="JSON file with the results to compare against (by default, benchmarks/baseline.json if it exists)")
+    argParser.add_argument("--save-baseline", metavar="FILE", help="Write the results as a new baseline instead of comparing them")
+    argParser.add_argument("--tolerance", type=float, default=0.25, help="Fraction of throughput lost or memory gained that is reported as a regression")
+    args = argParser.parse_args()
+
+    payloads = args.payloads or (FULL_PAYLOADS if args.full else QUICK_PAYLOADS)
+    spaces = args.spaces or (FULL_SPACES if args.full else QUICK_SPACES)
+    baselineFile = args.baseline or (DEFAULT_BASELINE if os.path.isfile(DEFAULT_BASELINE) else None)
+
+    myset = Set(24, "bench")
+    results = {}
+
+    workDir = tempfile.mkdtemp()
+    try:
+        # The size of the RSA key must match the one used by PGP
+        publicKey, privateKey = rsa.newkeys(1024)
+        with open(os.path.join(workDir, "public.pem"), "wb") as file:
+            file.write(publicKey.save_pkcs1())
+        with open(os.path.join(workDir, "private.pem"), "wb") as file:
+            file.write(privateKey.save_pkcs1())
+
+        print("%-14s %12s %11s %14s %-9s %12s" % ("case", "size", "time", "throughput", "unit", "peak MB"))
+
+        runs = [(size, lambda size: runPayloadCases(size, myset, workDir, workDir, args.repeat)) for size in payloads]
+        runs += [(spaceCount, lambda spaceCount: runCoverCases(spaceCount, myset, workDir, args.repeat)) for spaceCount in spaces]
+
+        for size, run in runs:
+            for name, result in run(size).items():
+                results[name + "/" + str(size)] = result
+                print("%-14s %12d %10.4fs %14.4g %-9s %12.1f" % (name, size, result["seconds"], result["throughput"], result["unit"],
+                                                                 result["peakMemory"] / 2**20))
+    finally:
+        shutil.rmtree(workDir)
+
+    report = {
+        "machine": { "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count() },
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print("Baseline written to", args.save_baseline)
+        exit()
+
+    if baselineFile:
+        with open(baselineFile, "r") as file:
+            baseline = json.load(file)["results"]
+
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(line)
+
+        if regressions:
+            print("ERROR:", len(regressions), "regressions against", baselineFile)
+            exit(1)
+
+        print("No regressions against", baselineFile)
@@ -0,0 +1,69 @@
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+
+from modules.Messages import __packGroups__, __unpackGroups__, __groupDtype__
+from modules.Set import Set, SCRAMBLINGS
+from modules.ShardPool import ShardPool
+
+# Encodes and decodes a message with a single process (like the tool does without "--workers")
+def runSingle(myset, data):
+    start = time.perf_counter()
+    colors = myset.getElemsAt(__packGroups__(np.frombuffer(data, dtype=np.uint8), myset.groupSize))
+    encodeTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = __unpackGroups__(myset.getIndicesOf(colors).astype(__groupDtype__(myset.groupSize)), myset.groupSize, 0)
+    decodeTime = time.perf_counter() - start
+
+    return colors, decoded, encodeTime, decodeTime
+
+def runPool(pool, myset, data):
+    start = time.perf_counter()
+    colors = pool.encode(myset, data)
+    encodeTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = pool.decode(myset, colors)
+    decodeTime = time.perf_counter() - start
+
+    return colors, decoded, encodeTime, decodeTime
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Scaling of the sharded encoding and decoding (--workers) from 1 to N processes")
+    argParser.add_argument("--slots", type=int, default=1 << 22, help="Number of slots of the message")
+    argParser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="Largest number of processes to measure")
+    argParser.add_argument("--group-size", type=int, default=24, help="Bits of each group (24, or 48 with two channels)")
+    argParser.add_argument("--scrambling", choices=SCRAMBLINGS, default="feistel")
+    argParser.add_argument("--repeat", type=int, default=3, help="Runs of each measure (the best one is shown)")
+    args = argParser.parse_args()
+
+    myset = Set(args.group_size, "bench", args.scrambling)
+    data = os.urandom(args.slots * args.group_size // 8)
+
+    print("%d slots (%d bytes), %d-bit groups, %s scrambling, %d CPUs" % (args.slots, len(data), args.group_size, args.scrambling, os.cpu_count() or 1))
+    print("%8s %12s %14s %9s %12s %14s %9s" % ("workers", "encode", "slots/s", "speedup", "decode", "slots/s", "speedup"))
+
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        pool = ShardPool(workers) if workers > 1 else None
+        if pool:
+            # Start the processes before measuring
+            pool.decode(myset, pool.encode(myset, data[:myset.groupSize]))
+
+        best = None
+        for _ in range(args.repeat):
+            colors, decoded, encodeTime, decodeTime = runPool(pool, myset, data) if pool else runSingle(myset, data)
+            if decoded != data:
+                print("ERROR: the message does not roundtrip with", workers, "workers")
+                exit(1)
+            best = (encodeTime, decodeTime) if best is None else (min(best[0], encodeTime), min(best[1], decodeTime))
+
+        if pool:
+            pool.close()
+
+        baseline = baseline or best
+        print("%8d %11.4fs %14.0f %8.2fx %11.4fs %14.0f %8.2fx" % (workers, best[0], args.slots / best[0], baseline[0] / best[0],
+                                                                  best[1], args.slots / best[1], baseline[1] / best[1]))
@@ -10,11 +10,14 @@ python3 main.py s $SCRAMBLING_KEY public.pem secret_service_account.json samples
 #python3 main.py s $SCRAMBLING_KEY public.pem secret_service_account.json samples/image1.jpeg
 #python3 main.py r $SCRAMBLING_KEY private.pem secret_service_account.json destDir
 
+##### CLEAR THE LEFTOVERS OF OLDER MESSAGES #####
+#python3 main.py compact $SCRAMBLING_KEY public.pem secret_service_account.json
+
 ############### PARAMS ###############
 # Params:
-# - direction: <s or r> send or receive
+# - direction: <s, r or compact> send, receive or compact
 # - scramblingKey
 # - rsaKeyFile
 # - credentialsFile
-# - messageFile
+# - messageFile (not used by compact)
 ############### PARAMS ###############
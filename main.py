@@ -1,197 +1,392 @@
 
-import argparse, os, sys
-import zipfile, io
+import argparse, atexit, os, sys
 
 from modules.Set import Set
+from modules.Set import SCRAMBLINGS
+from modules.SetElem import CHANNELS, BITS_PER_CHANNEL, DEFAULT_CHANNELS
+from modules.Header import Header
+from modules.ChecksumTable import ChecksumTable
+from modules.MessageDirectory import MessageDirectory, DEFAULT_ENTRY_COUNT
 from modules.GoogleDoc import GoogleDoc
-from modules.Messages import PlainMessage, EncodedMessage
+from modules.BatchCommitter import MAX_BATCH_BYTES
+from modules.StripedDoc import StripedDoc
 from modules.PGP import PGP
-
-def compress(fileName):
-    buffer = io.BytesIO()
-    zf = zipfile.ZipFile(buffer, "w")
-
-    toCompress = open(fileName, "rb").read()
-    zf.writestr(fileName, toCompress)
-
-    zf.close()
-    buffer.seek(0)
-
-    return buffer.read()
-
-def decompress(buffer, dirName):
-    buffer = io.BytesIO(buffer)
-    zf = zipfile.ZipFile(buffer, "r")
-    zf.extractall(dirName)
+from modules.Compressor import Compressor
+from modules.SendPipeline import SendPipeline
+from modules.ShardPool import ShardPool
+from modules.SlotCache import SlotCache, DEFAULT_CACHE_DIR
+from modules.CommitJournal import CommitJournal
+from modules.Profiler import Profiler, stage
+from modules.Transfer import MessageLayout, readLayout, sendMessage, resumeMessage, receiveMessage, compactMessage
+
+# Creates the backend that stores the document:
+# - "google":        The Google Drive and Google Docs APIs
+# - "local:<dir>":   Documents stored as JSON files inside <dir> (see LocalBackend)
+# - "http://<host>": A server that implements the Google APIs, like the one in FakeServer
+def createBackend(backendName, credentialsFile):
+    if backendName.startswith("local:"):
+        from modules.LocalBackend import LocalBackend
+        return LocalBackend(backendName[len("local:"):])
+
+    from modules.GoogleBackend import GoogleBackend
+
+    if backendName.startswith("http://") or backendName.startswith("https://"):
+        return GoogleBackend(apiEndpoint=backendName)
+
+    return GoogleBackend(credentialsFile)
 
 if __name__ == "__main__":
     ################################# PARAMS #################################
     # Params:
-    # - direction:          <s or r> send or receive
+    # - direction:          <s, r, compact, verify, list or delete> send, receive, compact the
+    #                       document, verify (and repair) the last message sent, or list and delete
+    #                       the messages of the directory of the document
     # - scramblingKey:      The key used to scramble the set
     # - rsaKeyFile:         Public or private RSA keys in PEM format
     # - credentialsFile:    The JSON file with the credentials for the API
-    # - messageFile:        A file that contains the file to send
+    # - messageFile:        A file that contains the file to send (only used by s and r)
     ##########################################################################
 
     argParser  = argparse.ArgumentParser(description="Google Docs stego-tool")
 
-    argParser.add_argument("direction", metavar="<direction>", choices=["s", "r"], help='"s" to send a message. "r" to receive a message')
+    argParser.add_argument("direction", metavar="<direction>", choices=["s", "r", "compact", "verify", "list", "delete"], help='"s" to send a message. "r" to receive a message. "compact" to clear the leftovers of older messages. "verify" to check the checksums of the message, and repair the damaged blocks of the last one sent. "list" to list the messages of the directory of the document. "delete" to remove a message from it')
     argParser.add_argument("scramblingKey", metavar="<scramblingKey>", type=str, help='The "stego key" used to scramble the set used in encoding and decoding')
     argParser.add_argument("rsaKeyFile", metavar="<rsaKeyFile>", help="If sending, the public key of the receiver (to encrypt). If receiving, the private key of the reveiver (to decrypt)")
     argParser.add_argument("credentialsFile", metavar="<credentialsFile>", help="JSON file that contains the login access of the account used")
-    argParser.add_argument("file", metavar="<file>", help="If sending, the input file. If receiving, the folder where the received file will be written")
+    argParser.add_argument("file", metavar="<file>", nargs="?", help="If sending, the input file. If receiving, the folder where the received file will be written")
+    argParser.add_argument("--backend", default="google", help='Where the document is stored: "google" (default), "local:<dir>" or the URL of a server that implements the Google APIs')
+    argParser.add_argument("--cache-dir", default=None, help="Directory where the parsed document is cached between runs (by default ~/.cache/gdoc-stego)")
+    argParser.add_argument("--no-cache", action="store_true", help="Always read the whole document, without using the cache")
+    argParser.add_argument("--upload-workers", type=int, default=4, help="Number of batchUpdate calls sent to the document concurrently")
+    argParser.add_argument("--workers", type=int, default=1, help="Number of processes used to encode and decode the message (useful for messages of millions of slots)")
+    argParser.add_argument("--requests-per-minute", type=int, default=60, help="Quota of batchUpdate calls per minute of the account")
+    argParser.add_argument("--max-batch-bytes", type=int, default=MAX_BATCH_BYTES, help="Maximum size of the body of a batchUpdate call (8 MB by default). The requests are split into as many calls as needed")
+    argParser.add_argument("--channels", default=",".join(DEFAULT_CHANNELS), help='Comma-separated properties of the text used to hide the message when sending, each one carrying 24 bits per slot: "foreground" (default), "background" or "foreground,background". The receiver detects them automatically')
+    argParser.add_argument("--scrambling", choices=SCRAMBLINGS, default="feistel", help='How the set is scrambled with the scramblingKey when sending: "feistel" (default, a keyed permutation) or "rot" (the original shift, readable by older versions). The receiver detects it automatically')
+    argParser.add_argument("--scrambling-table", action="store_true", help="Precompute the Feistel permutation of the key as a table in the cache directory, and memory-map it in the next runs (faster for large messages, but the table reveals the scrambling like the key does)")
+    argParser.add_argument("--codec", default="auto", help='Compression of the file when sending: "auto" (default, chosen by sampling the file), "none", "zlib", "lzma" or "zstd", optionally with a level (like "zstd:10")')
+    argParser.add_argument("--no-checksums", action="store_true", help="When sending, do not write the checksums of the blocks of the message, which allow to verify and repair it (striped messages never have them)")
+    argParser.add_argument("--directory", action="store_true", help="When sending, add the message to the directory of the document (creating it if needed) instead of replacing the message of the document, so it can hold several messages. The ID of the new message is printed")
+    argParser.add_argument("--directory-entries", type=int, default=DEFAULT_ENTRY_COUNT, help="Number of messages that fit in the directory, when it is created (64 by default, each one takes 3 slots)")
+    argParser.add_argument("--message-id", type=int, default=None, help='The ID of the message of the directory to receive, verify or delete (see "list")')
+    argParser.add_argument("--striped", action="store_true", help='Split the message across all the documents of the "docs" folder, instead of using only the first one')
+    argParser.add_argument("--profile", metavar="REPORT", default=None, help="Write a JSON report with the wall time, CPU time and peak memory of each stage, and counters of the work done (slots, requests, bytes, retries...)")
+    argParser.add_argument("--profile-trace", metavar="TRACE", default=None, help="With --profile, also write the stages as a Chrome trace (chrome://tracing or https://ui.perfetto.dev)")
+    argParser.add_argument("--profile-memory", action="store_true", help="With --profile, trace the Python allocations to know the peak memory of each stage (slower)")
+    argParser.add_argument("--resume", action="store_true", help="When sending, resume the last upload to the document that failed, without sending again the batches already confirmed (the file argument is not needed)")
 
     args = argParser.parse_args()
 
     ################################################################################
 
+    # The report is also written if the tool exits because of an error
+    if args.profile:
+        profiler = Profiler(traceMemory=args.profile_memory).start()
+
+        def writeProfile():
+            profiler.stop()
+            profiler.writeReport(args.profile)
+            if args.profile_trace:
+                profiler.writeTrace(args.profile_trace)
+
+        atexit.register(writeProfile)
+
     # Check that the reveiverPublicKeyFile exists
     if not os.path.isfile(args.rsaKeyFile):
         print("ERROR: The rsaKeyFile must exist")
         exit()
 
     # Check that the credentialsFile exists
-    if not os.path.isfile(args.credentialsFile):
+    if args.backend == "google" and not os.path.isfile(args.credentialsFile):
         print("ERROR: The credentialsFile must exist")
         exit()
 
+    # Check the channels
+    channels = args.channels.split(",")
+    if not channels or any(channel not in CHANNELS for channel in channels) or len(set(channels)) != len(channels):
+        print('ERROR: The channels must be a comma-separated list of "' + '", "'.join(CHANNELS) + '", without repetitions')
+        exit()
+
     # Check the input or output file
+    if args.resume and args.direction != "s":
+        print('ERROR: "--resume" can only be used when sending')
+        exit()
+
+    # Check the options of the directory
+    if args.directory and args.direction != "s":
+        print('ERROR: "--directory" can only be used when sending')
+        exit()
+
+    if args.message_id is not None and args.direction not in ["r", "verify", "delete"]:
+        print('ERROR: "--message-id" can only be used when receiving, verifying or deleting')
+        exit()
+
+    if args.direction == "delete" and args.message_id is None:
+        print('ERROR: "--message-id" is required when deleting')
+        exit()
+
+    if args.striped and (args.directory or args.direction in ["list", "delete"] or args.message_id is not None):
+        print('ERROR: Only single documents can hold a directory of messages, so it can not be used with "--striped"')
+        exit()
+
+    if args.direction in ["s", "r"] and not args.file and not args.resume:
+        print("ERROR: The file argument is required when sending or receiving")
+        exit()
+
     if args.direction == "s":
         # The input file must exist
-        if not os.path.isfile(args.file):
+        if not args.resume and not os.path.isfile(args.file):
             print("ERROR: The input file must exist")
             exit()
+        # Check the codec before doing anything
+        compressor = Compressor(args.codec)
     elif args.direction == "r":
         #The output file cannot exist
         if os.path.isfile(args.file):
             print("ERROR: the output directory exists, and it is a file")
             exit()
-        # The output dir cannot exist, because it is created by "zipfile"
+        # The output dir cannot exist, because it is created when the file is written
         if os.path.isdir(args.file):
             print("The output directory already exists. Aborting.")
             exit()
+    elif args.direction in ["compact", "verify", "list", "delete"]:
+        # The rest of the directions do not need any file
+        pass
     else:
         # Should not be reached. Already treated by argparse
-        print('ERROR: The direction should be "s" or "r"')
+        print('ERROR: The direction should be "s", "r", "compact", "verify", "list" or "delete"')
         exit()
 
     ################################################################################
 
-    # Create the set that will be used to convert groups into SetElems
-    print("Generating encoding set...  ", end="")
+    # Read and parse the Google document
+    print("Reading Google document...  ", end="")
     sys.stdout.flush()
 
-    # The group size depends on the length of the encoding set exclusively
-    GROUP_SIZE = 24
-    myset = Set(GROUP_SIZE, args.scramblingKey)
+    # The header (and the table of the striped messages) always use a single channel and the
+    # ROT-N scrambling, so they can be read before knowing the ones of the message
+    headerSet = Set(BITS_PER_CHANNEL, args.scramblingKey)
 
-    print("Done")
+    backend = createBackend(args.backend, args.credentialsFile)
+    cache = None if args.no_cache else SlotCache(args.cache_dir or DEFAULT_CACHE_DIR)
+    with stage("readDocument"):
+        if args.striped:
+            gdoc = StripedDoc(headerSet, backend, uploadWorkers=args.upload_workers, requestsPerMinute=args.requests_per_minute, cache=cache,
+                              maxBatchBytes=args.max_batch_bytes)
+        else:
+            gdoc = GoogleDoc(uploadWorkers=args.upload_workers, requestsPerMinute=args.requests_per_minute, backend=backend, cache=cache,
+                             maxBatchBytes=args.max_batch_bytes)
 
-    # Read and parse the Google document
-    print("Reading Google document...  ", end="")
-    sys.stdout.flush()
+    print("Done")
 
-    gdoc = GoogleDoc(args.credentialsFile)
+    # The journal of the uploads, named after the documents, records their progress. When
+    # resuming, the channels, the scrambling and the position of the message are taken from it
+    scrambling = args.scrambling
+    checksums = not args.no_checksums and not args.striped
+    journal = CommitJournal(gdoc.getDocumentIds(), os.path.join(args.cache_dir or DEFAULT_CACHE_DIR, "journal"))
+    if args.resume:
+        if not journal.load() or journal.meta.get("complete"):
+            print("ERROR: There is no failed upload to resume in the document")
+            exit()
+        channels = journal.meta["channels"]
+        scrambling = journal.meta.get("scrambling", "rot")
+        checksums = journal.meta.get("checksums", False)
+        args.directory = journal.meta.get("directory", False)
+
+    # A document with a directory holds several messages, each one in its own extent of slots,
+    # which starts at "baseSlot" and is read like a document with a single message
+    baseSlot = journal.meta["baseSlot"] if args.resume and args.directory else 0
+    directory = None if args.striped else MessageDirectory.fromDoc(gdoc, headerSet)
+    if directory is None and (args.direction in ["list", "delete"] or args.message_id is not None or (args.resume and args.directory)):
+        print("ERROR: The document does not have a directory of messages")
+        exit()
 
-    print("Done\n")
+    if directory is not None:
+        messages = directory.getMessages()
+        if args.direction in ["r", "verify"] and args.message_id is None:
+            print('ERROR: The document holds several messages. Use "--message-id" to choose one (see "list")')
+            exit()
+        if args.direction == "s" and not args.directory and messages:
+            print('ERROR: The document holds a directory of messages. Use "--directory" to add the message to it, or delete them first')
+            exit()
+        if args.message_id is not None and args.message_id not in messages:
+            print("ERROR: There is no message with ID", args.message_id, "in the document")
+            exit()
+        if args.message_id is not None:
+            baseSlot = messages[args.message_id][0]
 
-    # Choose between "send" and "receive" operations
+    # Find the channels and the scrambling of the message. When sending they are the chosen ones,
+    # and when receiving they are read from the header (see readLayout). The messages of a
+    # directory always have a header. When sending, their extent is allocated once the size of
+    # the message is known
     if args.direction == "s":
-        # Read the file content and encrypt it
-        print("Compressing the file...     ", end="")
-        sys.stdout.flush()
+        header = Header(channels=channels, scrambling=scrambling, checksums=checksums)
+        if args.striped:
+            gdoc.scrambling = scrambling
+    else:
+        if args.striped and args.direction == "verify":
+            print('ERROR: Only the messages of a single document have checksums, so "--striped" can not be verified')
+            exit()
 
-        fileContent = compress(args.file)
+        # The directory itself is not a message (only "compact", "list" and "delete" get here
+        # without choosing one of its messages). A damaged table of checksums can be repaired
+        if directory is None or args.message_id is not None:
+            layout = readLayout(gdoc, headerSet, args.striped, baseSlot, allowDamagedTable=args.direction == "verify")
+        else:
+            layout = MessageLayout(firstSlot=baseSlot)
+        if directory is None and not layout.hasMessage and args.direction in ["r", "verify"]:
+            print("ERROR: The document does not hold any message")
+            exit()
+        channels = layout.channels
+        scrambling = layout.scrambling
 
-        print("Done")
+    # Create the set that will be used to convert groups into SetElems
+    print("Generating encoding set...  ", end="")
+    sys.stdout.flush()
 
+    # The group size depends on the length of the encoding set exclusively, which
+    # depends on the number of channels used by each SetElem
+    GROUP_SIZE = BITS_PER_CHANNEL * len(channels)
+    tableDir = os.path.join(args.cache_dir or DEFAULT_CACHE_DIR, "sets") if args.scrambling_table else None
+    myset = Set(GROUP_SIZE, args.scramblingKey, scrambling, tableDir)
 
-        # Encrypt the message before sending
-        print("Encrypting message...       ", end="")
-        sys.stdout.flush()
+    # The processes are stopped automatically when the tool exits
+    shardPool = ShardPool(args.workers) if args.workers > 1 else None
 
+    print("Done\n")
+
+    # Choose between "send" and "receive" operations
+    if args.direction == "s":
         pgp = PGP()
         pgp.addPublicKey(args.rsaKeyFile)
 
-        ciphertext = pgp.encrypt(fileContent)
-
-        print("Done")
+        # The file is compressed, encrypted, encoded and uploaded chunk by chunk
+        pipeline = SendPipeline(compressor if not args.resume else None, pgp, myset, channels, shardPool, headerSet if checksums else None)
 
+    if args.direction == "s" and args.resume:
+        resumeMessage(gdoc, backend, headerSet, pipeline, header, journal, directory if args.directory else None)
 
-        print("Encoding the message...     ", end="")
-        sys.stdout.flush()
+        # Success
+        print("\nThe message has been successfully uploaded")
 
-        plainMsg = PlainMessage.fromBytes(ciphertext, myset.groupSize)
+    elif args.direction == "s":
+        # A new directory is created with the first message added to it
+        if args.directory and directory is None:
+            directory = MessageDirectory(gdoc.getAvailableSpaceCount(), args.directory_entries)
 
-        # Check if the document is long enough to hold the whole message
-        availableSlotCount = gdoc.getAvailableSpaceCount()
-        neededSlotCount    = plainMsg.calculateEncodedSize()
+        sendMessage(args.file, gdoc, backend, headerSet, pipeline, header, args.striped, args.codec, journal, directory if args.directory else None)
 
-        if availableSlotCount < neededSlotCount:
-            print("ERROR\nThe document does not have the necessary length to fully hold the message to transmit. " + 
-                    "The document has", availableSlotCount, "slots, but", neededSlotCount, "are required")
-            exit()
+        # Success
+        print("\nThe message has been successfully uploaded")
 
-        # Encode the message
-        encoded = plainMsg.encode(myset)
+    elif args.direction == "r":
+        pgp = PGP()
+        pgp.addPrivateKey(args.rsaKeyFile)
 
-        print("Done")
+        outputFile = receiveMessage(gdoc, layout, myset, pgp, args.file, shardPool)
 
+        # Success
+        print("\nThe message has been successfully read into the file ", outputFile)
 
-        # Upload the message to the document
-        print("Uploading the message...    ", end="")
+    elif args.direction == "compact" and directory is not None:
+        # Reset the slots of the free extents of the directory, which hold the leftovers of the
+        # deleted messages
+        print("Compacting the document...  ", end="")
         sys.stdout.flush()
 
-        encoded.sendToDoc(gdoc)
+        with stage("compact"):
+            requestCount = sum(gdoc.compact(extentSlot, extentSlot + slotCount) for extentSlot, slotCount in directory.getFreeExtents())
 
-        print("Done")
+        print("Done (" + str(requestCount) + " ranges reset)")
 
 
         # Success
-        print("\nThe message has been successfully uploaded")
+        print("\nThe document has been successfully compacted")
 
-    elif args.direction == "r":
-        # Create an encoded message by reading the document
-        print("Reading the message...      ", end="")
+    elif args.direction == "compact":
+        compactMessage(gdoc, layout, myset)
+
+        # Success
+        print("\nThe document has been successfully compacted")
+
+    elif args.direction == "verify":
+        # Check the checksum of every block of the message
+        print("Checking the message...     ", end="")
         sys.stdout.flush()
 
-        encoded = EncodedMessage.fromGoogleDoc(gdoc)
+        if layout.header is None or not layout.header.checksums:
+            print("ERROR\nThe message of the document has no checksums")
+            exit()
 
-        print("Done")
+        table = layout.table
+        firstSlot = layout.firstSlot
+        if table:
+            damagedBlocks = table.getDamagedBlocks(gdoc.getColors(channels)[firstSlot:])
+            print("Done (" + str(len(damagedBlocks)) + " of " + str(table.getBlockCount()) + " blocks damaged)")
+        else:
+            print("Done (the table of the checksums is damaged)")
+
+        if table and not damagedBlocks:
+            print("\nThe message is intact")
+            exit()
 
 
-        # Decode the content of the document
-        print("Decoding the message...     ", end="")
+        # Rewrite the damaged blocks with the ciphertext recorded in the journal of the upload
+        print("Repairing the message...    ", end="")
         sys.stdout.flush()
 
-        decoded = encoded.decode(myset)
-        encryptedMessage = decoded.getMessage()
+        if not journal.load() or not journal.meta.get("checksums") or gdoc.getSlotFingerprint() != journal.meta["slotFingerprint"] or \
+           journal.meta.get("baseSlot", 0) != baseSlot:
+            print("ERROR\nThe message can only be repaired by its sender, with the journal of its upload " +
+                  "(which is kept until the next message is sent to the document)")
+            exit()
 
-        print("Done")
+        # The slots of the intact blocks are not checked again. If the table does not match the
+        # one of the upload, every slot is checked
+        messageSlot = journal.meta["firstSlot"] + ChecksumTable.fromMaxSlotCount(journal.meta["maxSlotCount"]).getSize()
+        journal.confirmed = {}
+        if table and messageSlot == firstSlot:
+            intactBlocks = sorted(set(range(table.getBlockCount())) - set(damagedBlocks))
+            journal.confirmed = { gdoc.documentId: table.getSlotRanges(intactBlocks, firstSlot) }
 
+        pipeline = SendPipeline(None, None, myset, channels, shardPool, headerSet)
+        with stage("upload"):
+            messageSlotCount, skippedSlotCount = pipeline.resume(gdoc, journal)
+        journal.finish()
 
-        # Decrypt the message
-        print("Decrypting the message...   ", end="")
-        sys.stdout.flush()
+        print("Done (" + str(messageSlotCount - skippedSlotCount) + " slots rewritten)")
 
-        pgp = PGP()
-        pgp.addPrivateKey(args.rsaKeyFile)
 
-        plainText = pgp.decrypt(encryptedMessage)
+        # Success
+        print("\nThe message has been successfully repaired")
 
-        print("Done")
+    elif args.direction == "list":
+        # The messages are listed in the order of their extents
+        messages = directory.getMessages()
+        freeSlotCount = sum(slotCount for _, slotCount in directory.getFreeExtents())
 
+        print("%10s %12s %12s" % ("ID", "First slot", "Slots"))
+        for messageId, (extentSlot, slotCount) in sorted(messages.items(), key=lambda item: item[1]):
+            print("%10d %12d %12d" % (messageId, extentSlot, slotCount))
 
-        # Write the message to the output file
-        print("Writing the output file...  ", end="")
+        print("\n" + str(len(messages)) + " of " + str(len(directory.entries)) + " entries used, " + str(freeSlotCount) + " of " +
+              str(directory.slotCount) + " slots free")
+
+    elif args.direction == "delete":
+        # Only the entry of the message is cleared. Its slots keep their colors until they are
+        # used by another message (or reset with "compact")
+        print("Deleting the message...     ", end="")
         sys.stdout.flush()
 
-        # os.mkdir(args.file)
-        decompress(plainText, args.file)
+        directory.remove(args.message_id)
+        gdoc.commit(directory.toColors(headerSet))
+
+        # The journal of the message can not be used to repair the next one sent to its slots
+        if journal.load() and journal.meta.get("directory") and journal.meta.get("baseSlot") == baseSlot:
+            journal.discard()
 
         print("Done")
 
 
         # Success
-        print("\nThe message has been successfully read into the file ", args.file)
+        print("\nThe message has been successfully deleted")
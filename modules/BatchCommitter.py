@@ -0,0 +1,192 @@
+import bisect
+import itertools
+import json
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.Profiler import stage, count
+
+# Default quota of write requests of the Google Docs API (per minute and per user)
+DOCS_WRITE_REQUESTS_PER_MINUTE = 60
+
+# Default maximum size of the body of a batchUpdate call (the API rejects the too big ones)
+MAX_BATCH_BYTES = 8*1024*1024
+
+# HTTP status codes that are worth retrying: quota exhausted and server errors
+RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# Limits the rate at which some operation is performed. Each operation takes a token
+# from the bucket, which is refilled at a constant rate up to its capacity
+class TokenBucket:
+    # Attributes:
+    # - rate (float):     Tokens added to the bucket per second
+    # - capacity (float): Maximum number of tokens in the bucket (the allowed burst)
+    # - tokens (float):   Tokens currently in the bucket
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.lastRefill = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Blocks until a token is available, and takes it
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.lastRefill) * self.rate)
+                self.lastRefill = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                waitTime = (1 - self.tokens) / self.rate
+
+            time.sleep(waitTime)
+
+# Groups update requests into batches and sends them concurrently through a bounded
+# pool of workers, respecting the API quota and retrying the failed batches
+# The requests are kept as JSON, and the body of each batch is written by joining them, so
+# the size of the batches is known without serializing them again
+class BatchCommitter:
+    # Attributes:
+    # - sendBatch (function):       Function that receives the body of a batchUpdate, as JSON bytes, and sends it
+    # - maxRequests (int):          Maximum number of requests in a batch
+    # - maxBytes (int):             Maximum size of the serialized requests of a batch
+    # - maxRetries (int):           How many times a batch is retried before giving up
+    # - rateLimiter (TokenBucket):  Limits the number of batches sent per minute. It can be shared by
+    #                               several committers, as the quota applies to the whole account
+    # - retries (int):              Number of retries performed so far
+    # - onBatchSent (function):     If set, it is called (from the worker threads) after each batch is
+    #                               sent, with the tags of its requests and the response of the API
+
+    def __init__(self, sendBatch, workers=4, requestsPerMinute=DOCS_WRITE_REQUESTS_PER_MINUTE,
+                 maxRequests=50000, maxBytes=MAX_BATCH_BYTES, maxRetries=6, rateLimiter=None, onBatchSent=None):
+        self.sendBatch = sendBatch
+        self.onBatchSent = onBatchSent
+        self.maxRequests = maxRequests
+        self.maxBytes = maxBytes
+        self.maxRetries = maxRetries
+        self.rateLimiter = rateLimiter or TokenBucket(requestsPerMinute / 60, requestsPerMinute)
+        self.retries = 0
+        self.retriesLock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+
+        # Do not let the pending batches pile up in memory while the workers are busy
+        self.pendingBatches = threading.BoundedSemaphore(workers * 2)
+
+        self.batch = []
+        self.batchTags = []
+        self.batchBytes = 0
+
+    # Adds a request to the current batch. The batch is sent when it is full
+    # The tag is given back to "onBatchSent" once the request has been sent
+    def add(self, request, tag=None):
+        self.addEncoded([json.dumps(request)], [tag])
+
+    # Adds some requests, already serialized as JSON (see RequestEncoder), to the current batch,
+    # like "add" does. The batches are cut where they reach "maxRequests" or "maxBytes"
+    def addEncoded(self, requests, tags=None):
+        tags = tags if tags is not None else [None] * len(requests)
+
+        # The batch body is serialized as a JSON list, so each request adds a separator too
+        requestEnds = list(itertools.accumulate(len(request) + 2 for request in requests))
+
+        start = 0
+        startBytes = 0
+        while start < len(requests):
+            # Take as many requests as fit in the current batch
+            end = bisect.bisect_right(requestEnds, startBytes + self.maxBytes - self.batchBytes, lo=start)
+            end = min(end, start + self.maxRequests - len(self.batch))
+
+            if end == start:
+                if self.batch:
+                    self.__submitBatch__()
+                    continue
+
+                # A request bigger than a whole batch is sent alone
+                end = start + 1
+
+            self.batch += requests[start:end]
+            self.batchTags += tags[start:end]
+            self.batchBytes += requestEnds[end - 1] - startBytes
+
+            startBytes = requestEnds[end - 1]
+            start = end
+
+    # Sends the last batch and waits until all the batches have been sent
+    # If any batch could not be sent, its error is raised
+    def flush(self):
+        if self.batch:
+            self.__submitBatch__()
+
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.futures = []
+            self.executor.shutdown()
+
+    def __submitBatch__(self):
+        # Time spent waiting for the workers, because the requests are built faster than they are sent
+        with stage("waitForUpload"):
+            self.pendingBatches.acquire()
+
+        # Stop as soon as a batch has failed, instead of sending the rest of the message
+        for future in self.futures:
+            if future.done() and future.exception():
+                self.pendingBatches.release()
+                self.executor.shutdown()
+                raise future.exception()
+
+        body = ('{"requests": [' + ", ".join(self.batch) + "]}").encode()
+        count("batchesSubmitted")
+        count("requestBodyBytes", len(body))
+
+        future = self.executor.submit(self.__sendWithRetries__, body, self.batchTags)
+        future.add_done_callback(lambda future: self.pendingBatches.release())
+        self.futures.append(future)
+
+        self.batch = []
+        self.batchTags = []
+        self.batchBytes = 0
+
+    # Sends a batch, retrying it with exponential backoff and jitter if a retryable error happens
+    def __sendWithRetries__(self, body, tags):
+        attempt = 0
+        while True:
+            self.rateLimiter.acquire()
+
+            try:
+                with stage("batchUpdate"):
+                    response = self.sendBatch(body)
+                count("requestsSent", len(tags))
+                if self.onBatchSent:
+                    self.onBatchSent(tags, response)
+                return response
+            except Exception as error:
+                if attempt >= self.maxRetries or not isRetryable(error):
+                    raise
+
+            # "Full jitter" backoff: wait a random time up to an exponentially growing limit
+            time.sleep(random.uniform(0, min(64, 2 ** attempt)))
+            attempt += 1
+            with self.retriesLock:
+                self.retries += 1
+            count("retries")
+
+# Returns True if the error of an API call is temporary, so the call can be retried
+def isRetryable(error):
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is not None:
+        return int(status) in RETRYABLE_STATUS_CODES
+
+    # Network errors (timeouts, resets...) are also temporary
+    return isinstance(error, (TimeoutError, ConnectionError))
@@ -0,0 +1,129 @@
+import hashlib
+
+import numpy as np
+
+# Number of slots of the message covered by each checksum
+BLOCK_SLOTS = 4096
+
+# Slots of the table before the checksums: the number of checksums reserved, and the number of
+# slots of the message
+INFO_SLOTS = 2
+
+# Splits the slots of a message into blocks of BLOCK_SLOTS slots, and keeps a 24-bit checksum of
+# the colors of each one, so a damaged upload can be found (and repaired) block by block
+# The table goes right after the header, and the message starts after it. Like the header, it
+# always uses a single channel and the set of the header, so it can be read before the message:
+# - The number of checksums reserved, which depends on the maximum size of the message, as the
+#   table is placed before the message is compressed
+# - The number of slots of the message (including its length and padding indicators)
+# - The checksum of each block. The unused ones are 0
+class ChecksumTable:
+    # Attributes:
+    # - reservedCount (int):     Number of checksums that fit in the table
+    # - slotCount (int):         Number of slots of the message
+    # - checksums (list of ints): The checksum of each block of the message
+    # - pending (dict):          The pieces of the blocks being calculated (see "add"), by block
+    # - completed (dict):        The checksums calculated by "add", by block
+
+    def __init__(self, reservedCount, slotCount=0, checksums=None):
+        self.reservedCount = reservedCount
+        self.slotCount = slotCount
+        self.checksums = checksums if checksums is not None else []
+        self.pending = {}
+        self.completed = {}
+
+    # Returns the empty table of a message of up to "maxSlotCount" slots, where "maxSlotCount"
+    # includes the table itself (see getSizeFor)
+    @classmethod
+    def fromMaxSlotCount(cls, maxSlotCount) -> "ChecksumTable":
+        return cls(-(-(maxSlotCount - INFO_SLOTS) // (BLOCK_SLOTS + 1)))
+
+    # Returns the table of the message of a document, written starting at "firstSlot", or None
+    # if it is not a valid table. The "Set" must use a single channel
+    @classmethod
+    def fromDoc(cls, gdoc, Set, firstSlot) -> "ChecksumTable":
+        colors = gdoc.getColors()
+        if len(colors) < firstSlot + INFO_SLOTS:
+            return None
+
+        reservedCount, slotCount = Set.getIndicesOf(colors[firstSlot : firstSlot + INFO_SLOTS]).tolist()
+        if len(colors) < firstSlot + INFO_SLOTS + reservedCount or slotCount > reservedCount * BLOCK_SLOTS:
+            return None
+
+        checksums = Set.getIndicesOf(colors[firstSlot + INFO_SLOTS : firstSlot + INFO_SLOTS + reservedCount]).tolist()
+        return cls(reservedCount, slotCount, checksums[:-(-slotCount // BLOCK_SLOTS)])
+
+    # Returns the number of slots of the table of a message of "messageSlotCount" slots
+    @staticmethod
+    def getSizeFor(messageSlotCount):
+        return INFO_SLOTS + -(-messageSlotCount // BLOCK_SLOTS)
+
+    # Returns the number of slots of the table
+    def getSize(self):
+        return INFO_SLOTS + self.reservedCount
+
+    # Returns the number of blocks of the message
+    def getBlockCount(self):
+        return -(-self.slotCount // BLOCK_SLOTS)
+
+    # Adds the colors of the slots of the message from "slot" (its position in the message), to
+    # calculate the checksums of their blocks. The slots can be given in any order, but each
+    # block is only kept in memory until all its slots are given
+    def add(self, colors, slot):
+        while len(colors):
+            block = slot // BLOCK_SLOTS
+            size = min(len(colors), (block + 1) * BLOCK_SLOTS - slot)
+
+            pieces = self.pending.setdefault(block, [])
+            pieces.append((slot, colors[:size]))
+            if sum(len(piece) for _, piece in pieces) == BLOCK_SLOTS:
+                self.__completeBlock__(block)
+
+            slot += size
+            colors = colors[size:]
+
+    # Calculates the checksums of the last blocks, once all the "slotCount" slots of the message
+    # have been given to "add"
+    def finish(self, slotCount):
+        if slotCount > self.reservedCount * BLOCK_SLOTS:
+            print("ERROR: The message does not fit in the space reserved for its checksums")
+            exit()
+
+        for block in list(self.pending):
+            self.__completeBlock__(block)
+
+        self.slotCount = slotCount
+        self.checksums = [self.completed[block] for block in range(self.getBlockCount())]
+
+    # Returns the (N, 3) array with the colors of the slots of the table. The "Set" must use a
+    # single channel
+    def toColors(self, Set):
+        return Set.getElemsAt([self.reservedCount, self.slotCount] + self.checksums + [0] * (self.reservedCount - len(self.checksums)))
+
+    # Returns the blocks of the message whose checksums do not match the colors of its slots,
+    # given from the first one
+    def getDamagedBlocks(self, colors):
+        damagedBlocks = []
+        for block, checksum in enumerate(self.checksums):
+            start = block * BLOCK_SLOTS
+            end = min(start + BLOCK_SLOTS, self.slotCount)
+
+            if end > len(colors) or __checksum__(colors[start:end]) != checksum:
+                damagedBlocks.append(block)
+
+        return damagedBlocks
+
+    # Returns the [firstSlot, lastSlot] ranges of the slots of some blocks of the message, as
+    # positions of the document. "messageSlot" is the position of the first slot of the message
+    def getSlotRanges(self, blocks, messageSlot):
+        return [[messageSlot + block * BLOCK_SLOTS, messageSlot + min((block + 1) * BLOCK_SLOTS, self.slotCount) - 1] for block in blocks]
+
+    def __completeBlock__(self, block):
+        pieces = sorted(self.pending.pop(block), key=lambda piece: piece[0])
+        self.completed[block] = __checksum__(np.concatenate([piece for _, piece in pieces]))
+
+################################### AUX FUNCTIONS ###################################
+
+# Returns the 24-bit checksum of the colors of some slots
+def __checksum__(colors):
+    return int.from_bytes(hashlib.blake2b(np.ascontiguousarray(colors, dtype=np.uint8).tobytes(), digest_size=3).digest(), "big")
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from modules.SlotCache import DEFAULT_CACHE_DIR
+
+# Default directory of the journals
+DEFAULT_JOURNAL_DIR = os.path.join(DEFAULT_CACHE_DIR, "journal")
+
+# Number of bytes of the journaled ciphertext read at once when resuming
+READ_SIZE = 1 << 20
+
+# Records the progress of an upload, so it can be resumed if it fails:
+# - meta.json:      the parameters of the upload (documents, channels, slots...) and a
+#                   fingerprint of the slots of the documents when it started
+# - ciphertext:     the encrypted message, as it is produced. A new encryption would produce
+#                   different bytes, so the same ones must be used to resume
+# - confirmed.log:  one JSON line per batch confirmed by the API, with its document, the range
+#                   of slots it covers and the revision of the document after it
+# Once the upload is complete, the journal is kept (marked as complete) until the next upload to
+# the same documents, so the blocks of the message damaged later can be repaired (see
+# ChecksumTable). It is removed if the message has no checksums
+class CommitJournal:
+    # Attributes:
+    # - path (str):          Directory of the journal
+    # - meta (dict):         The parameters of the upload (None if there is no journal)
+    # - confirmed (dict):    List of [firstSlot, lastSlot] confirmed ranges of each document
+    # - revisionIds (set):   Revisions of the documents produced by the confirmed batches
+    # - ciphertextFile:      The ciphertext file, while it is being written
+    # - logFile:             The confirmed batches file, while the upload is running
+
+    def __init__(self, documentIds, journalDir=DEFAULT_JOURNAL_DIR):
+        key = hashlib.sha256("\n".join(documentIds).encode()).hexdigest()[:32]
+        self.path = os.path.join(journalDir, key)
+        self.meta = None
+        self.confirmed = {}
+        self.revisionIds = set()
+        self.ciphertextFile = None
+        self.logFile = None
+        self.lock = threading.Lock()
+
+    # Starts a new journal, replacing the one of an older upload
+    def start(self, meta):
+        self.discard()
+        os.makedirs(self.path, exist_ok=True)
+
+        self.meta = meta
+        with open(os.path.join(self.path, "meta.json"), "w") as file:
+            json.dump(meta, file)
+
+        self.ciphertextFile = open(os.path.join(self.path, "ciphertext"), "wb")
+        self.logFile = open(os.path.join(self.path, "confirmed.log"), "a")
+
+    # Loads the journal of the last upload, if its ciphertext was recorded completely. Returns
+    # False if there is none
+    def load(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), "r") as file:
+                self.meta = json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        if not self.meta.get("ciphertextComplete"):
+            return False
+
+        self.confirmed = {}
+        self.revisionIds = set()
+        with open(os.path.join(self.path, "confirmed.log"), "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if the process was killed
+                    continue
+                self.confirmed.setdefault(entry["documentId"], []).append([entry["firstSlot"], entry["lastSlot"]])
+                self.revisionIds.add(entry["revisionId"])
+
+        self.logFile = open(os.path.join(self.path, "confirmed.log"), "a")
+        return True
+
+    # Adds a piece of the ciphertext of the message
+    def writeCiphertext(self, chunk):
+        self.ciphertextFile.write(chunk)
+
+    # Marks the ciphertext as complete. Until then, the upload can not be resumed
+    def closeCiphertext(self):
+        self.ciphertextFile.close()
+        self.ciphertextFile = None
+
+        self.meta["ciphertextComplete"] = True
+        self.__writeMeta__()
+
+    # Marks the upload as complete. The journal is kept if the message has checksums, but it can
+    # not be resumed. Otherwise, it is removed
+    def finish(self):
+        if not self.meta.get("checksums"):
+            self.discard()
+            return
+
+        if self.logFile:
+            self.logFile.close()
+        self.logFile = None
+
+        self.meta["complete"] = True
+        self.__writeMeta__()
+
+    # Yields the journaled ciphertext in pieces
+    def readCiphertext(self):
+        with open(os.path.join(self.path, "ciphertext"), "rb") as file:
+            for chunk in iter(lambda: file.read(READ_SIZE), b""):
+                yield chunk
+
+    # Records that a batch of a document has been confirmed by the API. It can be called
+    # from several threads
+    def confirm(self, documentId, firstSlot, lastSlot, revisionId):
+        line = json.dumps({ "documentId": documentId, "firstSlot": firstSlot, "lastSlot": lastSlot, "revisionId": revisionId })
+
+        with self.lock:
+            self.logFile.write(line + "\n")
+            self.logFile.flush()
+
+    # Returns a bool array, True for the slots of a document covered by confirmed batches
+    def getConfirmedSlots(self, documentId, slotCount):
+        confirmedSlots = np.zeros(slotCount, dtype=bool)
+        for firstSlot, lastSlot in self.confirmed.get(documentId, []):
+            confirmedSlots[firstSlot : lastSlot + 1] = True
+
+        return confirmedSlots
+
+    # Removes the journal, once it is not needed (or to start a new one)
+    def discard(self):
+        for file in [self.ciphertextFile, self.logFile]:
+            if file:
+                file.close()
+        self.ciphertextFile = None
+        self.logFile = None
+
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # Replaces the parameters of the upload atomically
+    def __writeMeta__(self):
+        with open(os.path.join(self.path, "meta.json.tmp"), "w") as file:
+            json.dump(self.meta, file)
+        os.replace(os.path.join(self.path, "meta.json.tmp"), os.path.join(self.path, "meta.json"))
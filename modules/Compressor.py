@@ -0,0 +1,240 @@
+import io
+import itertools
+import lzma
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+# The optional "zstandard" package adds the zstd codec
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Codecs that can be used to compress the file, with the byte that identifies them in the header
+# and their default level. They are sorted from the fastest to the slowest
+CODECS = {
+    "none": (0, None),
+    "zstd": (3, 19),
+    "zlib": (1, 9),
+    "lzma": (2, 6)
+}
+
+# Files compressed with the original tool are ZIP files, which start with this signature
+ZIP_MAGIC = b"PK\x03\x04"
+
+# Number of bytes of the file read at once
+READ_SIZE = 1 << 20
+
+# Upper bound of the growth of a file compressed with any of the codecs when it can not be
+# compressed (1 byte per MAX_GROWTH_RATIO bytes, plus MAX_GROWTH_BYTES for the headers)
+MAX_GROWTH_RATIO = 128
+MAX_GROWTH_BYTES = 1024
+
+# When choosing the codec automatically, only some chunks of the file are compressed. A codec
+# is only used if it saves at least MIN_SAVING of the size of the chunks
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_COUNT = 4
+MIN_SAVING = 0.02
+
+# Compresses the file to send, and adds a compact header to it:
+# - 1 byte:  ID of the codec (see CODECS)
+# - 1 byte:  length of the name of the file, in bytes (N)
+# - N bytes: name of the file (UTF-8, without its directory)
+# - The compressed content
+# Every slot of the document is an API request, so the codec is chosen by the size of its output
+class Compressor:
+    # Attributes:
+    # - codec (str): Name of the codec to use, or "auto" to choose it by sampling the file (in
+    #                that case, it is chosen the first time a file is compressed)
+    # - level (int): Level of the codec (None to use the default one)
+
+    # The codec can be given as "<name>" or "<name>:<level>" (for example, "zstd:10")
+    def __init__(self, codec="auto"):
+        name, _, level = codec.partition(":")
+        if name != "auto" and name not in CODECS:
+            print('ERROR: Unknown codec "' + name + '". The available codecs are auto, ' + ", ".join(CODECS))
+            exit()
+
+        if name == "zstd" and zstandard is None:
+            print('ERROR: The "zstandard" package is needed to use the zstd codec')
+            exit()
+
+        self.codec = name
+        self.level = int(level) if level else None
+
+    # Returns the content of a file, compressed and with the header
+    def compress(self, fileName):
+        return b"".join(self.compressChunks(fileName))
+
+    # Reads and compresses a file piece by piece. Yields the header and then the compressed
+    # content, in pieces of any size, so the whole file is never in memory
+    def compressChunks(self, fileName):
+        if self.codec == "auto":
+            self.codec = chooseCodec(fileName)
+        level = self.level if self.level is not None else CODECS[self.codec][1]
+
+        yield self.__getHeader__(fileName)
+
+        compressor = __newCompressor__(self.codec, level)
+        with open(fileName, "rb") as file:
+            for chunk in iter(lambda: file.read(READ_SIZE), b""):
+                output = compressor.compress(chunk) if compressor else chunk
+                if output:
+                    yield output
+
+        if compressor:
+            yield compressor.flush()
+
+    # Returns an upper bound of the size of a file once compressed, without reading it
+    # When no codec is used, the size is exact
+    def getMaxCompressedSize(self, fileName):
+        size = os.path.getsize(fileName)
+        if self.codec == "none":
+            return len(self.__getHeader__(fileName)) + size
+
+        return len(self.__getHeader__(fileName)) + size + size // MAX_GROWTH_RATIO + MAX_GROWTH_BYTES
+
+    def __getHeader__(self, fileName):
+        name = os.path.basename(fileName).encode()[:255]
+        return bytes([CODECS.get(self.codec, (0,))[0], len(name)]) + name
+
+    # Writes the file contained in a compressed buffer inside the directory "dirName"
+    # Returns the path of the written file
+    @staticmethod
+    def decompress(buffer, dirName):
+        return Compressor.decompressChunks([buffer], dirName)
+
+    # Writes the file contained in a compressed message, given in pieces of any size by an
+    # iterable, inside the directory "dirName". The file is decompressed and written as the
+    # pieces are given. Returns the path of the written file
+    # The file is written inside a temporary directory next to "dirName", which is renamed once
+    # the whole message has been read, so a receive that fails (or exits) leaves nothing behind
+    @staticmethod
+    def decompressChunks(chunks, dirName):
+        dirName = os.path.abspath(dirName)
+        os.makedirs(os.path.dirname(dirName), exist_ok=True)
+        tempDirName = tempfile.mkdtemp(prefix="." + os.path.basename(dirName) + ".", suffix=".partial", dir=os.path.dirname(dirName))
+        try:
+            path = __writeFile__(chunks, tempDirName)
+            os.replace(tempDirName, dirName)
+        except BaseException:
+            shutil.rmtree(tempDirName, ignore_errors=True)
+            raise
+
+        return os.path.join(dirName, os.path.relpath(path, tempDirName))
+
+# Chooses the codec whose output is the smallest for some chunks of a file. If no codec
+# saves enough space (for example, with JPEG images or ZIP files), it is not compressed
+def chooseCodec(fileName):
+    size = os.path.getsize(fileName)
+
+    # Take the chunks from the whole file, as some files have a header very different from the rest
+    with open(fileName, "rb") as file:
+        if size <= SAMPLE_SIZE * SAMPLE_COUNT:
+            sample = file.read()
+        else:
+            step = (size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+            chunks = []
+            for i in range(SAMPLE_COUNT):
+                file.seek(i * step)
+                chunks.append(file.read(SAMPLE_SIZE))
+            sample = b"".join(chunks)
+
+    if not sample:
+        return "none"
+
+    bestCodec = "none"
+    bestSize = len(sample) * (1 - MIN_SAVING)
+    for codec, (_, level) in CODECS.items():
+        if codec == "none" or (codec == "zstd" and zstandard is None):
+            continue
+
+        size = len(__compressWith__(codec, level, sample))
+        if size < bestSize:
+            bestCodec, bestSize = codec, size
+
+    return bestCodec
+
+################################### AUX FUNCTIONS ###################################
+
+# Returns an object that compresses a stream with a codec ("compress" and "flush" methods), or
+# None if the codec does not compress
+def __newCompressor__(codec, level):
+    if codec == "zlib":
+        return zlib.compressobj(level)
+    if codec == "lzma":
+        return lzma.LZMACompressor(preset=level)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compressobj()
+
+    return None
+
+def __compressWith__(codec, level, content):
+    if codec == "zlib":
+        return zlib.compress(content, level)
+    if codec == "lzma":
+        return lzma.compress(content, preset=level)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(content)
+
+    return bytes(content)
+
+# Returns an object that decompresses a stream with a codec ("decompress" method, and "flush"
+# for some codecs), or None if the codec does not compress
+def __newDecompressor__(codec):
+    if codec == "zlib":
+        return zlib.decompressobj()
+    if codec == "lzma":
+        return lzma.LZMADecompressor()
+    if codec == "zstd":
+        if zstandard is None:
+            print('ERROR: The "zstandard" package is needed to read this message')
+            exit()
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    return None
+
+# Writes the file contained in a compressed message inside the directory "dirName", which
+# exists (see Compressor.decompressChunks). Returns the path of the written file
+def __writeFile__(chunks, dirName):
+    chunks = iter(chunks)
+
+    # Read the header (or the signature of a ZIP file)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(ZIP_MAGIC) and (head[:len(ZIP_MAGIC)] == ZIP_MAGIC or len(head) >= 2 + head[1]):
+            break
+
+    # Messages sent with the original tool are ZIP files, which can only be read as a whole
+    # The names of their members are sanitized when they are extracted (like "../x"), so the
+    # path of the first one is the one given by zipfile
+    if head[:len(ZIP_MAGIC)] == ZIP_MAGIC:
+        with zipfile.ZipFile(io.BytesIO(head + b"".join(chunks)), "r") as zf:
+            paths = [zf.extract(member, dirName) for member in zf.infolist()]
+            return paths[0]
+
+    codecs = { codecId: codec for codec, (codecId, _) in CODECS.items() }
+    if len(head) < 2 or len(head) < 2 + head[1] or head[0] not in codecs:
+        print("ERROR: The message has an unknown format")
+        exit()
+
+    codec = codecs[head[0]]
+    nameLength = head[1]
+
+    # Only the name is used, so the file can not be written outside of "dirName"
+    name = os.path.basename(head[2 : 2 + nameLength].decode(errors="replace")) or "message"
+    decompressor = __newDecompressor__(codec)
+
+    path = os.path.join(dirName, name)
+    with open(path, "wb") as file:
+        for chunk in itertools.chain([head[2 + nameLength:]], chunks):
+            file.write(decompressor.decompress(chunk) if decompressor else chunk)
+
+        if hasattr(decompressor, "flush"):
+            file.write(decompressor.flush())
+
+    return path
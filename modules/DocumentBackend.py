@@ -0,0 +1,40 @@
+import io
+import json
+
+# This class represents the service that stores the documents used as the stego-channel
+# It is the interface used by GoogleDoc, so the tool can work with the real Google Drive and
+# Google Docs APIs (GoogleBackend) or with a local copy of the documents (LocalBackend)
+# All the documents and responses follow the format of the Google Docs API
+class DocumentBackend:
+
+    # Returns the ID of the folder named "folderName", or None if it does not exist
+    def findFolder(self, folderName):
+        raise NotImplementedError
+
+    # Returns a list with the "id" and "name" of the documents inside a folder
+    # If "limit" is given, at most that number of documents are returned
+    def listDocuments(self, folderId, limit=None):
+        raise NotImplementedError
+
+    # Returns the document resource of a document. If "fields" is given, only those
+    # fields are requested (using the syntax of the field masks of the Google APIs)
+    def getDocument(self, documentId, fields=None):
+        raise NotImplementedError
+
+    # Returns a binary file-like object with the document resource of a document as JSON, so
+    # it can be parsed while it is being read. By default, the whole resource is read first
+    def getDocumentStream(self, documentId, fields=None):
+        return io.BytesIO(json.dumps(self.getDocument(documentId, fields)).encode())
+
+    # Returns the ID of the current revision of a document
+    def getRevisionId(self, documentId):
+        return self.getDocument(documentId, fields="revisionId").get("revisionId")
+
+    # Applies the requests of a batchUpdate body to a document and returns the response
+    def batchUpdate(self, documentId, body):
+        raise NotImplementedError
+
+    # Like batchUpdate, but the body is given already serialized, as JSON bytes. By default,
+    # it is parsed again and given to batchUpdate
+    def batchUpdateRaw(self, documentId, body):
+        return self.batchUpdate(documentId, json.loads(body))
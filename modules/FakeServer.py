@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import re
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.LocalBackend import LocalBackend
+
+# Local stand-in of the Google Drive and Google Docs APIs, backed by a LocalBackend
+# The "googleapiclient" library can be pointed at it (see GoogleBackend.apiEndpoint), so the
+# whole tool, HTTP calls included, can be run and benchmarked without network access
+# Only the calls used by the tool are implemented:
+# - GET  /drive/v3/files                       (Drive files.list)
+# - GET  /v1/documents/<documentId>            (Docs documents.get)
+# - POST /v1/documents/<documentId>:batchUpdate (Docs documents.batchUpdate)
+class FakeServer(ThreadingHTTPServer):
+    # Attributes:
+    # - backend (LocalBackend): Where the documents are stored
+
+    def __init__(self, backend, port=0, host="127.0.0.1"):
+        super().__init__((host, port), FakeServerHandler)
+        self.backend = backend
+
+    # Returns the URL to use as the API endpoint of the server
+    def getEndpoint(self):
+        return "http://" + self.server_address[0] + ":" + str(self.server_address[1]) + "/"
+
+class FakeServerHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path == "/drive/v3/files":
+            files = self.__listFiles__(query.get("q", [None])[0])
+            if "pageSize" in query:
+                files = files[:int(query["pageSize"][0])]
+            return self.__sendJson__(200, { "files": files })
+
+        match = re.fullmatch(r"/v1/documents/([^/:]+)", url.path)
+        if match and query.get("fields") == ["revisionId"]:
+            # Revision checks are answered without reading the whole document
+            return self.__call__(lambda: { "revisionId": self.server.backend.getRevisionId(urllib.parse.unquote(match.group(1))) })
+        if match:
+            return self.__call__(lambda: self.server.backend.getDocument(urllib.parse.unquote(match.group(1))))
+
+        self.__sendError__(404, "Unknown path " + url.path)
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        match = re.fullmatch(r"/v1/documents/([^/:]+):batchUpdate", urllib.parse.unquote(url.path))
+        if match:
+            return self.__call__(lambda: self.server.backend.batchUpdate(match.group(1), body))
+
+        self.__sendError__(404, "Unknown path " + url.path)
+
+    # Do not print a line for each request
+    def log_message(self, format, *args):
+        pass
+
+    # Lists the folders (without "q") or the documents inside a folder ("q" = "'<folderId>' in parents")
+    def __listFiles__(self, q):
+        backend = self.server.backend
+
+        if q is None:
+            folders = sorted(name for name in os.listdir(backend.rootDir) if os.path.isdir(os.path.join(backend.rootDir, name)))
+            return [{ "id": folder, "name": folder } for folder in folders]
+
+        match = re.fullmatch(r"\s*'([^']*)' in parents\s*", q)
+        if not match or backend.findFolder(match.group(1)) is None:
+            return []
+
+        return backend.listDocuments(match.group(1))
+
+    # Runs a call of the backend and sends its result, or the error it raised
+    def __call__(self, function):
+        try:
+            self.__sendJson__(200, function())
+        except FileNotFoundError as error:
+            self.__sendError__(404, str(error))
+        except (ValueError, KeyError) as error:
+            self.__sendError__(400, str(error))
+
+    def __sendError__(self, code, message):
+        self.__sendJson__(code, { "error": { "code": code, "message": message } })
+
+    def __sendJson__(self, code, value):
+        body = json.dumps(value).encode()
+
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Local stand-in of the Google Drive and Google Docs APIs")
+    argParser.add_argument("rootDir", help="Directory where the documents are stored (one subdirectory per folder)")
+    argParser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    argParser.add_argument("--create-from", metavar="TEXT_FILE", help='Create a document in the "docs" folder with the text of this file before starting')
+    argParser.add_argument("--create-only", action="store_true", help="Create the document and exit, without starting the server")
+    args = argParser.parse_args()
+
+    backend = LocalBackend(args.rootDir)
+
+    if args.create_from:
+        with open(args.create_from, "r") as file:
+            documentId = backend.createDocument("docs", os.path.basename(args.create_from), file.read())
+        print("Created document", documentId)
+
+    if not args.create_only:
+        server = FakeServer(backend, args.port)
+        print("Serving on", server.getEndpoint())
+        server.serve_forever()
@@ -0,0 +1,186 @@
+import gzip
+import json
+import os
+import threading
+import urllib.request
+
+from modules.DocumentBackend import DocumentBackend
+from modules.SlotCache import DEFAULT_CACHE_DIR
+
+SCOPES = ['https://www.googleapis.com/auth/documents','https://www.googleapis.com/auth/drive']
+
+# Timeout (in seconds) of the HTTP connections. Big documents take a long time to be read and updated
+HTTP_TIMEOUT = 300
+
+# Directory where the discovery documents of the APIs are cached
+DISCOVERY_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "discovery")
+
+# URLs of the discovery documents, if they are not bundled with the API client
+DISCOVERY_URLS = [
+    "https://{api}.googleapis.com/$discovery/rest?version={apiVersion}",
+    "https://www.googleapis.com/discovery/v1/apis/{api}/{apiVersion}/rest"
+]
+
+# Service objects of the process, shared by all the backends and threads. They are only used
+# to build the requests, which are then sent with the HTTP connection of each thread
+__services__ = {}
+__servicesLock__ = threading.Lock()
+
+# Stores the documents using the Google Drive and Google Docs APIs
+# The heavy API client libraries are only imported when they are needed
+class GoogleBackend(DocumentBackend):
+    # Attributes:
+    # - credentials (object):    The result of reading a JSON credentials file (None if not used)
+    # - apiEndpoint (str):       If set, the URL of a server that implements the APIs (like the one in
+    #                            "FakeServer") used instead of the Google servers. No authentication is used
+    # - discoveryCacheDir (str): Directory where the discovery documents of the APIs are cached
+    # - threadHttp:              Authorized HTTP connection of each thread. The connections are not
+    #                            thread-safe, so each thread opens (only once) its own
+
+    def __init__(self, credentialsFile=None, apiEndpoint=None, discoveryCacheDir=DISCOVERY_CACHE_DIR):
+        # Parse the credentials file
+        self.credentials = None
+        if credentialsFile and not apiEndpoint:
+            from oauth2client.service_account import ServiceAccountCredentials
+            self.credentials = ServiceAccountCredentials.from_json_keyfile_name(credentialsFile, SCOPES)
+
+        self.apiEndpoint = apiEndpoint
+        self.discoveryCacheDir = discoveryCacheDir
+        self.threadHttp = threading.local()
+
+    # Finds and returns a folder named after tha value of "folderName"
+    def findFolder(self, folderName):
+        service_drive = self.__getService__('drive', 'v3')
+        results = service_drive.files().list(fields="nextPageToken, files(id, name)").execute(http=self.__getHttp__())
+        items = results.get('files', [])
+
+        folders = [elem["id"] for elem in items if elem["name"] == folderName]
+
+        return folders[0] if folders else None
+
+    # Gets all the documents inside a folder (or the first "limit" ones), reading all the pages of results
+    def listDocuments(self, folderId, limit=None):
+        service_drive = self.__getService__('drive', 'v3')
+
+        items = []
+        pageToken = None
+        while limit is None or len(items) < limit:
+            results = service_drive.files().list(
+                pageSize=min(limit - len(items), 1000) if limit else 1000, pageToken=pageToken,
+                fields="nextPageToken, files(id, name)", q="'" + folderId + "' in parents").execute(http=self.__getHttp__())
+
+            items += results.get('files', [])
+            pageToken = results.get('nextPageToken')
+            if not pageToken:
+                break
+
+        return items[:limit]
+
+    # Gets all the contents from a document
+    def getDocument(self, documentId, fields=None):
+        service_docs = self.__getService__('docs', 'v1')
+        return service_docs.documents().get(documentId=documentId, fields=fields).execute(http=self.__getHttp__())
+
+    # Opens the HTTP response with the contents of a document, so it can be parsed while it
+    # is downloaded. The request is built by the API client, but it is sent with urllib,
+    # because the client reads the whole response before returning it
+    def getDocumentStream(self, documentId, fields=None):
+        service_docs = self.__getService__('docs', 'v1')
+        request = service_docs.documents().get(documentId=documentId, fields=fields)
+
+        headers = dict(request.headers)
+        headers["accept-encoding"] = "gzip"
+        if self.credentials:
+            headers["authorization"] = "Bearer " + self.credentials.get_access_token().access_token
+
+        response = urllib.request.urlopen(urllib.request.Request(request.uri, headers=headers), timeout=HTTP_TIMEOUT)
+        if response.headers.get("Content-Encoding") == "gzip":
+            return gzip.GzipFile(fileobj=response)
+
+        return response
+
+    # Pushes changes to a document
+    def batchUpdate(self, documentId, body):
+        service_docs = self.__getService__('docs', 'v1')
+        return service_docs.documents().batchUpdate(documentId=documentId, body=body).execute(http=self.__getHttp__())
+
+    # Pushes changes to a document, with a body already serialized. The request is built by the
+    # API client with an empty body, which is then replaced, so the body is not serialized again
+    def batchUpdateRaw(self, documentId, body):
+        service_docs = self.__getService__('docs', 'v1')
+        request = service_docs.documents().batchUpdate(documentId=documentId, body={})
+        request.body = body
+        request.body_size = len(body)
+        request.headers.pop("content-length", None)
+
+        return request.execute(http=self.__getHttp__())
+
+    # Returns the authorized HTTP connection of the current thread
+    def __getHttp__(self):
+        if not hasattr(self.threadHttp, "http"):
+            import httplib2
+
+            http = httplib2.Http(timeout=HTTP_TIMEOUT)
+            self.threadHttp.http = self.credentials.authorize(http) if self.credentials else http
+
+        return self.threadHttp.http
+
+    # Returns the service object of an API, building it only the first time
+    def __getService__(self, serviceName, version):
+        key = (serviceName, version, self.apiEndpoint)
+
+        with __servicesLock__:
+            if key not in __services__:
+                from googleapiclient.discovery import build_from_document
+
+                clientOptions = None
+                if self.apiEndpoint:
+                    # The endpoint replaces the root URL and the path of the service, so the Drive
+                    # API path is added again (the Docs API has no path of its own)
+                    clientOptions = { "api_endpoint": self.apiEndpoint.rstrip("/") + ("/drive/v3/" if serviceName == "drive" else "/") }
+
+                document = __loadDiscoveryDocument__(serviceName, version, self.discoveryCacheDir)
+                __services__[key] = build_from_document(document, http=self.__getHttp__(), client_options=clientOptions)
+
+        return __services__[key]
+
+################################### AUX FUNCTIONS ###################################
+
+# Returns the discovery document of an API. It is read from the cache, or from the ones bundled
+# with the API client, or downloaded, in this order. Then it is stored in the cache
+def __loadDiscoveryDocument__(serviceName, version, cacheDir):
+    path = os.path.join(cacheDir, serviceName + "." + version + ".json")
+    try:
+        with open(path, "r") as file:
+            return file.read()
+    except OSError:
+        pass
+
+    from googleapiclient import discovery_cache
+
+    document = discovery_cache.get_static_doc(serviceName, version)
+    if document is None:
+        import httplib2
+
+        http = httplib2.Http(timeout=HTTP_TIMEOUT)
+        for url in DISCOVERY_URLS:
+            response, content = http.request(url.format(api=serviceName, apiVersion=version))
+            if response.status == 200:
+                document = content.decode()
+                break
+        else:
+            raise RuntimeError("The discovery document of the API " + serviceName + " " + version + " could not be downloaded")
+
+    # Check that the document is valid before caching it
+    json.loads(document)
+
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        with open(path + ".tmp", "w") as file:
+            file.write(document)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        # The cache is just an optimization
+        pass
+
+    return document
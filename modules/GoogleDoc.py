@@ -1,71 +1,265 @@
 
-from googleapiclient.discovery import build
-from oauth2client.service_account import ServiceAccountCredentials
+import hashlib
+import json
 
-import socket
+import numpy as np
 
-SCOPES = ['https://www.googleapis.com/auth/documents','https://www.googleapis.com/auth/drive']
+from modules.BatchCommitter import BatchCommitter, DOCS_WRITE_REQUESTS_PER_MINUTE, MAX_BATCH_BYTES
+from modules.Profiler import stage, count
+from modules.RequestEncoder import RequestEncoder
+from modules.SlotIndex import SlotIndexBuilder
+from modules.SetElem import CHANNELS, DEFAULT_CHANNELS
+
+# The optional "ijson" package allows to parse the document while it is downloaded
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 DOCUMENTS_BASE_FOLDER_NAME = "docs"
 
+# The only fields of the document needed to find its slots
+DOCUMENT_FIELDS = "revisionId,body/content(paragraph/elements(startIndex,textRun(content,textStyle(foregroundColor,backgroundColor))))"
+
 class GoogleDoc:
     # Attributes:
-    # - credentials (object):    The result of reading a JSON credentials file
-    # - content (list of dicts): List of the colors and startIndexes of all the spaces of the document
-
-    def __init__(self, credentialsFile):
-        # Parse the credentials file
-        self.credentials = ServiceAccountCredentials.from_json_keyfile_name(credentialsFile, SCOPES)
+    # - backend (DocumentBackend): The service that stores the document
+    # - uploadWorkers (int):     Number of batchUpdate calls sent concurrently by "commit"
+    # - requestsPerMinute (int): Quota of batchUpdate calls per minute of the account
+    # - maxBatchBytes (int):     Maximum size of the body of a batchUpdate call
+    # - content (SlotIndex):     The colors, startIndexes and paragraphs of all the spaces of the document
+    # - cache (SlotCache):       Where the content is cached between runs (None to not cache it)
+    # - rateLimiter (TokenBucket): If set, the rate limiter shared with other documents of the same account
+    # - committer (BatchCommitter): Sends the requests of the current commit (None if there is none)
+    # - journal (CommitJournal):  Records the batches confirmed during the current commit (None to not record them)
+    # - confirmedSlots (numpy array): bool array, True for the slots that a resumed commit must not send again
+    # - revisionId (str):        The revision of the document that the content corresponds to
+
+    # If no backend is given, the Google APIs are used with the credentials of the JSON credentials file
+    # If no documentId is given, the document is searched in the "docs" folder
+    def __init__(self, credentialsFile=None, uploadWorkers=4, requestsPerMinute=DOCS_WRITE_REQUESTS_PER_MINUTE, backend=None, cache=None,
+                 documentId=None, rateLimiter=None, maxBatchBytes=MAX_BATCH_BYTES):
+        if backend is None:
+            from modules.GoogleBackend import GoogleBackend
+            backend = GoogleBackend(credentialsFile)
+
+        self.backend = backend
+        self.cache = cache
+
+        self.uploadWorkers = uploadWorkers
+        self.requestsPerMinute = requestsPerMinute
+        self.maxBatchBytes = maxBatchBytes
+        self.rateLimiter = rateLimiter
+        self.committer = None
+        self.journal = None
+        self.confirmedSlots = None
 
         # Dinamycally calculate the ID of the document to use
         # It should be inside a folder called "docs" (DOCUMENTS_BASE_FOLDER_NAME)
         # The folder "docs" should only contain one file. If more than one file exists, the first
         # one listed will be used
-        folderId = __getDocumentsFolderFromDrive__(DOCUMENTS_BASE_FOLDER_NAME, self.credentials)
-        self.documentId = __getDocumentsFromDrive__(folderId, self.credentials)[0]["id"]
+        self.documentId = documentId
+        if self.documentId is None:
+            folderId = self.backend.findFolder(DOCUMENTS_BASE_FOLDER_NAME)
+            self.documentId = self.backend.listDocuments(folderId, limit=1)[0]["id"]
+
+        self.__load__(self.backend.getRevisionId(self.documentId))
+
+    # Reads the document again if it has changed since its content was read (for example, when
+    # the same GoogleDoc is used for several messages). Returns True if it was read again
+    def refresh(self):
+        revisionId = self.backend.getRevisionId(self.documentId)
+        if revisionId is not None and revisionId == self.revisionId:
+            return False
 
-        # Read and parse the document content
-        docContent = __getDocumentContent__(self.documentId, self.credentials)
-        self.content = __parseDocumentContent__(docContent)
+        self.__load__(revisionId)
+        return True
 
     # Returns the number of spaces in the document that can be used to hide information
     def getAvailableSpaceCount(self):
         return len(self.content)
 
-    # Pushes a list of actions to the document in a single API call (one request)
-    def commit(self, setElemList):
-        i = 0
-        updatesRequest = { "requests": [] }
-        for elem in setElemList:
-            if len(updatesRequest["requests"]) >= 50000:
-                __updateDocumentContent__(self.documentId, updatesRequest, self.credentials)
-                updatesRequest["requests"] = []
-
-            updatesRequest["requests"].append(
+    # Returns the IDs of the documents used (just this one)
+    def getDocumentIds(self):
+        return [self.documentId]
+
+    # Returns a hash of the positions of the slots, which only change if the text of the document changes
+    def getSlotFingerprint(self):
+        return hashlib.sha256(np.ascontiguousarray(self.content.startIndices, dtype=np.int64).tobytes()).hexdigest()
+
+    # Returns an (N, 3) array with the colors of all the slots of the document
+    # If more than one channel is given, each row has the colors of all of them: (N, 3 * channelCount)
+    def getColors(self, channels=DEFAULT_CHANNELS):
+        if len(channels) == 1:
+            return self.__getChannelColors__(channels[0])
+
+        return np.hstack([self.__getChannelColors__(channel) for channel in channels])
+
+    # Returns a bool array, True for each slot that still has the default colors (no message
+    # has been written to it, or it has been reset by "compact")
+    def getDefaults(self):
+        return self.content.defaults
+
+    # Pushes a list of actions to the document, grouped in as few API calls as possible
+    # The actions are given as an (N, 3 * channelCount) array with the RGB colors of the SetElems
+    # in each channel, and they are written to the slots starting at "firstSlot"
+    # Slots that already have the colors to write are skipped. Returns the number of
+    # skipped slots
+    def commit(self, colors, channels=DEFAULT_CHANNELS, firstSlot=0):
+        self.beginCommit()
+        skippedSlotCount = self.commitChunk(colors, channels, firstSlot)
+        self.endCommit()
+
+        return skippedSlotCount
+
+    # Starts a commit made of several chunks of actions (see commitChunk), so the first chunks
+    # are uploaded while the next ones are prepared. "maxSlotCount" is the maximum number of
+    # slots that will be written (not needed by a single document)
+    # If a journal is given, the batches confirmed by the API are recorded in it, and the slots
+    # confirmed by an earlier run with the same journal are not sent again
+    def beginCommit(self, maxSlotCount=None, journal=None):
+        self.__beginContentUpdate__()
+        self.journal = journal
+        self.confirmedSlots = journal.getConfirmedSlots(self.documentId, len(self.content)) if journal else None
+        self.committer = self.__newCommitter__()
+
+    # Adds a chunk of actions to the current commit, like "commit" does. The requests are sent
+    # in the background, and it only blocks when too many of them are pending. Returns the
+    # number of skipped slots
+    def commitChunk(self, colors, channels=DEFAULT_CHANNELS, firstSlot=0):
+        with stage("buildRequests"):
+            return self.__commitChunk__(colors, channels, firstSlot)
+
+    def __commitChunk__(self, colors, channels, firstSlot):
+        slots = slice(firstSlot, firstSlot + len(colors))
+
+        # If a slot already holds its colors, there is no need to update it
+        currentColors = np.hstack([self.__getChannelColors__(channel)[slots] for channel in channels])
+        changed = np.flatnonzero(np.any(currentColors != colors, axis=1))
+        if self.confirmedSlots is not None:
+            changed = changed[~self.confirmedSlots[changed + firstSlot]]
+
+        # The requests are written as JSON from the arrays, instead of building a dict for each of them
+        requests = RequestEncoder(channels).encode(self.content.startIndices[slots][changed], colors[changed])
+        self.committer.addEncoded(requests, (changed + firstSlot).tolist())
+
+        # Keep the parsed content in sync with the document
+        for i, channel in enumerate(channels):
+            self.__getChannelColors__(channel)[changed + firstSlot] = colors[changed, 3*i : 3*i + 3]
+        self.content.defaults[changed + firstSlot] = False
+
+        count("requestsBuilt", len(changed))
+        return len(colors) - len(changed)
+
+    # Waits until all the chunks added to the current commit have been uploaded, so the next
+    # chunks are written after them
+    def flushCommit(self):
+        with stage("waitForUpload"):
+            self.committer.flush()
+        self.committer = self.__newCommitter__()
+
+    # Uploads the rest of the chunks of the current commit, and waits until all of them are done
+    def endCommit(self):
+        with stage("waitForUpload"):
+            self.committer.flush()
+        self.committer = None
+        self.journal = None
+        self.confirmedSlots = None
+        self.__endContentUpdate__()
+
+    # Resets to the default color all the slots from "firstSlot" to the end of the document (or
+    # to "endSlot", excluded), so the leftovers of older messages do not keep the text split in
+    # lots of small text runs
+    # The slots of each paragraph are reset with a single request, which also resets the text between
+    # them, unless some of that text has its own colors: then the range is split around it, so the
+    # colors of the cover text are kept. Returns the number of requests sent
+    def compact(self, firstSlot, endSlot=None):
+        slots = np.flatnonzero(~self.content.defaults[firstSlot:endSlot]) + firstSlot
+
+        # Find the first and the last slot of each range to reset. A range ends with the paragraph,
+        # or before a slot that has colored text between it and the previous slot to reset
+        styledGapCounts = np.cumsum(self.content.styledGaps)
+        rangeChanges = np.flatnonzero(np.diff(self.content.paragraphIds[slots]) | np.diff(styledGapCounts[slots])) + 1
+        firstSlots = slots[np.concatenate(([0], rangeChanges))] if len(slots) else slots
+        lastSlots  = slots[np.concatenate((rangeChanges - 1, [-1]))] if len(slots) else slots
+
+        # An empty "textStyle" clears the fields listed in "fields", restoring the default color
+        committer = self.__newCommitter__()
+        for startIndex, lastIndex in zip(self.content.startIndices[firstSlots].tolist(), self.content.startIndices[lastSlots].tolist()):
+            committer.add(
                 {
                     "updateTextStyle": {
                     "range": {
-                      "startIndex": self.content[i]["startIndex"],
-                      "endIndex":   self.content[i]["startIndex"]+1
-                    },
-                    "textStyle": {
-                      "foregroundColor": {
-                        "color": {
-                          "rgbColor": {
-                            "red":   elem.color[0]/255,
-                            "green": elem.color[1]/255,
-                            "blue":  elem.color[2]/255
-                          }
-                        }
-                      }
+                      "startIndex": startIndex,
+                      "endIndex":   lastIndex+1
                     },
-                    "fields": "foregroundColor"
+                    "textStyle": {},
+                    "fields": ",".join(CHANNELS.values())
                     }
                 }
             )
-            i += 1
 
-        retval = __updateDocumentContent__(self.documentId, updatesRequest, self.credentials)
+        count("requestsBuilt", len(firstSlots))
+        with stage("waitForUpload"):
+            committer.flush()
+
+        self.__beginContentUpdate__()
+        self.content.colors[slots] = 0
+        self.content.backgroundColors[slots] = 0
+        self.content.defaults[slots] = True
+        self.__endContentUpdate__()
+
+        return len(firstSlots)
+
+    # Returns the (N, 3) array of the content with the colors of a channel
+    def __getChannelColors__(self, channel):
+        return self.content.backgroundColors if channel == "background" else self.content.colors
+
+    # Must be called before changing the content, so the cached one is not used while it
+    # does not match any revision of the document
+    def __beginContentUpdate__(self):
+        if self.cache:
+            self.cache.invalidate(self.documentId)
+
+    # Must be called after changing the content, to update the cached one in place
+    # with the revision of the document that includes the changes
+    def __endContentUpdate__(self):
+        self.revisionId = self.backend.getRevisionId(self.documentId)
+        if self.cache:
+            self.cache.update(self.documentId, self.revisionId, self.content)
+
+    # Reads the content of a revision of the document
+    def __load__(self, revisionId):
+        # If the document has not changed since its content was cached, there is no need to read it
+        self.revisionId = revisionId
+        with stage("loadCache"):
+            self.content = self.cache.load(self.documentId, revisionId) if self.cache else None
+
+        if self.content is None:
+            # Read and parse the document content
+            with stage("parseDocument"), self.backend.getDocumentStream(self.documentId, DOCUMENT_FIELDS) as stream:
+                self.content = __parseDocumentStream__(stream)
+            count("slotsScanned", len(self.content))
+
+            # The revision was read before the content, so if the document changed in between
+            # the cached content is just read again in the next run
+            if self.cache:
+                self.content = self.cache.store(self.documentId, revisionId, self.content)
+
+    # Returns a BatchCommitter that sends its batches to this document
+    def __newCommitter__(self):
+        return BatchCommitter(
+                lambda body: self.backend.batchUpdateRaw(self.documentId, body),
+                workers=self.uploadWorkers, requestsPerMinute=self.requestsPerMinute, maxBytes=self.maxBatchBytes, rateLimiter=self.rateLimiter,
+                onBatchSent=self.__onBatchSent__ if self.journal else None)
+
+    # Records in the journal the range of slots of a batch confirmed by the API (its requests are
+    # tagged with their slots). The slots in between were skipped because they already had their color
+    def __onBatchSent__(self, slots, response):
+        slots = [slot for slot in slots if slot is not None]
+        if slots:
+            revisionId = response.get("writeControl", {}).get("requiredRevisionId")
+            self.journal.confirm(self.documentId, min(slots), max(slots), revisionId)
 
 
 ################################### AUX FUNCTIONS ###################################
@@ -76,18 +270,18 @@ class GoogleDoc:
 def read_paragraph_element(element):
     text_run = element.get('textRun')
     if not text_run:
-        return ''
+        return '', None
     return text_run.get('content'),text_run.get('textStyle')
 
 # Recurses through a list of Structural Elements to read a document's
 # text where text may be in nested elements
 # Args:
-#    elements: a list of Structural Elements.
+#    elements: a list (or any iterable) of Structural Elements.
 def __parseDocumentContent__(documentContent):
-    output = []
+    builder = SlotIndexBuilder()
 
     # Iterate over each of the "document sections" in the JSON
-    for value in documentContent:
+    for paragraphNumber, value in enumerate(documentContent):
         if not 'paragraph' in value:
             continue
 
@@ -96,79 +290,38 @@ def __parseDocumentContent__(documentContent):
             # Extract the paragraph content and style
             content,style = read_paragraph_element(elem)
 
-            # If the text fragment does not contain a space it can be ignored
-            if " " not in content:
+            # If the text fragment does not contain a space it can be ignored, unless it is colored
+            # (compact must not reset its colors)
+            if " " not in content and not (style and ("foregroundColor" in style or "backgroundColor" in style)):
                 continue
 
-            # Get all the spaces in the text fragment
-            spaceOffsets = [i for i, c in enumerate(content) if c == " "]
-
-            # Calculate the start index of the space
-            startIndex = elem.get("startIndex")
-            
-            # Calculate the color of the space
-            color = []
-            if not style:
-                # When the default color is used, it is not included in the respponse
-                color = [0,0,0]
-            else:
-                # Extract the color from the element
-                rawColor = style.get('foregroundColor').get('color').get('rgbColor')
-                for colorName in ["red", "green", "blue"]:
-                    colorValue = rawColor.get(colorName) if colorName in rawColor else 0
-                    color.append(round(colorValue * 255))
-
-            # For each space, append it to the final list of spaces
-            for spaceOffset in spaceOffsets:
-                spaceIndex = startIndex + spaceOffset
-
-                output.append({
-                    "startIndex": spaceIndex,
-                    "color": color
-                    })
-
-    return output
-
-################################### API FUNCTIONS ###################################
-
-# Finds and returns a folder named after tha value of "folderName"
-def __getDocumentsFolderFromDrive__(folderName, credentials):
-    service_drive = build('drive', 'v3', credentials=credentials)
-    results = service_drive.files().list(fields="nextPageToken, files(id, name)").execute()
-    items = results.get('files', [])
-
-
-    folders = [elem["id"] for elem in items if elem["name"] == folderName]
-
-    return folders[0] if folders else None
-
-# Gets all the documents inside a folder
-def __getDocumentsFromDrive__(folderId, credentials):
-    service_drive = build('drive', 'v3', credentials=credentials)
-    results = service_drive.files().list(
-        pageSize=1, fields="nextPageToken, files(id, name)", q="'" + folderId + "' in parents").execute()
-
-    items = results.get('files', [])
+            color, isDefault = __parseColor__(style, "foregroundColor")
+            backgroundColor, isBackgroundDefault = __parseColor__(style, "backgroundColor")
+            builder.addRun(paragraphNumber, elem.get("startIndex"), content, color, backgroundColor, isDefault and isBackgroundDefault)
 
-    return items if items else None
+    return builder.build()
 
-# Gets all the contents from a document
-def __getDocumentContent__(documentId, credentials):
-    # Change the default socket timeout
-    socket.setdefaulttimeout(300)
+# Reads the slots of a document from a binary stream with its JSON resource
+# If "ijson" is installed, the structural elements are parsed and read one by one while the
+# stream is read, so the document never exists as a whole tree of Python objects.
+# Otherwise, the whole document is parsed first
+def __parseDocumentStream__(stream):
+    if ijson is None:
+        return __parseDocumentContent__(json.load(stream).get('body').get('content'))
 
-    service_docs = build('docs', 'v1', credentials=credentials)
-    document = service_docs.documents().get(documentId=documentId).execute()
+    return __parseDocumentContent__(ijson.items(stream, "body.content.item", use_float=True))
 
-    return document.get('body').get('content')
-        
-# Pushes changes to a document
-def __updateDocumentContent__(documentId, updateRequest, credentials):
-    # Change the default socket timeout
-    socket.setdefaulttimeout(300)
+# Returns the RGB color of a field of a text style, and whether it is the default one
+def __parseColor__(style, field):
+    if not style or field not in style:
+        # When the default color is used, it is not included in the respponse
+        return [0,0,0], True
 
-    service_docs = build('docs', 'v1', credentials=credentials)
-    result = service_docs.documents().batchUpdate(
-            documentId=documentId, body=updateRequest).execute()
+    # Extract the color from the element
+    color = []
+    rawColor = style.get(field).get('color', {}).get('rgbColor', {})
+    for colorName in ["red", "green", "blue"]:
+        colorValue = rawColor.get(colorName) if colorName in rawColor else 0
+        color.append(round(colorValue * 255))
 
-    return result
+    return color, False
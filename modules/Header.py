@@ -0,0 +1,96 @@
+from modules.SetElem import CHANNELS, DEFAULT_CHANNELS
+
+# Bit of the first group of a message that marks it as a header instead of a length indicator
+# A length indicator never has it set: a Google Document cannot hold 2^23 spaces. A slot that
+# still has the default color is neither of them, even if its color decodes to a group with
+# this bit set, so it is checked before decoding it (see fromDoc)
+HEADER_FLAG = 1 << 23
+
+# Layout of the header group (24 bits, so it is always written using only the foreground channel):
+# - Bits 0-7:  number of stripes
+# - Bits 8-11: mask of the channels used by the message (bit N is the Nth channel of CHANNELS)
+#              A mask of 0 means the default channels
+# - Bit 12:    set if the set of the message is scrambled with the Feistel permutation instead
+#              of the ROT-N shift (the header itself always uses the ROT-N shift)
+# - Bit 13:    set if the header is followed by the checksums of the blocks of the message (see
+#              ChecksumTable)
+# - Bit 14:    set if the document holds several messages, listed by the directory that follows
+#              the header (see MessageDirectory). The rest of the bits are not used then
+# - Bits 15-22: unused, always 0
+# - Bit 23:    HEADER_FLAG
+STRIPE_COUNT_MASK = 0xFF
+CHANNELS_SHIFT = 8
+CHANNELS_MASK = 0xF
+FEISTEL_FLAG = 1 << 12
+CHECKSUMS_FLAG = 1 << 13
+DIRECTORY_FLAG = 1 << 14
+KNOWN_BITS = HEADER_FLAG | DIRECTORY_FLAG | CHECKSUMS_FLAG | FEISTEL_FLAG | (CHANNELS_MASK << CHANNELS_SHIFT) | STRIPE_COUNT_MASK
+
+# Represents the header group that is written in the first slot of a document when the
+# message does not use the original layout (just the length indicator followed by the groups)
+# It describes which features were used to write the message, so the receiver can read it
+class Header:
+    # Attributes:
+    # - stripeCount (int): Number of documents the message is split into (0 if it is not striped)
+    # - channels (list):   Names of the channels used to encode the message (see CHANNELS)
+    # - scrambling (str):  How the set of the message is scrambled (see Set.SCRAMBLINGS)
+    # - checksums (bool):  Whether the message has a ChecksumTable
+    # - directory (bool):  Whether the header starts a MessageDirectory instead of a message
+
+    def __init__(self, stripeCount=0, channels=DEFAULT_CHANNELS, scrambling="rot", checksums=False, directory=False):
+        self.stripeCount = stripeCount
+        self.channels = channels
+        self.scrambling = scrambling
+        self.checksums = checksums
+        self.directory = directory
+
+    # Returns whether the message can be written with the original layout, without header
+    def isDefault(self):
+        return self.stripeCount == 0 and self.channels == DEFAULT_CHANNELS and self.scrambling == "rot" and not self.checksums and not self.directory
+
+    # Returns the group that represents the header
+    def toGroup(self):
+        channelMask = sum(1 << i for i, channel in enumerate(CHANNELS) if channel in self.channels)
+        scramblingFlag = FEISTEL_FLAG if self.scrambling == "feistel" else 0
+        checksumsFlag = CHECKSUMS_FLAG if self.checksums else 0
+        directoryFlag = DIRECTORY_FLAG if self.directory else 0
+        return HEADER_FLAG | directoryFlag | checksumsFlag | scramblingFlag | (channelMask << CHANNELS_SHIFT) | self.stripeCount
+
+    # Returns the (1, 3) array with the color of the slot that holds the header. The
+    # "Set" must use a single channel
+    def toColors(self, Set):
+        return Set.getElemsAt([self.toGroup()])
+
+    # Returns the header represented by a group, or None if the group is not a header (for
+    # example, the length indicator of a message with the original layout) or it describes a
+    # message that can not be written
+    @classmethod
+    def fromGroup(cls, group) -> "Header":
+        if not group & HEADER_FLAG or group & ~KNOWN_BITS:
+            return None
+
+        channelMask = (group >> CHANNELS_SHIFT) & CHANNELS_MASK
+        if channelMask >> len(CHANNELS):
+            return None
+
+        # The directory does not describe a message, and the striped messages have no checksums
+        if group & DIRECTORY_FLAG and group & (STRIPE_COUNT_MASK | CHECKSUMS_FLAG | FEISTEL_FLAG):
+            return None
+        if group & STRIPE_COUNT_MASK and group & CHECKSUMS_FLAG:
+            return None
+
+        channels = [channel for i, channel in enumerate(CHANNELS) if channelMask & (1 << i)]
+
+        return cls(stripeCount=group & STRIPE_COUNT_MASK, channels=channels or DEFAULT_CHANNELS,
+                   scrambling="feistel" if group & FEISTEL_FLAG else "rot", checksums=bool(group & CHECKSUMS_FLAG), directory=bool(group & DIRECTORY_FLAG))
+
+    # Returns the header in the first slot of a document (or in "firstSlot", the first slot of
+    # a message of a MessageDirectory), or None if it has no header. The "gdoc" is a GoogleDoc
+    # The "Set" must use a single channel
+    @classmethod
+    def fromDoc(cls, gdoc, Set, firstSlot=0) -> "Header":
+        colors = gdoc.getColors()
+        if len(colors) <= firstSlot or gdoc.getDefaults()[firstSlot]:
+            return None
+
+        return cls.fromGroup(int(Set.getIndicesOf(colors[firstSlot : firstSlot + 1])[0]))
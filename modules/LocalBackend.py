@@ -0,0 +1,241 @@
+import bisect
+import copy
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from modules.DocumentBackend import DocumentBackend
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Stores the documents as JSON files on disk, following the format of the Google Docs API
+# Each folder is a directory inside "rootDir", and each document is a "<documentId>.json" file
+# inside its folder. The "updateTextStyle" requests are applied like the real service does,
+# splitting and merging the text runs of the paragraphs
+class LocalBackend(DocumentBackend):
+    # Attributes:
+    # - rootDir (str): The directory that contains the folders
+
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+        self.lock = threading.Lock()
+
+    def findFolder(self, folderName):
+        return folderName if os.path.isdir(os.path.join(self.rootDir, folderName)) else None
+
+    def listDocuments(self, folderId, limit=None):
+        documents = []
+        for fileName in sorted(os.listdir(os.path.join(self.rootDir, folderId))):
+            if not fileName.endswith(".json"):
+                continue
+
+            document = self.getDocument(fileName[:-len(".json")])
+            documents.append({ "id": document["documentId"], "name": document["title"] })
+
+        return documents[:limit]
+
+    # The field masks are ignored: the whole document is always returned
+    def getDocument(self, documentId, fields=None):
+        with open(self.__findDocumentFile__(documentId), "r") as file:
+            return json.load(file)
+
+    def getDocumentStream(self, documentId, fields=None):
+        return open(self.__findDocumentFile__(documentId), "rb")
+
+    # The revision is written before the body of the document, so if "ijson" is installed
+    # the body is not read
+    def getRevisionId(self, documentId):
+        if ijson is None:
+            return self.getDocument(documentId).get("revisionId")
+
+        with self.getDocumentStream(documentId) as stream:
+            return next(ijson.items(stream, "revisionId"), None)
+
+    def batchUpdate(self, documentId, body):
+        with self.lock:
+            document = self.getDocument(documentId)
+
+            applyRequests(document, body.get("requests", []))
+
+            self.__writeDocument__(document, self.__findDocumentFile__(documentId))
+
+        return {
+            "documentId": documentId,
+            "replies": [{} for request in body.get("requests", [])],
+            "writeControl": { "requiredRevisionId": document["revisionId"] }
+        }
+
+    # Creates a document with some text inside a folder (creating the folder if needed)
+    # Each line of the text is a paragraph. Returns the ID of the new document
+    def createDocument(self, folderName, title, text):
+        os.makedirs(os.path.join(self.rootDir, folderName), exist_ok=True)
+
+        document = buildDocument(uuid.uuid4().hex, title, text)
+        self.__writeDocument__(document, os.path.join(self.rootDir, folderName, document["documentId"] + ".json"))
+
+        return document["documentId"]
+
+    # Returns the path of the file of a document, looking for it in all the folders
+    def __findDocumentFile__(self, documentId):
+        for folderName in sorted(os.listdir(self.rootDir)):
+            path = os.path.join(self.rootDir, folderName, documentId + ".json")
+            if os.path.isfile(path):
+                return path
+
+        raise FileNotFoundError("The document " + documentId + " does not exist")
+
+    # Writes a document to a file atomically, so a reader never finds it half written
+    def __writeDocument__(self, document, path):
+        with open(path + ".tmp", "w") as file:
+            json.dump(document, file)
+
+        os.replace(path + ".tmp", path)
+
+################################### AUX FUNCTIONS ###################################
+
+# Returns a document resource with some text. Each line of the text is a paragraph
+def buildDocument(documentId, title, text):
+    content = [{ "endIndex": 1, "sectionBreak": { "sectionStyle": {} } }]
+
+    index = 1
+    for line in text.splitlines(keepends=True) or ["\n"]:
+        if not line.endswith("\n"):
+            line += "\n"
+
+        element = { "startIndex": index, "endIndex": index + len(line), "textRun": { "content": line, "textStyle": {} } }
+        content.append({ "startIndex": index, "endIndex": index + len(line), "paragraph": { "elements": [element] } })
+
+        index += len(line)
+
+    return { "documentId": documentId, "title": title, "revisionId": "1", "body": { "content": content } }
+
+# Applies the requests of a batchUpdate to a document resource, and updates its revision
+def applyRequests(document, requests):
+    paragraphs = list(__iterParagraphs__(document["body"]["content"]))
+    paragraphStarts = [paragraph["startIndex"] for paragraph in paragraphs]
+
+    # Find the updates that affect each paragraph, keeping their order
+    paragraphUpdates = {}
+    for request in requests:
+        if "updateTextStyle" not in request:
+            raise ValueError("Unsupported request: " + ", ".join(request))
+
+        update = request["updateTextStyle"]
+        startIndex = update["range"]["startIndex"]
+        endIndex   = update["range"]["endIndex"]
+        fields = update["fields"].replace(" ", "").split(",")
+
+        i = max(bisect.bisect_right(paragraphStarts, startIndex) - 1, 0)
+        while i < len(paragraphs) and paragraphs[i]["startIndex"] < endIndex:
+            paragraphUpdates.setdefault(i, []).append(
+                    (max(startIndex, paragraphs[i]["startIndex"]), min(endIndex, paragraphs[i]["endIndex"]),
+                     update.get("textStyle", {}), fields))
+            i += 1
+
+    for i, updates in paragraphUpdates.items():
+        __updateParagraphStyle__(paragraphs[i], updates)
+
+    document["revisionId"] = str(int(document.get("revisionId", "0")) + 1)
+
+# Returns all the paragraphs of a list of structural elements, including the ones inside tables
+def __iterParagraphs__(content):
+    for value in content:
+        if "paragraph" in value:
+            yield value
+        elif "table" in value:
+            for row in value["table"].get("tableRows", []):
+                for cell in row.get("tableCells", []):
+                    yield from __iterParagraphs__(cell.get("content", []))
+
+# Applies some style updates to a paragraph. Each character gets the ID of its style, the updates
+# change those IDs, and then the consecutive characters that share a style are merged into text runs
+def __updateParagraphStyle__(paragraph, updates):
+    elements = paragraph["paragraph"]["elements"]
+    paragraphStart = paragraph["startIndex"]
+
+    styleIds = np.empty(paragraph["endIndex"] - paragraphStart, dtype=np.int64)
+    textParts = []
+    styles = []
+    knownStyles = {}
+
+    # Other elements (images, page breaks...) are kept as they are, using negative IDs
+    otherElements = []
+
+    for element in elements:
+        start = element["startIndex"] - paragraphStart
+        end   = element["endIndex"] - paragraphStart
+
+        if "textRun" not in element:
+            otherElements.append(element)
+            styleIds[start:end] = -len(otherElements)
+            textParts.append("\0" * (end - start))
+            continue
+
+        textParts.append(element["textRun"]["content"])
+        styleIds[start:end] = __getStyleId__(element["textRun"].get("textStyle", {}), styles, knownStyles)
+
+    text = "".join(textParts)
+
+    # Apply the updates in order
+    transformations = {}
+    for startIndex, endIndex, textStyle, fields in updates:
+        updatedIds = styleIds[startIndex - paragraphStart : endIndex - paragraphStart]
+        originalIds = updatedIds.copy()
+        textStyleKey = json.dumps([textStyle, fields], sort_keys=True)
+
+        for styleId in np.unique(originalIds).tolist():
+            if styleId < 0:
+                continue
+
+            if (styleId, textStyleKey) not in transformations:
+                style = __updateStyle__(styles[styleId], textStyle, fields)
+                transformations[(styleId, textStyleKey)] = __getStyleId__(style, styles, knownStyles)
+
+            updatedIds[originalIds == styleId] = transformations[(styleId, textStyleKey)]
+
+    # Build the text runs again
+    boundaries = [0] + (np.flatnonzero(np.diff(styleIds)) + 1).tolist() + [len(text)]
+
+    paragraph["paragraph"]["elements"] = []
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        styleId = int(styleIds[start])
+
+        if styleId < 0:
+            paragraph["paragraph"]["elements"].append(otherElements[-styleId - 1])
+            continue
+
+        paragraph["paragraph"]["elements"].append({
+            "startIndex": paragraphStart + start,
+            "endIndex": paragraphStart + end,
+            "textRun": { "content": text[start:end], "textStyle": copy.deepcopy(styles[styleId]) }
+        })
+
+# Returns the ID of a style, adding it to the list of styles if it is new
+def __getStyleId__(style, styles, knownStyles):
+    key = json.dumps(style, sort_keys=True)
+    if key not in knownStyles:
+        knownStyles[key] = len(styles)
+        styles.append(style)
+
+    return knownStyles[key]
+
+# Returns a copy of "style" where the "fields" are set to their value in "textStyle"
+# The fields that are not in "textStyle" are cleared, so they get their default value
+def __updateStyle__(style, textStyle, fields):
+    if fields == ["*"]:
+        return copy.deepcopy(textStyle)
+
+    style = copy.deepcopy(style)
+    for field in fields:
+        if field in textStyle:
+            style[field] = copy.deepcopy(textStyle[field])
+        else:
+            style.pop(field, None)
+
+    return style
@@ -0,0 +1,75 @@
+import copy
+import io
+import json
+import threading
+import uuid
+
+from modules.DocumentBackend import DocumentBackend
+from modules.LocalBackend import buildDocument, applyRequests
+
+# Keeps the documents in memory, following the format of the Google Docs API, like LocalBackend
+# does on disk. It is meant for benchmarks and experiments, where the documents do not need to
+# outlive the process
+# If "applyUpdates" is False, the batchUpdate requests are accepted but not applied, so the time
+# spent by the tool is not mixed with the time spent emulating the service (the GoogleDoc that
+# sends them still keeps its own content up to date)
+class MemoryBackend(DocumentBackend):
+    # Attributes:
+    # - folders (dict):       The IDs of the documents of each folder, by the name of the folder
+    # - documents (dict):     The document resources, by their ID
+    # - applyUpdates (bool):  Whether the requests of batchUpdate change the documents
+
+    def __init__(self, applyUpdates=True):
+        self.folders = {}
+        self.documents = {}
+        self.applyUpdates = applyUpdates
+        self.lock = threading.Lock()
+
+    def findFolder(self, folderName):
+        return folderName if folderName in self.folders else None
+
+    def listDocuments(self, folderId, limit=None):
+        documents = [{ "id": documentId, "name": self.documents[documentId]["title"] } for documentId in self.folders[folderId]]
+        return documents[:limit]
+
+    # The field masks are ignored, except for the revision: the whole document is returned
+    def getDocument(self, documentId, fields=None):
+        if fields == "revisionId":
+            return { "revisionId": self.documents[documentId]["revisionId"] }
+
+        return copy.deepcopy(self.documents[documentId])
+
+    # The document is serialized as JSON, like the service sends it
+    def getDocumentStream(self, documentId, fields=None):
+        with self.lock:
+            return io.BytesIO(json.dumps(self.documents[documentId]).encode())
+
+    def batchUpdate(self, documentId, body):
+        with self.lock:
+            document = self.documents[documentId]
+            requests = body.get("requests", [])
+
+            if self.applyUpdates:
+                applyRequests(document, requests)
+            else:
+                document["revisionId"] = str(int(document["revisionId"]) + 1)
+
+        return {
+            "documentId": documentId,
+            "replies": [{} for request in requests],
+            "writeControl": { "requiredRevisionId": document["revisionId"] }
+        }
+
+    # The body is only parsed if its requests are applied
+    def batchUpdateRaw(self, documentId, body):
+        return self.batchUpdate(documentId, json.loads(body) if self.applyUpdates else {})
+
+    # Creates a document with some text inside a folder (creating the folder if needed)
+    # Each line of the text is a paragraph. Returns the ID of the new document
+    def createDocument(self, folderName, title, text):
+        document = buildDocument(uuid.uuid4().hex, title, text)
+
+        self.documents[document["documentId"]] = document
+        self.folders.setdefault(folderName, []).append(document["documentId"])
+
+        return document["documentId"]
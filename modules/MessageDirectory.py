@@ -0,0 +1,118 @@
+from modules.Header import Header
+
+# Slots of each entry of the directory: the ID of the message, its first slot and its number of slots
+ENTRY_SLOTS = 3
+
+# Default number of entries of a new directory
+DEFAULT_ENTRY_COUNT = 64
+
+# Slots of the directory before the entries: its header, the number of entries and the ID of the
+# next message
+INFO_SLOTS = 3
+
+# The directory of a document that holds several messages, each one in its own extent of slots.
+# It goes at the start of the document and, like the header, it always uses a single channel
+# and the set of the header:
+# - A header with the directory flag (see Header)
+# - The number of entries of the directory
+# - The ID that will be given to the next message. The IDs are never given again, even after
+#   their messages are deleted, so an ID always refers to the same message
+# - The entries: the ID of a message, its first slot and its number of slots. The ID of the
+#   unused entries is 0
+# Each message starts with its own header (followed by the table of its checksums, if it has
+# them), so its extent can be read like a document with a single message. The slots not used
+# by the directory or by any message are free, and the new messages are placed in them, so
+# deleting a message only has to clear its entry
+class MessageDirectory:
+    # Attributes:
+    # - slotCount (int):  Number of slots of the document
+    # - entries (list):   The [messageId, firstSlot, slotCount] of each entry (an ID of 0 if it is unused)
+    # - nextId (int):     The ID of the next message added
+
+    def __init__(self, slotCount, entryCount=DEFAULT_ENTRY_COUNT, entries=None, nextId=1):
+        self.slotCount = slotCount
+        self.nextId = nextId
+        self.entries = entries if entries is not None else [[0, 0, 0] for _ in range(entryCount)]
+
+    # Returns the directory of a document, or None if it does not have one. The "Set" must use
+    # a single channel
+    @classmethod
+    def fromDoc(cls, gdoc, Set) -> "MessageDirectory":
+        header = Header.fromDoc(gdoc, Set)
+        if header is None or not header.directory:
+            return None
+
+        colors = gdoc.getColors()
+        if len(colors) < INFO_SLOTS:
+            return None
+
+        entryCount, nextId = Set.getIndicesOf(colors[1:INFO_SLOTS]).tolist()
+        if len(colors) < INFO_SLOTS + ENTRY_SLOTS * entryCount:
+            return None
+
+        groups = Set.getIndicesOf(colors[INFO_SLOTS : INFO_SLOTS + ENTRY_SLOTS * entryCount]).tolist()
+        entries = [groups[i : i + ENTRY_SLOTS] for i in range(0, len(groups), ENTRY_SLOTS)]
+
+        return cls(len(colors), entryCount, entries, nextId)
+
+    # Returns the number of slots of the directory
+    def getSize(self):
+        return INFO_SLOTS + ENTRY_SLOTS * len(self.entries)
+
+    # Returns the [firstSlot, slotCount] extent of each message, by ID
+    def getMessages(self):
+        return { messageId: [firstSlot, slotCount] for messageId, firstSlot, slotCount in self.entries if messageId }
+
+    # Returns the [firstSlot, slotCount] extents of the slots not used by the directory or by any
+    # message, sorted
+    def getFreeExtents(self):
+        extents = []
+        slot = self.getSize()
+        for firstSlot, slotCount in sorted(self.getMessages().values()):
+            if firstSlot > slot:
+                extents.append([slot, firstSlot - slot])
+            slot = max(slot, firstSlot + slotCount)
+
+        if slot < self.slotCount:
+            extents.append([slot, self.slotCount - slot])
+
+        return extents
+
+    # Returns the first slot of the smallest free extent that can hold "slotCount" slots (so the
+    # large extents are kept for large messages), or None if there is none
+    def allocate(self, slotCount):
+        extents = [extent for extent in self.getFreeExtents() if extent[1] >= slotCount]
+        if not extents:
+            return None
+
+        return min(extents, key=lambda extent: extent[1])[0]
+
+    # Returns whether all the entries are used
+    def isFull(self):
+        return all(messageId for messageId, _, _ in self.entries)
+
+    # Adds the entry of a message written in an extent, in the first unused entry. Returns the
+    # ID of the message, or None if the directory is full
+    def add(self, firstSlot, slotCount):
+        if self.isFull():
+            return None
+
+        messageId = self.nextId
+        self.nextId += 1
+        self.entries[[entry[0] for entry in self.entries].index(0)] = [messageId, firstSlot, slotCount]
+
+        return messageId
+
+    # Clears the entry of a message, so its extent is free. Returns False if there is no such message
+    def remove(self, messageId):
+        for i, entry in enumerate(self.entries):
+            if entry[0] == messageId:
+                self.entries[i] = [0, 0, 0]
+                return True
+
+        return False
+
+    # Returns the (N, 3) array with the colors of the slots of the directory. The "Set" must use
+    # a single channel
+    def toColors(self, Set):
+        return Set.getElemsAt([Header(directory=True).toGroup(), len(self.entries), self.nextId] + [group for entry in self.entries for group in entry])
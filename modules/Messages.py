@@ -1,50 +1,52 @@
 
-from modules.SetElem import SetElem
+import math
+
+import numpy as np
+
+from modules.Profiler import count
+from modules.SetElem import DEFAULT_CHANNELS
+
+# Number of slots decoded at once by EncodedMessage.decodeChunks
+DECODE_CHUNK_SLOTS = 1 << 18
 
 # Represents a message that is not encoded to be sent thorugh the stego-channel
 class PlainMessage:
     # Attributes
-    # - groups (list): List of groups of N bits that conform the message.
-    #                  This list must include the lengthIndicator and the paddingIndicator groups
+    # - groups (numpy array): Array of the integer values of the groups of N bits that conform
+    #                         the message. This array must include the lengthIndicator and the
+    #                         paddingIndicator groups
+    # - groupSize (int):      The number of bits of each group
 
-    def __init__(self, groups):
+    def __init__(self, groups, groupSize):
         self.groups = groups
+        self.groupSize = groupSize
 
     # Mimic some kind of "constructor overloading" by using a "factory function" pattern
     @classmethod
     def fromBytes(cls, messageString, groupSize) -> "PlainMessage":
-        # Convert the message into binary
-        bits = "".join([format(byte, "08b") for byte in messageString])
+        data = np.frombuffer(messageString, dtype=np.uint8)
 
         # Calculate how much padding is needed
-        remainderBitNumber = len(bits) % groupSize
+        remainderBitNumber = (data.size * 8) % groupSize
         paddingLength = 0 if remainderBitNumber == 0 else groupSize - remainderBitNumber
 
-        # Add padding to the bits
-        bits += "0" * paddingLength
+        # Pack the bytes (and the zero padding) into the integer values of the groups
+        dataGroups = __packGroups__(data, groupSize)
 
-        # Add padding indicator bits
-        bits += "0" * (groupSize - paddingLength) + "1" * paddingLength
+        # The first group is a "length indicator" (number of groups, including the padding
+        # indicator and excluding the length indicator itself). The last group is the
+        # "padding indicator", with as many 1s at the right as padding bits were added
+        groups = np.empty(len(dataGroups) + 2, dtype=__groupDtype__(groupSize))
+        groups[0]    = len(dataGroups) + 1
+        groups[1:-1] = dataGroups
+        groups[-1]   = (1 << paddingLength) - 1
 
-        # Split the bits into groups of length "groupSize"
-        groups = [(bits[i:i+groupSize]) for i in range(0, len(bits), groupSize)]
+        return cls(groups, groupSize)
 
-        # Prepend a "length indicator" group to the message (number of groups, including
-        # padding indicator and excluding the length indicator itself)
-        lengthIndicator = format(len(groups), "0" + str(groupSize) + "b")
-        groups.insert(0, lengthIndicator)
-        
-        return cls(groups)
-
-    # Convert all the groups into a list of SetElems
-    # The elements are returned inside a EncodedMessage object
+    # Convert all the groups into the colors of the SetElems that represent them
+    # The colors are returned inside a EncodedMessage object
     def encode(self, Set):
-        elems = []
-        for group in self.groups:
-            index = int(group, 2)
-            elems.append(Set.getElemAt(index))
-
-        return EncodedMessage(elems)
+        return EncodedMessage(Set.getElemsAt(self.groups))
 
     # Assemble a bytes-like object from the groups. This function handles all the
     # added extra groups, like the length indicator and the padding indicator
@@ -55,11 +57,11 @@ class PlainMessage:
 
         # The first group encodes how many groups actually contain
         # the message (including the padding indicator group)
-        lengthIndicator = int(self.groups[0], 2)
+        lengthIndicator = int(self.groups[0])
 
         # Check if the document has enough groups as required by
         # the length indicator
-        if len(self.groups) < lengthIndicator:
+        if len(self.groups) <= lengthIndicator:
             print("ERROR\nThe message is supposed to have " + str(lengthIndicator) +
                     " groups, but only " + str(len(self.groups)) + " were found")
             exit()
@@ -67,69 +69,215 @@ class PlainMessage:
         # Calculate how much padding has been added
         # by counting the number of 1s in the padding indicator
         # (the last group of the message)
-        # paddingSize = len([c for i,c in enumerate(self.groups[-1]) if c == "1"])
-        paddingSize = len([c for i,c in enumerate(self.groups[lengthIndicator]) if c == "1"])
+        paddingSize = bin(int(self.groups[lengthIndicator])).count("1")
 
-        # Join all the groups into a string of bits
-        # except the last group, which is a padding indicator
-        # and the first group, which is a length indicator
-        # and remove the padding
-        bits = "".join(self.groups[1:lengthIndicator])
-        bits = bits if paddingSize == 0 else bits[:-paddingSize]
-
-        # Group the bits into bytes
-        byteList = [int(bits[i:i+8], 2) for i in range(0, len(bits), 8)]
-
-        # Returns a bytes-like object for later file write
-        return bytes(byteList)
+        # Unpack all the groups except the last group, which is a padding indicator
+        # and the first group, which is a length indicator, and remove the padding
+        return __unpackGroups__(self.groups[1:lengthIndicator], self.groupSize, paddingSize)
 
     # Calculates how many SetElems are needed to encode this message
     def calculateEncodedSize(self):
         # Same as the formula N = (8xmessageByteSize)/(log2(setLength))
         return len(self.groups)
 
+# Converts a message given in pieces of any size into groups, like PlainMessage.fromBytes does
+# with a whole message, so the message does not need to be in memory at once. The length
+# indicator is not generated, as it is only known at the end (see getLengthIndicator)
+class GroupPacker:
+    # Attributes
+    # - groupSize (int):     The number of bits of each group
+    # - unitSize (int):      Smallest number of bytes that is packed into whole groups
+    # - remainder (bytes):   The bytes given that have not been packed yet (less than unitSize)
+    # - groupCount (int):    Number of groups returned so far
+
+    def __init__(self, groupSize):
+        self.groupSize = groupSize
+        self.unitSize = groupSize // math.gcd(groupSize, 8)
+        self.remainder = b""
+        self.groupCount = 0
+
+    # Adds some bytes of the message, and returns the groups completed with them
+    def pack(self, data):
+        return __packGroups__(np.frombuffer(self.align(data), dtype=np.uint8), self.groupSize)
+
+    # Adds some bytes of the message, and returns the ones that make whole groups, without
+    # packing them (so they can be packed somewhere else, like in a ShardPool)
+    def align(self, data):
+        data = self.remainder + bytes(data)
+        packedSize = len(data) - len(data) % self.unitSize
+        self.remainder = data[packedSize:]
+        self.groupCount += packedSize * 8 // self.groupSize
+
+        return data[:packedSize]
+
+    # Returns the last groups of the message: the ones with the remaining bytes (padded with
+    # zeros), and the padding indicator
+    def finish(self):
+        remainderBitNumber = (len(self.remainder) * 8) % self.groupSize
+        paddingLength = 0 if remainderBitNumber == 0 else self.groupSize - remainderBitNumber
+
+        dataGroups = __packGroups__(np.frombuffer(self.remainder, dtype=np.uint8), self.groupSize)
+        self.remainder = b""
+
+        groups = np.empty(len(dataGroups) + 1, dtype=__groupDtype__(self.groupSize))
+        groups[:-1] = dataGroups
+        groups[-1]  = (1 << paddingLength) - 1
+        self.groupCount += len(groups)
+
+        return groups
+
+    # Returns the length indicator of the message: the number of groups returned (including the
+    # padding indicator). It must be called after "finish"
+    def getLengthIndicator(self):
+        return np.array([self.groupCount], dtype=__groupDtype__(self.groupSize))
+
 # Represents a message that is ready to be sent through the stego-channel
 class EncodedMessage:
     # Attributes
-    # - values (array of SetElem): SORTED array that represents the encoded message
+    # - colors (numpy array): SORTED (N, 3) array with the RGB colors of the SetElems
+    #                         that represent the encoded message. (N, 3 * channelCount) if the
+    #                         SetElems use more than one channel
 
-    def __init__(self, setElemList):
-        self.values = setElemList
+    def __init__(self, colors):
+        self.colors = colors
 
+    # The document can be a GoogleDoc or a StripedDoc. The message is read from the given
+    # channels of the slots starting at "firstSlot"
     @classmethod
-    def fromGoogleDoc(cls, gdoc) -> "EncodedMessage":
-        # If the document does not contain any slot, the message is empty
-        if len(gdoc.content) == 0:
-            return cls([])
+    def fromGoogleDoc(cls, gdoc, channels=DEFAULT_CHANNELS, firstSlot=0) -> "EncodedMessage":
+        # Read the color of each slot in the google document, each one
+        # representing one action that has been applied to the document
+        # The colors are not copied, so only the slots that are decoded are read
+        return cls(np.asarray(gdoc.getColors(channels)[firstSlot:], dtype=np.uint8).reshape(-1, 3 * len(channels)))
 
-        # Convert each slot in the google document into a
-        # SetElem object, each one representing one action that
-        # has been applied to the document
-        elems = []
-        for space in gdoc.content:
-            elems.append(SetElem(space["color"]))
+    # Returns how many slots the message stored in these colors uses, by decoding only its
+    # length indicator (the first slot). Any slot after them belongs to older messages
+    def getMessageSlotCount(self, Set):
+        if len(self.colors) == 0:
+            return 0
 
-        return cls(elems)
+        lengthIndicator = int(Set.getIndicesOf(self.colors[:1])[0])
 
-    # Covnerts each object of the class SetElem into a group of bits
+        return min(lengthIndicator + 1, len(self.colors))
+
+    # Converts the colors of the SetElems into groups of bits
     def decode(self, Set):
-        groups = []
-        # Convert each SetElem into a group
-        for setElem in self.values:
-            # Find the SetElem in the set. The position of the element
-            # in the Set is the decoded message
-            index = Set.getIndexOf(setElem)
+        # The position of each SetElem in the set is the decoded message
+        indices = Set.getIndicesOf(self.colors)
+
+        return PlainMessage(indices.astype(__groupDtype__(Set.groupSize)), Set.groupSize)
 
-            # Convert the index into a group of bits with a fixed
-            # "groupSize" length "adding leeading zeros if necessary)
-            group = format(index, "0" + str(Set.groupSize) + "b")
+    # Decodes the message stored in these colors, like "decode" and PlainMessage.getMessage do,
+    # but only the slots covered by its length indicator, and "chunkSlots" slots at a time
+    # Yields the bytes of the message in pieces, so the whole message is never in memory
+    # If a ShardPool is given, each chunk is decoded by its processes, so the chunks are as many
+    # times bigger as processes it has
+    def decodeChunks(self, Set, chunkSlots=DECODE_CHUNK_SLOTS, shardPool=None):
+        # If there are no groups, the message is empty
+        if len(self.colors) == 0:
+            return
+
+        # The first group encodes how many groups actually contain the message
+        lengthIndicator = int(Set.getIndicesOf(self.colors[:1])[0])
+        if len(self.colors) <= lengthIndicator:
+            print("ERROR\nThe message is supposed to have " + str(lengthIndicator) +
+                    " groups, but only " + str(len(self.colors)) + " were found")
+            exit()
+
+        # The padding indicator (the last group) is needed to decode the last chunk
+        paddingSize = bin(int(Set.getIndicesOf(self.colors[lengthIndicator : lengthIndicator + 1])[0])).count("1")
 
-            groups.append(group)
+        # Every chunk but the last one must be made of whole bytes
+        if shardPool:
+            chunkSlots *= shardPool.workers
+        chunkSlots -= chunkSlots % 8
+        for start in range(1, lengthIndicator, chunkSlots):
+            end = min(start + chunkSlots, lengthIndicator)
+            count("groupsDecoded", end - start)
 
-        return PlainMessage(groups)
+            if shardPool:
+                yield shardPool.decode(Set, self.colors[start:end], paddingSize if end == lengthIndicator else 0)
+                continue
+
+            groups = Set.getIndicesOf(self.colors[start:end]).astype(__groupDtype__(Set.groupSize))
+            yield __unpackGroups__(groups, Set.groupSize, paddingSize if end == lengthIndicator else 0)
 
     # Updates the document by parforming all the actions that represent the
-    # encoded message in the correct order
-    def sendToDoc(self, gdoc):
-        gdoc.commit(self.values)
+    # encoded message in the correct order. Returns the number of slots that
+    # already had the right color, and so were not updated
+    # The message is written to the given channels of the slots starting at "firstSlot"
+    def sendToDoc(self, gdoc, channels=DEFAULT_CHANNELS, firstSlot=0):
+        return gdoc.commit(self.colors, channels, firstSlot)
+
+
+################################### AUX FUNCTIONS ###################################
+
+# Returns the smallest unsigned numpy type able to hold a group of "groupSize" bits
+def __groupDtype__(groupSize):
+    if groupSize <= 32:
+        return np.uint32
+    if groupSize <= 64:
+        return np.uint64
+
+    print("ERROR: groups bigger than 64 bits are not supported")
+    exit()
+
+# Converts an array of bytes into the integer values of the groups of "groupSize" bits
+# that contain them. The last group is padded with zeros at the right if needed
+def __packGroups__(data, groupSize):
+    dtype = __groupDtype__(groupSize)
+    groupCount = -(-(data.size * 8) // groupSize)
+
+    if groupSize % 8 == 0:
+        # Fast path: every group is made of whole bytes, so each byte is just shifted into place
+        bytesPerGroup = groupSize // 8
+        padded = np.zeros(groupCount * bytesPerGroup, dtype=np.uint8)
+        padded[:data.size] = data
+        columns = padded.reshape(groupCount, bytesPerGroup)
+        shift = 8
+    else:
+        # Groups that are not aligned to bytes are assembled bit by bit
+        bits = np.unpackbits(data)
+        columns = np.zeros(groupCount * groupSize, dtype=np.uint8)
+        columns[:bits.size] = bits
+        columns = columns.reshape(groupCount, groupSize)
+        shift = 1
+
+    groups = np.zeros(groupCount, dtype=dtype)
+    for column in range(columns.shape[1]):
+        groups <<= dtype(shift)
+        groups |= columns[:, column]
+
+    return groups
+
+# Converts the integer values of some groups of "groupSize" bits back into bytes,
+# removing the last "paddingSize" bits
+def __unpackGroups__(groups, groupSize, paddingSize):
+    groups = np.asarray(groups, dtype=__groupDtype__(groupSize))
+
+    if groupSize % 8 == 0 and paddingSize % 8 == 0:
+        # Fast path: every group is made of whole bytes, and so is the padding
+        bytesPerGroup = groupSize // 8
+        columns = np.empty((len(groups), bytesPerGroup), dtype=np.uint8)
+        for column in range(bytesPerGroup):
+            columns[:, bytesPerGroup - 1 - column] = (groups >> (8 * column)) & 0xFF
+
+        data = columns.reshape(-1)
+        return data[:len(data) - paddingSize // 8].tobytes()
+
+    # Unpack every bit of every group
+    bits = np.empty((len(groups), groupSize), dtype=np.uint8)
+    for column in range(groupSize):
+        bits[:, groupSize - 1 - column] = (groups >> column) & 1
+
+    bits = bits.reshape(-1)
+    bits = bits[:max(len(bits) - paddingSize, 0)]
+
+    # If the bits do not fill the last byte, its value is the value of the remaining bits
+    # (without shifting them to the left)
+    fullByteBits = len(bits) - len(bits) % 8
+    output = np.packbits(bits[:fullByteBits]).tobytes()
+    if fullByteBits < len(bits):
+        output += bytes([int("".join(str(b) for b in bits[fullByteBits:]), 2)])
 
+    return output
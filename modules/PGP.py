@@ -1,75 +1,343 @@
-
-import rsa
-import os
-import hashlib
-import base64
-
-from Crypto.Cipher import AES
-
-class PGP:
-    def __init__(self):
-        pass
-
-    # Loads a public RSA key from a PEM file for later use
-    def addPublicKey(self, publicKeyFile):
-        with open(publicKeyFile, "r") as file:
-            keydata = file.read()
-
-        self.publicKey = rsa.PublicKey.load_pkcs1(keydata)
-
-    # Loads a private RSA key from a PEM file for later use
-    def addPrivateKey(self, privateKeyFile):
-        with open(privateKeyFile, "r") as file:
-            keydata = file.read()
-
-        self.privateKey = rsa.PrivateKey.load_pkcs1(keydata)
-        
-    # Encrypts a message using the previously loaded RSA public key
-    def encrypt(self, message, mode=AES.MODE_GCM):
-        # Check if a RSA public key has been added
-        if not self.publicKey:
-            print("ERROR: attempting to encrypt without having added a public key first")
-            exit()
-
-        # Create some parameters for AES key generation
-        salt     = os.urandom(16)
-        password = os.urandom(16)
-
-        # Use the Scrypt KDF to get a AES symmetric key from the password
-        aesKey = hashlib.scrypt(password, salt=salt, n=2**14, r=8, p=1, dklen=32)
-
-        # Encrypt the AES key with the RSA public key
-        aesKeyEncrypted = rsa.encrypt(aesKey, self.publicKey)
-
-        # Initialize AES
-        aes = AES.new(aesKey, mode)
-
-        # Encrypt the message with the previously generated AES key
-        cipherText, tag = aes.encrypt_and_digest(message)
-        
-        # Return the encrypted AES text with the encrypted AES key appended
-        return cipherText + aes.nonce + tag + aesKeyEncrypted
-
-    # Decrypts a message using the previously loaded RSA private key
-    def decrypt(self, message, mode=AES.MODE_GCM):
-        # Check if a RSA private key has been added
-        if not self.privateKey:
-            print("ERROR: attempting to decrypt without having added a private key first")
-            exit()
-
-        # Read the encrypted AES key and some other parameters from the back of the message
-        aesKeyEncrypted = message [len(message) - 128          : len(message)]
-        tag             = message [len(message) - (128 + 16)   : len(message) - 128]
-        nonce           = message [len(message) - (128 + 16*2) : len(message) - (128 + 16)]
-        cipherText      = message [0                           : len(message) - (128 + 16*2)]
-
-        # Decrypt the AES key with the RSA private key
-        aesKey = rsa.decrypt(aesKeyEncrypted, self.privateKey)
-
-        # Initialize AES
-        aes = AES.new(aesKey, mode, nonce=nonce)
-
-        # Decrypt the message with the AES key
-        plainText = aes.decrypt_and_verify(cipherText, tag)
-
-        return plainText
+import os
+import hashlib
+import struct
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Messages with the framed format start with this signature. Messages without it use the
+# original format: a single AES-GCM ciphertext, followed by its nonce, its tag and the AES key
+# encrypted with a 1024-bit RSA key
+FRAMED_MAGIC = b"\x89GSE"
+FRAMED_VERSION = 1
+
+# Framed format:
+# - FRAMED_MAGIC, the version (1 byte), the base 2 logarithm of the size of the chunks (1 byte)
+#   and the length of the encrypted AES key (2 bytes)
+# - The random AES key, encrypted with the RSA public key
+# - The chunks of the message, each one encrypted on its own with AES-GCM: nonce, ciphertext
+#   and tag. The index of the chunk and whether it is the last one are authenticated too, so
+#   the chunks can not be reordered, dropped or truncated without being detected
+# Every chunk has CHUNK_SIZE bytes of plaintext, except the last one (which can be empty)
+CHUNK_SIZE = 1 << 20
+NONCE_SIZE = 12
+TAG_SIZE = 16
+HEADER_FORMAT = ">4sBBH"
+
+# The "rsa" and "Crypto" packages are imported only when they are used, because
+# they take a noticeable part of the start-up time of the tool
+class PGP:
+    # Attributes:
+    # - publicKey (rsa.PublicKey):   The key used to encrypt (None if not added)
+    # - privateKey (rsa.PrivateKey): The key used to decrypt (None if not added)
+    # - workers (int):               Number of threads that encrypt or decrypt chunks concurrently
+
+    def __init__(self, workers=None):
+        self.publicKey = None
+        self.privateKey = None
+        self.workers = workers or os.cpu_count() or 1
+
+    # Loads a public RSA key from a PEM file for later use
+    def addPublicKey(self, publicKeyFile):
+        import rsa
+
+        with open(publicKeyFile, "r") as file:
+            keydata = file.read()
+
+        self.publicKey = rsa.PublicKey.load_pkcs1(keydata)
+
+    # Loads a private RSA key from a PEM file for later use
+    def addPrivateKey(self, privateKeyFile):
+        import rsa
+
+        with open(privateKeyFile, "r") as file:
+            keydata = file.read()
+
+        self.privateKey = rsa.PrivateKey.load_pkcs1(keydata)
+
+    # Encrypts a message using the previously loaded RSA public key
+    # By default, the framed format with AES in GCM mode is used. If another AES mode is
+    # given, the message is encrypted with the original format
+    def encrypt(self, message, mode=None):
+        if mode is not None:
+            return self.__encryptLegacy__(message, mode)
+
+        encryptor = self.newEncryptor()
+        chunks = (message[i : i + encryptor.chunkSize] for i in range(0, len(message), encryptor.chunkSize))
+
+        return encryptor.header + b"".join(encryptor.encryptChunks(chunks))
+
+    # Decrypts a message using the previously loaded RSA private key
+    # Both the framed format and the original one are supported
+    def decrypt(self, message, mode=None):
+        if message[:len(FRAMED_MAGIC)] != FRAMED_MAGIC or mode is not None:
+            return self.__decryptLegacy__(message, mode)
+
+        decryptor = self.newDecryptor()
+        return decryptor.update(message) + decryptor.finalize()
+
+    # Decrypts a message given in pieces of any size by an iterable, and yields its plaintext in
+    # pieces as soon as they are verified. Messages with the original format can only be
+    # decrypted as a whole, so all their pieces are read first
+    def decryptChunks(self, chunks):
+        chunks = iter(chunks)
+
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= len(FRAMED_MAGIC):
+                break
+
+        if head[:len(FRAMED_MAGIC)] != FRAMED_MAGIC:
+            yield self.__decryptLegacy__(head + b"".join(chunks), None)
+            return
+
+        decryptor = self.newDecryptor()
+        yield decryptor.update(head)
+        for chunk in chunks:
+            yield decryptor.update(chunk)
+        yield decryptor.finalize()
+
+    # Returns a FrameEncryptor with a new random AES key, encrypted with the public key
+    # The size of the chunks must be a power of 2
+    def newEncryptor(self, chunkSize=CHUNK_SIZE):
+        import rsa
+
+        # Check if a RSA public key has been added
+        if not self.publicKey:
+            print("ERROR: attempting to encrypt without having added a public key first")
+            exit()
+
+        # The key is random, so there is no need to derive it from a password
+        aesKey = os.urandom(32)
+
+        return FrameEncryptor(aesKey, rsa.encrypt(aesKey, self.publicKey), chunkSize, self.workers)
+
+    # Returns a FrameDecryptor that decrypts a framed message as its bytes are given
+    def newDecryptor(self):
+        # Check if a RSA private key has been added
+        if not self.privateKey:
+            print("ERROR: attempting to decrypt without having added a private key first")
+            exit()
+
+        return FrameDecryptor(self.privateKey, self.workers)
+
+    # Returns the size of a message of "size" bytes once encrypted with the framed format
+    # The public key must have been added
+    def getEncryptedSize(self, size, chunkSize=CHUNK_SIZE):
+        keySize = (self.publicKey.n.bit_length() + 7) // 8
+        chunkCount = max(-(-size // chunkSize), 1)
+
+        return struct.calcsize(HEADER_FORMAT) + keySize + size + chunkCount * (NONCE_SIZE + TAG_SIZE)
+
+    # Original format: the message as a single AES ciphertext
+    def __encryptLegacy__(self, message, mode):
+        import rsa
+        from Crypto.Cipher import AES
+
+        # Check if a RSA public key has been added
+        if not self.publicKey:
+            print("ERROR: attempting to encrypt without having added a public key first")
+            exit()
+
+        # Create some parameters for AES key generation
+        salt     = os.urandom(16)
+        password = os.urandom(16)
+
+        # Use the Scrypt KDF to get a AES symmetric key from the password
+        aesKey = hashlib.scrypt(password, salt=salt, n=2**14, r=8, p=1, dklen=32)
+
+        # Encrypt the AES key with the RSA public key
+        aesKeyEncrypted = rsa.encrypt(aesKey, self.publicKey)
+
+        # Initialize AES
+        aes = AES.new(aesKey, mode)
+
+        # Encrypt the message with the previously generated AES key
+        cipherText, tag = aes.encrypt_and_digest(message)
+
+        # Return the encrypted AES text with the encrypted AES key appended
+        return cipherText + aes.nonce + tag + aesKeyEncrypted
+
+    # Original format: the message as a single AES ciphertext
+    def __decryptLegacy__(self, message, mode):
+        import rsa
+        from Crypto.Cipher import AES
+
+        # Check if a RSA private key has been added
+        if not self.privateKey:
+            print("ERROR: attempting to decrypt without having added a private key first")
+            exit()
+
+        # Read the encrypted AES key and some other parameters from the back of the message
+        aesKeyEncrypted = message [len(message) - 128          : len(message)]
+        tag             = message [len(message) - (128 + 16)   : len(message) - 128]
+        nonce           = message [len(message) - (128 + 16*2) : len(message) - (128 + 16)]
+        cipherText      = message [0                           : len(message) - (128 + 16*2)]
+
+        # Decrypt the AES key with the RSA private key
+        aesKey = rsa.decrypt(aesKeyEncrypted, self.privateKey)
+
+        # Initialize AES
+        aes = AES.new(aesKey, AES.MODE_GCM if mode is None else mode, nonce=nonce)
+
+        # Decrypt the message with the AES key
+        plainText = aes.decrypt_and_verify(cipherText, tag)
+
+        return plainText
+
+# Encrypts the chunks of a message with the framed format, using several threads
+# (the AES implementation releases the GIL while it runs)
+class FrameEncryptor:
+    # Attributes:
+    # - aesKey (bytes):    The random key of the message
+    # - header (bytes):    The header of the message, with the encrypted key. It must be sent
+    #                      before the chunks
+    # - chunkSize (int):   Number of bytes of plaintext of every chunk, except the last one
+    # - workers (int):     Number of threads that encrypt chunks concurrently
+
+    def __init__(self, aesKey, aesKeyEncrypted, chunkSize=CHUNK_SIZE, workers=1):
+        self.aesKey = aesKey
+        self.chunkSize = chunkSize
+        self.workers = workers
+        self.header = struct.pack(HEADER_FORMAT, FRAMED_MAGIC, FRAMED_VERSION, chunkSize.bit_length() - 1,
+                len(aesKeyEncrypted)) + aesKeyEncrypted
+
+    # Encrypts the chunks of plaintext given by an iterable, and yields the encrypted chunks in
+    # the same order. All the chunks except the last one must have "chunkSize" bytes. Only a
+    # few chunks are kept in memory at once
+    def encryptChunks(self, chunks):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = []
+            index = 0
+            previous = None
+
+            # The chunk before the current one is submitted, as it is not known whether a
+            # chunk is the last one until the next one is read
+            for chunk in chunks:
+                if previous is not None:
+                    pending.append(executor.submit(self.encryptChunk, index, previous, False))
+                    index += 1
+                previous = chunk
+
+                # Keep a couple of chunks per thread in flight
+                while len(pending) > 2 * self.workers:
+                    yield pending.pop(0).result()
+
+            pending.append(executor.submit(self.encryptChunk, index, previous if previous is not None else b"", True))
+
+            for future in pending:
+                yield future.result()
+
+    # Encrypts a single chunk, given its index and whether it is the last one
+    def encryptChunk(self, index, chunk, isLast):
+        from Crypto.Cipher import AES
+
+        nonce = os.urandom(NONCE_SIZE)
+        aes = AES.new(self.aesKey, AES.MODE_GCM, nonce=nonce)
+        aes.update(__chunkAssociatedData__(index, isLast))
+        cipherText, tag = aes.encrypt_and_digest(chunk)
+
+        return nonce + cipherText + tag
+
+# Decrypts a message with the framed format as its bytes are given, verifying every chunk
+# as soon as it is complete, using several threads
+class FrameDecryptor:
+    # Attributes:
+    # - privateKey (rsa.PrivateKey): The key used to decrypt the AES key
+    # - workers (int):     Number of threads that decrypt chunks concurrently
+    # - buffer (bytearray): Bytes given that have not been decrypted yet
+    # - aesKey (bytes):    The key of the message (None until the header is read)
+    # - frameSize (int):   Number of bytes of every encrypted chunk, except the last one
+    # - index (int):       Index of the next chunk to decrypt
+    # - finished (bool):   Whether the last chunk has been decrypted
+
+    def __init__(self, privateKey, workers=1):
+        self.privateKey = privateKey
+        self.workers = workers
+        self.buffer = bytearray()
+        self.aesKey = None
+        self.frameSize = None
+        self.index = 0
+        self.finished = False
+
+    # Adds some bytes of the message, and returns the plaintext of the chunks completed with them
+    def update(self, data):
+        self.buffer += data
+
+        if self.aesKey is None and not self.__readHeader__():
+            return b""
+
+        # The last complete chunk is kept in the buffer, as it may be the last one of the message
+        chunkCount = max(len(self.buffer) // self.frameSize - (1 if len(self.buffer) % self.frameSize == 0 else 0), 0)
+        if chunkCount == 0:
+            return b""
+
+        frames = [bytes(self.buffer[i * self.frameSize : (i + 1) * self.frameSize]) for i in range(chunkCount)]
+        del self.buffer[:chunkCount * self.frameSize]
+
+        return self.__decryptFrames__(frames, False)
+
+    # Decrypts the last chunk of the message. Returns its plaintext
+    def finalize(self):
+        if self.aesKey is None or not len(self.buffer) or len(self.buffer) > self.frameSize:
+            print("ERROR: the message is incomplete")
+            exit()
+
+        plainText = self.__decryptFrames__([bytes(self.buffer)], True)
+        self.buffer = bytearray()
+        self.finished = True
+
+        return plainText
+
+    # Reads the header and decrypts the AES key, if enough bytes have been given
+    def __readHeader__(self):
+        import rsa
+
+        headerSize = struct.calcsize(HEADER_FORMAT)
+        if len(self.buffer) < headerSize:
+            return False
+
+        magic, version, chunkSizeLog, keySize = struct.unpack(HEADER_FORMAT, self.buffer[:headerSize])
+        if magic != FRAMED_MAGIC or version != FRAMED_VERSION:
+            print("ERROR: the message has an unknown format")
+            exit()
+
+        if len(self.buffer) < headerSize + keySize:
+            return False
+
+        self.aesKey = rsa.decrypt(bytes(self.buffer[headerSize : headerSize + keySize]), self.privateKey)
+        self.frameSize = NONCE_SIZE + (1 << chunkSizeLog) + TAG_SIZE
+        del self.buffer[:headerSize + keySize]
+
+        return True
+
+    # Decrypts some consecutive encrypted chunks in parallel, the last one being the last
+    # chunk of the message if "endsMessage" is set. Returns their joined plaintext
+    def __decryptFrames__(self, frames, endsMessage):
+        indices = range(self.index, self.index + len(frames))
+        lastFlags = [endsMessage and i == len(frames) - 1 for i in range(len(frames))]
+        self.index += len(frames)
+
+        if len(frames) == 1:
+            return self.__decryptFrame__(indices[0], frames[0], lastFlags[0])
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(frames))) as executor:
+            return b"".join(executor.map(self.__decryptFrame__, indices, frames, lastFlags))
+
+    def __decryptFrame__(self, index, frame, isLast):
+        from Crypto.Cipher import AES
+
+        aes = AES.new(self.aesKey, AES.MODE_GCM, nonce=frame[:NONCE_SIZE])
+        aes.update(__chunkAssociatedData__(index, isLast))
+
+        try:
+            return aes.decrypt_and_verify(frame[NONCE_SIZE : -TAG_SIZE], frame[-TAG_SIZE:])
+        except ValueError:
+            print("ERROR: the chunk", index, "of the message has been modified, or it was encrypted with another key")
+            exit()
+
+################################### AUX FUNCTIONS ###################################
+
+# Returns the data authenticated together with a chunk: its index and whether it is the last one
+def __chunkAssociatedData__(index, isLast):
+    return struct.pack(">QB", index, 1 if isLast else 0)
@@ -0,0 +1,189 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager, nullcontext
+
+# The profiler that receives the stages and counters reported by the modules (None if the
+# program is not being profiled). The modules use "stage", "count" and "profiled", which do
+# nothing when there is no active profiler
+ACTIVE = None
+
+# Records the wall time, CPU time and peak memory of the stages of the program, and counters
+# of the work done by them (slots scanned, requests sent...)
+# A stage can run many times (for example, once per chunk of the message), so the report adds
+# up all its runs. Stages can be nested: the time of a stage includes the one of the stages run
+# inside it, and its "self" time does not. The CPU time of a stage is the one of the thread that
+# runs it, so the work of the upload threads is not counted in the stage that starts them
+# The peak memory of a stage is the peak RSS of the process when it finishes, or, if the Python
+# allocations are traced (which makes the program slower), the peak of the memory allocated
+# while it runs
+class Profiler:
+    # Attributes:
+    # - traceMemory (bool):  Trace the Python allocations (with tracemalloc) to know the peak of each stage
+    # - stages (dict):       The totals of each stage, by name
+    # - counters (dict):     The value of each counter, by name
+    # - events (list):       Each run of a stage, as an event of the Chrome trace format
+    # - startTime (float):   When the profiler was started (time.perf_counter)
+    # - totalWallTime (float): Seconds between start and stop (None until it is stopped)
+    # - totalCpuTime (float):  CPU seconds of the whole process between start and stop
+
+    def __init__(self, traceMemory=False):
+        self.traceMemory = traceMemory
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.startTime = None
+        self.startCpuTime = None
+        self.totalWallTime = None
+        self.totalCpuTime = None
+
+    # Makes this profiler the one that receives the stages and counters of the modules
+    def start(self):
+        global ACTIVE
+        ACTIVE = self
+
+        if self.traceMemory:
+            tracemalloc.start()
+
+        self.startTime = time.perf_counter()
+        self.startCpuTime = time.process_time()
+        return self
+
+    # Stops receiving stages and counters
+    def stop(self):
+        global ACTIVE
+        if ACTIVE is self:
+            ACTIVE = None
+
+        self.totalWallTime = time.perf_counter() - self.startTime
+        self.totalCpuTime = time.process_time() - self.startCpuTime
+
+        if self.traceMemory:
+            tracemalloc.stop()
+
+    # Context manager that records a run of a stage
+    @contextmanager
+    def stage(self, name):
+        stack = self.__getStack__()
+        entry = { "childWallTime": 0, "peakMemory": 0 }
+
+        if self.traceMemory:
+            # The peak reached so far belongs to the stage that contains this one
+            if stack:
+                stack[-1]["peakMemory"] = max(stack[-1]["peakMemory"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        stack.append(entry)
+        start = time.perf_counter()
+        startCpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wallTime = time.perf_counter() - start
+            cpuTime = time.thread_time() - startCpu
+            stack.pop()
+
+            if self.traceMemory:
+                peakMemory = max(entry["peakMemory"], tracemalloc.get_traced_memory()[1])
+            else:
+                peakMemory = __getPeakRss__()
+
+            if stack:
+                stack[-1]["childWallTime"] += wallTime
+                stack[-1]["peakMemory"] = max(stack[-1]["peakMemory"], peakMemory)
+
+            with self.lock:
+                totals = self.stages.setdefault(name, { "calls": 0, "wallTime": 0.0, "selfWallTime": 0.0, "cpuTime": 0.0, "peakMemory": 0 })
+                totals["calls"] += 1
+                totals["wallTime"] += wallTime
+                totals["selfWallTime"] += wallTime - entry["childWallTime"]
+                totals["cpuTime"] += cpuTime
+                totals["peakMemory"] = max(totals["peakMemory"], peakMemory)
+
+                self.events.append({
+                    "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                    "ts": (start - self.startTime) * 1e6, "dur": wallTime * 1e6,
+                    "args": { "cpuTime": cpuTime, "peakMemory": peakMemory }
+                })
+
+    # Adds "value" to a counter
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Returns the report of the profiled program, as a dict that can be written as JSON
+    def getReport(self):
+        with self.lock:
+            return {
+                "totalWallTime": self.totalWallTime if self.totalWallTime is not None else time.perf_counter() - self.startTime,
+                "totalCpuTime": self.totalCpuTime if self.totalCpuTime is not None else time.process_time() - self.startCpuTime,
+                "peakRss": __getPeakRss__(),
+                "memoryTraced": self.traceMemory,
+                "stages": { name: dict(totals) for name, totals in self.stages.items() },
+                "counters": dict(self.counters)
+            }
+
+    # Writes the report as a JSON file
+    def writeReport(self, fileName):
+        with open(fileName, "w") as file:
+            json.dump(self.getReport(), file, indent=2)
+
+    # Writes the runs of the stages, and the final value of the counters, as a trace that can be
+    # opened with chrome://tracing or https://ui.perfetto.dev
+    def writeTrace(self, fileName):
+        with self.lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+
+        endTime = max([event["ts"] + event["dur"] for event in events], default=0)
+        events += [{ "name": name, "ph": "C", "pid": os.getpid(), "ts": endTime, "args": { name: value } } for name, value in counters.items()]
+
+        with open(fileName, "w") as file:
+            json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, file)
+
+    def __getStack__(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+# Records a run of a stage in the active profiler (a context manager)
+def stage(name):
+    return ACTIVE.stage(name) if ACTIVE else nullcontext()
+
+# Adds "value" to a counter of the active profiler
+def count(name, value=1):
+    if ACTIVE:
+        ACTIVE.count(name, value)
+
+# Yields the items of an iterable, recording the time spent producing each of them as a run of
+# a stage (used for the stages of the pipelines, which produce the message chunk by chunk)
+def profiled(name, iterable):
+    if ACTIVE is None:
+        return iterable
+
+    return __profiledItems__(name, iter(iterable))
+
+################################### AUX FUNCTIONS ###################################
+
+def __profiledItems__(name, iterator):
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+# Returns the peak RSS of the process, in bytes
+def __getPeakRss__():
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports it in KiB, and macOS in bytes
+    return peakRss if sys.platform == "darwin" else peakRss * 1024
@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+
+from modules.SetElem import CHANNELS, DEFAULT_CHANNELS
+
+# The JSON of the 256 values of a color component, normalized to [0, 1] like the API expects
+# them. They are the same text that json.dumps writes for "component/255"
+FLOAT_STRINGS = np.array([json.dumps(component / 255) for component in range(256)], dtype=object)
+
+# Writes the updateTextStyle requests that change the colors of some slots directly as JSON,
+# without building a dict for each of them. The text is exactly the one that json.dumps writes
+# for the dicts, so the batches sent are the same, but each request costs a single string
+# formatting, and its size is known without serializing it again
+class RequestEncoder:
+    # Attributes:
+    # - channels (list):  Channels written by the requests, in the order of the components of the colors
+    # - template (str):   The JSON of a request, with the placeholders of the range and the components
+
+    def __init__(self, channels=DEFAULT_CHANNELS):
+        self.channels = channels
+
+        # Each channel is a field of the text style, with 3 of the components of the color
+        textStyle = ", ".join(json.dumps(CHANNELS[channel]) + ': {"color": {"rgbColor": {"red": %s, "green": %s, "blue": %s}}}'
+                              for channel in channels)
+        fields = json.dumps(",".join(CHANNELS[channel] for channel in channels))
+
+        self.template = '{"updateTextStyle": {"range": {"startIndex": %d, "endIndex": %d}, "textStyle": {' + textStyle + '}, "fields": ' + fields + '}}'
+
+    # Returns the JSON of the requests that write an (N, 3 * channelCount) array of colors to
+    # the slots that start at "startIndices" (an array of N document indexes)
+    def encode(self, startIndices, colors):
+        components = FLOAT_STRINGS[np.asarray(colors, dtype=np.uint8)].tolist()
+        template = self.template
+
+        return [template % (startIndex, startIndex + 1, *row) for startIndex, row in zip(np.asarray(startIndices).tolist(), components)]
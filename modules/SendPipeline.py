@@ -0,0 +1,154 @@
+import itertools
+
+from modules.ChecksumTable import ChecksumTable
+from modules.Messages import GroupPacker
+from modules.Profiler import stage, count, profiled
+from modules.SetElem import DEFAULT_CHANNELS
+
+# Sends a file to a document as a pipeline of bounded-size chunks: the file is read, compressed,
+# encrypted, packed into groups, converted into colors and committed piece by piece, so the
+# memory used does not depend on the size of the file, and the first batches of requests are
+# uploaded while the rest of the file is still being encoded
+# The length indicator is only known at the end, so it is written after the rest of the message.
+# Until then, the document does not hold a complete message
+# If the message has checksums, their table is placed at "firstSlot", sized for the maximum size
+# of the message, and the message goes after it. The checksums are calculated as the chunks are
+# encoded, and the table is written at the end, with the length indicator
+class SendPipeline:
+    # Attributes:
+    # - compressor (Compressor): Compresses the file
+    # - pgp (PGP):               Encrypts the compressed file. It must have a public key
+    # - set (Set):               Converts the groups into colors
+    # - channels (list):         Channels of the slots where the message is written
+    # - shardPool (ShardPool):   If set, the groups are packed and converted into colors by its processes
+    # - checksumSet (Set):       If set, the message has a ChecksumTable, written with this set (the
+    #                            one of the header, with a single channel)
+
+    def __init__(self, compressor, pgp, Set, channels=DEFAULT_CHANNELS, shardPool=None, checksumSet=None):
+        self.compressor = compressor
+        self.pgp = pgp
+        self.set = Set
+        self.channels = channels
+        self.shardPool = shardPool
+        self.checksumSet = checksumSet
+
+    # Returns the number of slots needed to send a file, without reading it. If the file is
+    # compressed, it is an upper bound (the size of the file if it could not be compressed)
+    def getMaxSlotCount(self, fileName):
+        return self.__getSlotCount__(self.compressor.getMaxCompressedSize(fileName))
+
+    # Returns the exact number of slots needed to send a file. The file is compressed to know its
+    # size, but the output is discarded, so the whole file is never in memory
+    def getSlotCount(self, fileName):
+        return self.__getSlotCount__(sum(len(chunk) for chunk in self.compressor.compressChunks(fileName)))
+
+    # Sends a file to a GoogleDoc (or StripedDoc), starting at "firstSlot". "maxSlotCount" must
+    # be the result of getMaxSlotCount or getSlotCount. Returns the number of slots of the
+    # message (and of its checksums), and how many of them already had the right color
+    # If a journal (already started) is given, the ciphertext and the confirmed batches are
+    # recorded in it, so the upload can be resumed if it fails
+    def send(self, fileName, gdoc, firstSlot=0, maxSlotCount=None, journal=None):
+        encryptor = self.pgp.newEncryptor()
+
+        compressedChunks = __rechunk__(profiled("compress", self.compressor.compressChunks(fileName)), encryptor.chunkSize)
+        encryptedChunks = itertools.chain([encryptor.header], profiled("encrypt", encryptor.encryptChunks(compressedChunks)))
+        if journal:
+            encryptedChunks = __journaled__(encryptedChunks, journal)
+
+        return self.__sendEncrypted__(encryptedChunks, gdoc, firstSlot, maxSlotCount, journal)
+
+    # Resumes an upload that failed, with the ciphertext recorded in its journal. The batches
+    # confirmed before the failure are not sent again
+    def resume(self, gdoc, journal):
+        return self.__sendEncrypted__(journal.readCiphertext(), gdoc, journal.meta["firstSlot"], journal.meta["maxSlotCount"], journal)
+
+    def __sendEncrypted__(self, encryptedChunks, gdoc, firstSlot, maxSlotCount, journal):
+        capacity = gdoc.getAvailableSpaceCount()
+        packer = GroupPacker(self.set.groupSize)
+
+        # The message goes after the table of its checksums
+        table = ChecksumTable.fromMaxSlotCount(maxSlotCount if maxSlotCount is not None else capacity - firstSlot) if self.checksumSet else None
+        tableSlot = firstSlot
+        if table:
+            firstSlot += table.getSize()
+
+        # The first slot is left for the length indicator
+        slot = firstSlot + 1
+        skippedSlotCount = 0
+
+        gdoc.beginCommit(maxSlotCount, journal)
+
+        try:
+            for encryptedChunk in itertools.chain(encryptedChunks, [None]):
+                if self.shardPool and encryptedChunk is not None:
+                    # The processes of the pool pack and encode the whole groups of the chunk
+                    with stage("encode"):
+                        colors = self.shardPool.encode(self.set, packer.align(encryptedChunk))
+                else:
+                    with stage("pack"):
+                        groups = packer.pack(encryptedChunk) if encryptedChunk is not None else packer.finish()
+                    with stage("encode"):
+                        colors = self.set.getElemsAt(groups)
+                count("groupsEncoded", len(colors))
+
+                if slot + len(colors) > capacity:
+                    print("ERROR\nThe document does not have the necessary length to fully hold the message to transmit")
+                    exit()
+
+                skippedSlotCount += gdoc.commitChunk(colors, self.channels, slot)
+                if table:
+                    table.add(colors, slot - firstSlot)
+                slot += len(colors)
+
+            # Write the length indicator once the rest of the message has been uploaded
+            gdoc.flushCommit()
+            lengthColors = self.set.getElemsAt(packer.getLengthIndicator())
+            skippedSlotCount += gdoc.commitChunk(lengthColors, self.channels, firstSlot)
+
+            if table:
+                table.add(lengthColors, 0)
+                table.finish(slot - firstSlot)
+                skippedSlotCount += gdoc.commitChunk(table.toColors(self.checksumSet), DEFAULT_CHANNELS, tableSlot)
+            gdoc.endCommit()
+        except BaseException:
+            # The upload can only be resumed with the whole ciphertext, so finish recording it
+            # (also when the tool exits because of an error, like running out of slots)
+            if journal and journal.ciphertextFile:
+                for _ in encryptedChunks:
+                    pass
+            raise
+
+        return slot - tableSlot, skippedSlotCount
+
+    # Returns the number of slots needed by a compressed file of "size" bytes
+    def __getSlotCount__(self, size):
+        encryptedSize = self.pgp.getEncryptedSize(size)
+
+        # The groups of the message, plus the length and padding indicators
+        slotCount = -(-(encryptedSize * 8) // self.set.groupSize) + 2
+
+        return slotCount + (ChecksumTable.getSizeFor(slotCount) if self.checksumSet else 0)
+
+################################### AUX FUNCTIONS ###################################
+
+# Joins and splits the pieces of any size given by an iterable into chunks of "chunkSize" bytes
+# (the last one can be smaller)
+def __rechunk__(pieces, chunkSize):
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunkSize:
+            yield bytes(buffer[:chunkSize])
+            del buffer[:chunkSize]
+
+    if buffer:
+        yield bytes(buffer)
+
+# Records in a journal the pieces of ciphertext given by an iterable as they are yielded, and
+# marks it as complete after the last one
+def __journaled__(chunks, journal):
+    for chunk in chunks:
+        journal.writeCiphertext(chunk)
+        yield chunk
+
+    journal.closeCiphertext()
@@ -1,9 +1,25 @@
 
 import random
 import hashlib
+import os
+
+import numpy as np
 
 from modules.SetElem import SetElem
 
+# Ways of scrambling the set:
+# - rot:     The original ROT-N shift of the positions (N is taken from the hash of the key)
+# - feistel: A keyed permutation of the positions, computed with a Feistel network
+SCRAMBLINGS = ["rot", "feistel"]
+
+# Number of rounds of the Feistel network. Each round uses a 64-bit key taken from the hash of
+# the scrambling key
+FEISTEL_ROUNDS = 8
+
+# Largest group size whose permutation can be precomputed as a table (2^24 positions, 64 MiB
+# for each direction)
+MAX_TABLE_BITS = 24
+
 # This class represents the set of actions that can be used to encode information
 # Each of the groups in which the message has been divided is mapped with one SetElem.
 # The message is sent through the channel by executing all the actions that represent it
@@ -16,10 +32,24 @@ class Set:
     #                                 a way of scrambling the set is needed. A ROT-N """cipher""" is 
     #                                 used to do this, where N is this argument
     #
-    # - scramblingModulo (int):       The modulo for the ROT-N operation
+    # - scramblingModulo (int):       The modulo for the ROT-N operation (the number of elements of the set)
+    #
+    # - scrambling (str):             How the set is scrambled (see SCRAMBLINGS). With "feistel", the
+    #                                 position of each element is given by a keyed permutation that
+    #                                 is computed, in both directions, without having the set in memory
+    #
+    # - roundKeys (numpy array):      The key of each round of the Feistel network
+    #
+    # - table, inverseTable (numpy arrays): If the permutation has been precomputed, the scrambled
+    #                                 position of each position, and the other way around
+    #
+    # - tablePaths (list):            The files of the tables (None if they are not used)
 
-    def __init__(self, groupSize, scramblingPassword):
+    # If "tableDir" is given, the Feistel permutation is precomputed as a table and stored in that
+    # directory, so the next sets with the same key just memory-map it
+    def __init__(self, groupSize, scramblingPassword, scrambling="rot", tableDir=None):
         self.groupSize = groupSize
+        self.scrambling = scrambling
 
         # Run the "scramblingPassword" though a SHA-256 hash and get two bytes from it
         myhash = hashlib.sha256(scramblingPassword.encode())
@@ -33,14 +63,122 @@ class Set:
         # using an array, but using some rules
         self.scramblingModulo = pow(2, groupSize)
 
+        # The keys of the rounds are taken from a different hash than the ROT-N, which also
+        # depends on the group size, so sets of different sizes are not related
+        digest = hashlib.sha512(("feistel:" + str(groupSize) + ":" + scramblingPassword).encode()).digest()
+        self.roundKeys = np.frombuffer(digest, dtype=">u8").astype(np.uint64)[:FEISTEL_ROUNDS]
+
+        self.table = None
+        self.inverseTable = None
+        self.tablePaths = None
+        if scrambling == "feistel" and tableDir is not None and groupSize <= MAX_TABLE_BITS:
+            self.table, self.inverseTable = self.__loadTables__(tableDir, digest)
+
+    # When a set is sent to another process, the tables are memory-mapped again there instead
+    # of being copied
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["table"] = state["inverseTable"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.tablePaths:
+            self.table, self.inverseTable = (np.load(path, mmap_mode="r") for path in self.tablePaths)
+
     # Implements a ROT-N operation for "scrambling" the set
     def __applyScrambling__(self, index):
+        if self.scrambling != "rot":
+            return int(self.__scramble__(np.array([index], dtype=np.uint64))[0])
+
         return (index + self.scramblingDisplacement) % self.scramblingModulo
 
     # Implements the operation needed to undo the ROT-N operation
     def __unapplyScrambling__(self, scrambledIndex):
+        if self.scrambling != "rot":
+            return int(self.__unscramble__(np.array([scrambledIndex], dtype=np.uint64))[0])
+
         return ((self.scramblingModulo - self.scramblingDisplacement) + scrambledIndex) % self.scramblingModulo
 
+    # Vectorized scrambling of an array of positions (uint64)
+    def __scramble__(self, indices):
+        if self.scrambling == "rot":
+            return (indices + np.uint64(self.scramblingDisplacement)) % np.uint64(self.scramblingModulo)
+        if self.table is not None:
+            return self.table[indices].astype(np.uint64)
+
+        return self.__cycleWalk__(indices, self.__feistelEncrypt__)
+
+    # Vectorized version of the operation that undoes "__scramble__"
+    def __unscramble__(self, scrambledIndices):
+        if self.scrambling == "rot":
+            return (scrambledIndices + np.uint64(self.scramblingModulo - self.scramblingDisplacement)) % np.uint64(self.scramblingModulo)
+        if self.inverseTable is not None:
+            return self.inverseTable[scrambledIndices].astype(np.uint64)
+
+        return self.__cycleWalk__(scrambledIndices, self.__feistelDecrypt__)
+
+    # The Feistel network works on an even number of bits. If the group size is odd, it permutes
+    # twice as many positions as the set has, so the permutation is applied again ("cycle walking")
+    # to the positions that fall outside of the set until they fall inside, which keeps it bijective
+    def __cycleWalk__(self, indices, permutation):
+        result = permutation(indices)
+
+        outside = np.flatnonzero(result >= np.uint64(self.scramblingModulo))
+        while len(outside):
+            result[outside] = permutation(result[outside])
+            outside = outside[result[outside] >= np.uint64(self.scramblingModulo)]
+
+        return result
+
+    # Applies the Feistel network to an array of positions. Each half of the bits of a position
+    # is mixed with the other one in turns, so the network can be reversed round by round
+    def __feistelEncrypt__(self, indices):
+        halfBits = np.uint64((self.groupSize + 1) // 2)
+        mask = np.uint64((1 << int(halfBits)) - 1)
+
+        left, right = indices >> halfBits, indices & mask
+        for key in self.roundKeys:
+            left, right = right, left ^ (__roundFunction__(right, key) & mask)
+
+        return (left << halfBits) | right
+
+    # Undoes the Feistel network, applying the rounds in the reverse order
+    def __feistelDecrypt__(self, indices):
+        halfBits = np.uint64((self.groupSize + 1) // 2)
+        mask = np.uint64((1 << int(halfBits)) - 1)
+
+        left, right = indices >> halfBits, indices & mask
+        for key in self.roundKeys[::-1]:
+            left, right = right ^ (__roundFunction__(left, key) & mask), left
+
+        return (left << halfBits) | right
+
+    # Returns the tables of the permutation and its inverse, memory-mapped from "tableDir". They are
+    # computed and stored the first time. The name of the files is a hash of the keys of the rounds
+    # Note that the tables reveal the scrambling as much as the key does
+    def __loadTables__(self, tableDir, digest):
+        name = hashlib.sha256(digest).hexdigest()[:32]
+        paths = [os.path.join(tableDir, name + suffix + ".npy") for suffix in ["", ".inverse"]]
+        self.tablePaths = paths
+
+        try:
+            return tuple(np.load(path, mmap_mode="r") for path in paths)
+        except (OSError, ValueError):
+            pass
+
+        table = self.__cycleWalk__(np.arange(self.scramblingModulo, dtype=np.uint64), self.__feistelEncrypt__).astype(np.uint32)
+        inverseTable = np.empty_like(table)
+        inverseTable[table] = np.arange(self.scramblingModulo, dtype=np.uint32)
+
+        os.makedirs(tableDir, exist_ok=True)
+        for path, array in zip(paths, [table, inverseTable]):
+            with open(path + ".tmp", "wb") as file:
+                np.save(file, array)
+            os.replace(path + ".tmp", path)
+
+        return tuple(np.load(path, mmap_mode="r") for path in paths)
+
     # Alternative scrambling function. This function sould be called manually after instantiating
     # this class. It implements a "better" scrambling algorithm, but the performance of it in a large
     # list like the one needed here (length of 2^24 elements) is bad
@@ -95,3 +233,48 @@ class Set:
         color[0] = scrambledIndex // 256
 
         return SetElem(color)
+
+    # Vectorized version of "getIndexOf". Converts an (N, 3) array of RGB colors into
+    # the array of the N positions of those colors in the set
+    # When the elements use more than one channel, each row has the colors of all of them,
+    # one after the other (N, 3 * channelCount), and the first one has the most significant bits
+    def getIndicesOf(self, colors):
+        bytesPerElem = self.groupSize // 8
+        colors = np.asarray(colors, dtype=np.uint64).reshape(-1, bytesPerElem)
+
+        indices = np.zeros(len(colors), dtype=np.uint64)
+        for column in range(bytesPerElem):
+            indices <<= np.uint64(8)
+            indices |= colors[:, column]
+
+        # Undo the scrambling for all the elements at once
+        return self.__unscramble__(indices)
+
+    # Vectorized version of "getElemAt". Converts an array of N positions of the set into
+    # an (N, 3) array with the RGB colors of the elements in those positions
+    # (N, 3 * channelCount) if the elements use more than one channel
+    def getElemsAt(self, indices):
+        bytesPerElem = self.groupSize // 8
+        indices = np.asarray(indices, dtype=np.uint64)
+
+        # Apply the scrambling to all the elements at once
+        scrambledIndices = self.__scramble__(indices)
+
+        colors = np.empty((len(indices), bytesPerElem), dtype=np.uint8)
+        for column in range(bytesPerElem):
+            colors[:, bytesPerElem - 1 - column] = (scrambledIndices >> np.uint64(8 * column)) & np.uint64(0xFF)
+
+        return colors
+
+################################### AUX FUNCTIONS ###################################
+
+# Round function of the Feistel network: a keyed mix of the bits of an array of half positions
+# (the finalizer of SplitMix64), computed with wrapping 64-bit multiplications
+def __roundFunction__(values, key):
+    values = values ^ key
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> np.uint64(31)
+    values = values * np.uint64(0x94D049BB133111EB)
+    values ^= values >> np.uint64(29)
+
+    return values
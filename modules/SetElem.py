@@ -1,14 +1,32 @@
+# Properties of the text that can be used to hide information, with the name of their field
+# in the text styles of the Google Docs API. The order is the order of the channels in the
+# groups: the first channel used holds the most significant bits
+CHANNELS = {
+    "foreground": "foregroundColor",
+    "background": "backgroundColor"
+}
+
+# Each channel is an RGB color
+BITS_PER_CHANNEL = 24
+
+# The channels used by the original encoding (and by the messages without header)
+DEFAULT_CHANNELS = ["foreground"]
+
 
 # This class represents something that has the ability to represent information
 # in the stego-channel
 # In this case, it represents the possible actions that can be performed in the document
 # As all the considered actions are related with changing the color of the text, the content
 # of the class is very simple, as there is no need to distinguish between action types, for example
+# The actions can change more than one property of the text at once. Each property is a "channel"
+# that carries BITS_PER_CHANNEL bits of the group (see CHANNELS)
 # This class can be read as: "An action that consists on changing the color of some text to a specific RGB value"
 class SetElem:
     # Attributes:
-    # - color (list): A list of 3 numbers between 0-255 that represent
-    #                 an RGB color. The order of the components MUST BE R,G,B
+    # - color (list):           A list of 3 numbers between 0-255 that represent
+    #                           an RGB color. The order of the components MUST BE R,G,B
+    # - backgroundColor (list): The same for the background color of the text, if it is used
 
-    def __init__(self, color):
+    def __init__(self, color, backgroundColor=None):
         self.color = color
+        self.backgroundColor = backgroundColor
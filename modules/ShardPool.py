@@ -0,0 +1,134 @@
+import math
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from modules.Messages import __packGroups__, __unpackGroups__, __groupDtype__
+
+# Smallest number of groups given to a process. Smaller pieces are not worth the cost of
+# sending them to another process
+MIN_SHARD_GROUPS = 1 << 14
+
+# Converts bytes into colors and colors into bytes using a pool of processes, for messages of
+# millions of slots. The input is split into shards of whole groups (and of whole bytes when
+# decoding), which are processed in parallel. The input and the output are exchanged through
+# shared memory, so only the position of each shard is sent to the processes
+# The length and padding indicators are not part of the shards: the caller encodes them apart,
+# and tells "decode" the padding of the last shard
+class ShardPool:
+    # Attributes:
+    # - workers (int):                    Number of processes
+    # - executor (ProcessPoolExecutor):   The processes
+
+    def __init__(self, workers):
+        self.workers = workers
+
+        # The processes are started from scratch (not forked), as the upload threads may be
+        # holding locks when they are started
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # Packs some bytes into groups and converts them into an (N, bytesPerElem) array of colors
+    # with a Set, like GroupPacker.pack and Set.getElemsAt do. The bytes must make whole groups
+    # (see GroupPacker.align)
+    def encode(self, Set, data):
+        unitSize = Set.groupSize // math.gcd(Set.groupSize, 8)
+        groupsPerUnit = unitSize * 8 // Set.groupSize
+        bytesPerElem = Set.groupSize // 8
+
+        groupCount = len(data) * 8 // Set.groupSize
+        shards = self.__getShards__(groupCount, groupsPerUnit)
+
+        with __SharedArray__(len(data), np.uint8) as input, __SharedArray__(groupCount * bytesPerElem, np.uint8) as output:
+            input.array[:] = np.frombuffer(data, dtype=np.uint8)
+
+            futures = [self.executor.submit(__encodeShard__, Set, input.name, len(data), output.name, groupCount, start, end)
+                       for start, end in shards]
+            for future in futures:
+                future.result()
+
+            return output.array.reshape(groupCount, bytesPerElem).copy()
+
+    # Converts an (N, bytesPerElem) array of colors into groups with a Set and unpacks them into
+    # bytes, like Set.getIndicesOf and EncodedMessage.decodeChunks do. The last "paddingSize"
+    # bits of the last group are removed
+    def decode(self, Set, colors, paddingSize=0):
+        colors = np.ascontiguousarray(colors, dtype=np.uint8)
+        groupCount = len(colors)
+
+        # Every shard but the last one must be made of whole bytes
+        shards = self.__getShards__(groupCount, 8 // math.gcd(Set.groupSize, 8))
+        outputSize = -(-(groupCount * Set.groupSize) // 8)
+
+        with __SharedArray__(colors.size, np.uint8) as input, __SharedArray__(outputSize, np.uint8) as output:
+            input.array[:] = colors.reshape(-1)
+
+            futures = [self.executor.submit(__decodeShard__, Set, input.name, colors.shape, output.name, outputSize, start, end,
+                                            paddingSize if end == groupCount else 0)
+                       for start, end in shards]
+            lastShardSize = [future.result() for future in futures][-1] if futures else 0
+
+            # Only the last shard can be shorter than its groups, because of the padding
+            start = shards[-1][0] * Set.groupSize // 8 if shards else 0
+            return output.array[:start + lastShardSize].tobytes()
+
+    # Stops the processes
+    def close(self):
+        self.executor.shutdown()
+
+    # Splits "groupCount" groups into one shard per process (or fewer, if they would be too
+    # small). The first group of every shard is a multiple of "alignment"
+    # Returns the (start, end) of each shard
+    def __getShards__(self, groupCount, alignment):
+        if groupCount == 0:
+            return []
+
+        shardCount = max(min(self.workers, groupCount // MIN_SHARD_GROUPS), 1)
+        shardSize = -(-groupCount // shardCount)
+        shardSize = -(-shardSize // alignment) * alignment
+
+        return [(start, min(start + shardSize, groupCount)) for start in range(0, groupCount, shardSize)]
+
+################################### AUX FUNCTIONS ###################################
+
+# A numpy array in shared memory, that other processes can open by its name. The one that
+# creates it removes it when it is closed
+class __SharedArray__:
+    def __init__(self, size, dtype, name=None):
+        nbytes = max(size * np.dtype(dtype).itemsize, 1)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=nbytes if name is None else 0)
+        self.owner = name is None
+        self.name = self.memory.name
+        self.array = np.ndarray(size, dtype=dtype, buffer=self.memory.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        del self.array
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+# Runs in a process of the pool: encodes the groups from "start" to "end"
+def __encodeShard__(Set, inputName, inputSize, outputName, groupCount, start, end):
+    bytesPerElem = Set.groupSize // 8
+
+    with __SharedArray__(inputSize, np.uint8, inputName) as input, __SharedArray__(groupCount * bytesPerElem, np.uint8, outputName) as output:
+        data = input.array[start * Set.groupSize // 8 : end * Set.groupSize // 8]
+        output.array[start * bytesPerElem : end * bytesPerElem] = Set.getElemsAt(__packGroups__(data, Set.groupSize)).reshape(-1)
+
+# Runs in a process of the pool: decodes the groups from "start" to "end". Returns the number
+# of bytes written
+def __decodeShard__(Set, inputName, shape, outputName, outputSize, start, end, paddingSize):
+    with __SharedArray__(shape[0] * shape[1], np.uint8, inputName) as input, __SharedArray__(outputSize, np.uint8, outputName) as output:
+        colors = input.array.reshape(shape)[start:end]
+        groups = Set.getIndicesOf(colors).astype(__groupDtype__(Set.groupSize))
+        data = __unpackGroups__(groups, Set.groupSize, paddingSize)
+
+        offset = start * Set.groupSize // 8
+        output.array[offset : offset + len(data)] = np.frombuffer(data, dtype=np.uint8)
+
+        return len(data)
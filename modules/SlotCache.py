@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+
+from modules.SlotIndex import SlotIndex
+
+# Default directory of the cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gdoc-stego")
+
+# The columns of a SlotIndex, each one stored in its own ".npy" file
+COLUMNS = ["startIndices", "colors", "defaults", "runIds", "paragraphIds", "backgroundColors", "styledGaps"]
+
+# Stores on disk the SlotIndex of each document, together with the revision of the document
+# it was read from. The columns are stored as ".npy" files that are memory-mapped when loaded,
+# so loading them is almost free, and the changes made to the index are written to the files
+class SlotCache:
+    # Attributes:
+    # - cacheDir (str): Directory with one subdirectory per document
+
+    def __init__(self, cacheDir=DEFAULT_CACHE_DIR):
+        self.cacheDir = cacheDir
+
+    # Returns the cached SlotIndex of a document, memory-mapped, or None if there is no
+    # cached index for that revision of the document
+    def load(self, documentId, revisionId):
+        meta = self.__readMeta__(documentId)
+        if meta is None or revisionId is None or meta.get("revisionId") != revisionId:
+            return None
+
+        try:
+            columns = [self.__loadColumn__(documentId, column) for column in COLUMNS]
+        except (OSError, ValueError):
+            return None
+
+        return SlotIndex(*columns)
+
+    # Stores the SlotIndex of a revision of a document, and returns it memory-mapped
+    # from the cache, so later changes to it are written to the cache too
+    def store(self, documentId, revisionId, slotIndex):
+        os.makedirs(self.__getPath__(documentId), exist_ok=True)
+
+        # The revision is removed first, so a half-written index is never used
+        self.invalidate(documentId)
+
+        for column in COLUMNS:
+            path = self.__getPath__(documentId, column + ".npy")
+            with open(path + ".tmp", "wb") as file:
+                np.save(file, getattr(slotIndex, column))
+            os.replace(path + ".tmp", path)
+
+        self.__writeMeta__(documentId, { "revisionId": revisionId })
+
+        return self.load(documentId, revisionId)
+
+    # Marks the cached index of a document as not valid. It must be called before changing
+    # a memory-mapped index, and "update" must be called after the changes
+    def invalidate(self, documentId):
+        if self.__readMeta__(documentId) is not None:
+            self.__writeMeta__(documentId, { "revisionId": None })
+
+    # Writes to disk the changes made to a memory-mapped index, and records the revision
+    # of the document that it corresponds to
+    def update(self, documentId, revisionId, slotIndex):
+        for column in COLUMNS:
+            array = getattr(slotIndex, column)
+            if isinstance(array, np.memmap):
+                array.flush()
+
+        self.__writeMeta__(documentId, { "revisionId": revisionId })
+
+    def __loadColumn__(self, documentId, column):
+        path = self.__getPath__(documentId, column + ".npy")
+
+        try:
+            return np.load(path, mmap_mode="r+")
+        except ValueError:
+            # Empty arrays cannot be memory-mapped
+            return np.load(path)
+
+    def __getPath__(self, documentId, *names):
+        return os.path.join(self.cacheDir, documentId, *names)
+
+    def __readMeta__(self, documentId):
+        try:
+            with open(self.__getPath__(documentId, "meta.json"), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def __writeMeta__(self, documentId, meta):
+        path = self.__getPath__(documentId, "meta.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(meta, file)
+
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,124 @@
+import numpy as np
+
+# Index of all the slots (spaces) of a document, stored by columns so that documents with
+# millions of spaces do not need one Python object per space
+class SlotIndex:
+    # Attributes:
+    # - startIndices (numpy array): int64 array with the position of each space in the document
+    # - colors (numpy array):       (N, 3) uint8 array with the RGB color of each space
+    # - defaults (numpy array):     bool array, True when the space has no color set, neither the
+    #                               foreground nor the background one (so it inherits the default ones)
+    # - runIds (numpy array):       int64 array with the number of the text run that contained
+    #                               each space when the document was read (only the runs with
+    #                               spaces or with colored text are counted)
+    # - paragraphIds (numpy array): int64 array with the number of the structural element
+    #                               (paragraph) that contains each space
+    # - backgroundColors (numpy array): (N, 3) uint8 array with the RGB background color of each space
+    # - styledGaps (numpy array):   bool array, True when some text between the previous space and
+    #                               this one (other than spaces) has its own foreground or background
+    #                               color, so it must not be reset with the spaces around it
+
+    def __init__(self, startIndices, colors, defaults, runIds, paragraphIds, backgroundColors, styledGaps):
+        self.startIndices = startIndices
+        self.colors = colors
+        self.defaults = defaults
+        self.runIds = runIds
+        self.paragraphIds = paragraphIds
+        self.backgroundColors = backgroundColors
+        self.styledGaps = styledGaps
+
+    def __len__(self):
+        return len(self.startIndices)
+
+# Builds a SlotIndex from the text runs of a document, given one by one
+# The text of the runs is scanned for spaces in big chunks instead of character by character
+class SlotIndexBuilder:
+    # Maximum number of characters and runs kept before scanning them
+    CHUNK_SIZE = 1 << 20
+    CHUNK_RUNS = 1 << 16
+
+    def __init__(self):
+        self.chunks = []
+        self.runCount = 0
+        self.styledSinceLastSpace = False
+        self.__resetRuns__()
+
+    # Adds a text run, with the number of its paragraph, its start index in the document,
+    # its text, its RGB foreground and background colors and whether both are the default ones
+    # The runs without spaces are only needed if they are colored
+    def addRun(self, paragraphId, startIndex, content, color, backgroundColor, isDefault):
+        self.runTexts.append(content)
+        self.runOffsets.append(self.textLength)
+        self.runStartIndices.append(startIndex)
+        self.runColors.append(color)
+        self.runBackgroundColors.append(backgroundColor)
+        self.runDefaults.append(isDefault)
+        self.runParagraphIds.append(paragraphId)
+
+        self.textLength += len(content)
+        if self.textLength >= SlotIndexBuilder.CHUNK_SIZE or len(self.runTexts) >= SlotIndexBuilder.CHUNK_RUNS:
+            self.__scanRuns__()
+
+    # Returns the SlotIndex with all the spaces of the runs added
+    def build(self):
+        self.__scanRuns__()
+
+        if not self.chunks:
+            return SlotIndex(np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.uint8), np.empty(0, dtype=bool),
+                    np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.uint8), np.empty(0, dtype=bool))
+
+        return SlotIndex(*[np.concatenate(column) for column in zip(*self.chunks)])
+
+    # Finds the spaces of the runs added since the last scan
+    def __scanRuns__(self):
+        if not self.runTexts:
+            return
+
+        # Each character is converted to a 32-bit code, so the offset of every space
+        # in the joined text is also its offset in the text of the run
+        codes = np.frombuffer("".join(self.runTexts).encode("utf-32-le"), dtype=np.uint32)
+        offsets = np.flatnonzero(codes == ord(" "))
+
+        runOffsets = np.array(self.runOffsets, dtype=np.int64)
+        runs = np.searchsorted(runOffsets, offsets, side="right") - 1
+        runDefaults = np.array(self.runDefaults, dtype=bool)
+
+        # Count the colored characters (other than spaces) before each offset, to know which
+        # spaces have some of them since the previous space. Most chunks have no colored runs
+        styledGaps = np.zeros(len(offsets), dtype=bool)
+        styledAfterLastSpace = False
+        if not runDefaults.all():
+            runLengths = np.diff(np.append(runOffsets, len(codes)))
+            styledCounts = np.concatenate(([0], np.cumsum((codes != ord(" ")) & ~np.repeat(runDefaults, runLengths))))
+            styledGaps = styledCounts[offsets] > styledCounts[np.concatenate(([0], offsets[:-1] + 1))]
+            styledAfterLastSpace = bool(styledCounts[-1] > styledCounts[offsets[-1] + 1 if len(offsets) else 0])
+
+        # The colored text at the end of the chunk comes before the first space of the next one
+        if len(offsets):
+            styledGaps[0] |= self.styledSinceLastSpace
+            self.styledSinceLastSpace = styledAfterLastSpace
+        else:
+            self.styledSinceLastSpace |= styledAfterLastSpace
+
+        self.chunks.append((
+            np.array(self.runStartIndices, dtype=np.int64)[runs] + (offsets - runOffsets[runs]),
+            np.array(self.runColors, dtype=np.uint8).reshape(-1, 3)[runs],
+            runDefaults[runs],
+            runs + self.runCount,
+            np.array(self.runParagraphIds, dtype=np.int64)[runs],
+            np.array(self.runBackgroundColors, dtype=np.uint8).reshape(-1, 3)[runs],
+            styledGaps
+        ))
+
+        self.runCount += len(self.runTexts)
+        self.__resetRuns__()
+
+    def __resetRuns__(self):
+        self.runTexts = []
+        self.runOffsets = []
+        self.runStartIndices = []
+        self.runColors = []
+        self.runBackgroundColors = []
+        self.runDefaults = []
+        self.runParagraphIds = []
+        self.textLength = 0
@@ -0,0 +1,232 @@
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules.BatchCommitter import TokenBucket, DOCS_WRITE_REQUESTS_PER_MINUTE, MAX_BATCH_BYTES
+from modules.GoogleDoc import GoogleDoc, DOCUMENTS_BASE_FOLDER_NAME
+from modules.Header import Header
+from modules.SetElem import DEFAULT_CHANNELS
+
+# Represents all the documents of the "docs" folder used as a single stego-channel
+# The slots of the message are split into stripes, one per document, that are read and written
+# in parallel. The first document (the "header document") starts with a header slot and a table
+# that describes the stripes, with two groups per stripe: a hash of the ID of its document, and
+# its number of slots. The stripe of the header document goes after the table
+# The header and the table always use only the foreground channel, while the stripes use the
+# channels of the message, which are recorded in the header
+# It offers the same operations as GoogleDoc, so it can be used in its place
+class StripedDoc:
+    # Attributes:
+    # - set (Set):                The set used to encode the header and the table (a single channel)
+    # - documents (list):         The GoogleDoc of each document. The header document is the first one
+    # - layout (list of ints):    Number of slots of the stripe of each document, or None if the
+    #                             documents do not contain a striped message
+    # - channels (list):          The channels used by the striped message in the documents
+    # - scrambling (str):         How the set of the striped message is scrambled. When sending,
+    #                             it must be set to the one used before writing the message
+    # - writtenSlots (list of ints): Number of slots written to each stripe by the current commit
+
+    def __init__(self, Set, backend, uploadWorkers=4, requestsPerMinute=DOCS_WRITE_REQUESTS_PER_MINUTE, cache=None, maxBatchBytes=MAX_BATCH_BYTES):
+        self.set = Set
+
+        folderId = backend.findFolder(DOCUMENTS_BASE_FOLDER_NAME)
+        documentIds = sorted(document["id"] for document in backend.listDocuments(folderId))
+
+        # All the documents share the quota of the account
+        rateLimiter = TokenBucket(requestsPerMinute / 60, requestsPerMinute)
+
+        # Read all the documents in parallel
+        with ThreadPoolExecutor(max_workers=min(len(documentIds), 16) or 1) as executor:
+            self.documents = list(executor.map(
+                    lambda documentId: GoogleDoc(uploadWorkers=uploadWorkers, requestsPerMinute=requestsPerMinute, backend=backend,
+                                                 cache=cache, documentId=documentId, rateLimiter=rateLimiter, maxBatchBytes=maxBatchBytes),
+                    documentIds))
+
+        self.__loadLayout__()
+
+    # Reads again the documents that have changed since they were read. If any of them has
+    # changed, the table is read again too. Returns True if any document was read again
+    def refresh(self):
+        with ThreadPoolExecutor(max_workers=min(len(self.documents), 16) or 1) as executor:
+            changed = any(list(executor.map(lambda gdoc: gdoc.refresh(), self.documents)))
+
+        if changed:
+            self.documents.sort(key=lambda gdoc: gdoc.documentId)
+            self.__loadLayout__()
+
+        return changed
+
+    # Finds the table of the striped message, if any document has it, and sorts the documents
+    # as in the table
+    def __loadLayout__(self):
+        self.layout = None
+        self.channels = DEFAULT_CHANNELS
+        self.scrambling = "rot"
+        for gdoc in self.documents:
+            header, table = self.__readTable__(gdoc)
+            if table is not None:
+                documentsByHash = { __hashDocumentId__(document.documentId): document for document in self.documents }
+                if sorted(table[0::2]) != sorted(documentsByHash):
+                    print("ERROR: the documents of the folder do not match the ones used to write the striped message")
+                    exit()
+
+                self.documents = [documentsByHash[documentHash] for documentHash in table[0::2]]
+                self.layout = table[1::2]
+                self.channels = header.channels
+                self.scrambling = header.scrambling
+                break
+
+    # Returns the number of slots that can be used to hide a message, excluding the header and the table
+    def getAvailableSpaceCount(self):
+        return max(sum(self.__getCapacities__()), 0)
+
+    # Returns the IDs of the documents used, sorted
+    def getDocumentIds(self):
+        return sorted(gdoc.documentId for gdoc in self.documents)
+
+    # Returns a hash of the positions of the slots of all the documents
+    def getSlotFingerprint(self):
+        fingerprints = { gdoc.documentId: gdoc.getSlotFingerprint() for gdoc in self.documents }
+        return hashlib.sha256("".join(fingerprints[documentId] for documentId in sorted(fingerprints)).encode()).hexdigest()
+
+    # Returns an (N, 3 * channelCount) array with the colors of the slots of the striped message,
+    # joining its stripes
+    def getColors(self, channels=DEFAULT_CHANNELS):
+        if self.layout is None:
+            return np.empty((0, 3 * len(channels)), dtype=np.uint8)
+
+        stripes = [self.documents[0].getColors(channels)[self.__getTableSize__() : self.__getTableSize__() + self.layout[0]]]
+        for gdoc, slotCount in zip(self.documents[1:], self.layout[1:]):
+            stripes.append(gdoc.getColors(channels)[:slotCount])
+
+        return np.concatenate(stripes)
+
+    # Splits the colors of the message into stripes, and writes them (and the header and table)
+    # to all the documents in parallel. Returns the number of slots that already had the right color
+    # "firstSlot" is the position of the colors in the joined stripes
+    def commit(self, colors, channels=DEFAULT_CHANNELS, firstSlot=0):
+        self.beginCommit(firstSlot + len(colors))
+        skippedSlotCount = self.commitChunk(colors, channels, firstSlot)
+        self.endCommit()
+
+        return skippedSlotCount
+
+    # Starts a commit made of several chunks (see GoogleDoc.beginCommit). The stripes are sized
+    # for "maxSlotCount" slots, and the table is written at the end with the slots actually written
+    def beginCommit(self, maxSlotCount, journal=None):
+        self.layout = __splitSlots__(maxSlotCount, self.__getCapacities__())
+        self.writtenSlots = [0] * len(self.documents)
+
+        for gdoc in self.documents:
+            gdoc.beginCommit(journal=journal)
+
+    # Adds a chunk of colors to the current commit. "firstSlot" is the position of the colors in
+    # the joined stripes. Each part of the chunk is sent to the document of its stripe
+    def commitChunk(self, colors, channels=DEFAULT_CHANNELS, firstSlot=0):
+        if firstSlot + len(colors) > sum(self.layout):
+            print("ERROR: The message does not fit in the space reserved for it in the documents")
+            exit()
+
+        self.channels = channels
+
+        skippedSlotCount = 0
+        stripeStart = 0
+        for i, (gdoc, slotCount) in enumerate(zip(self.documents, self.layout)):
+            start = max(firstSlot, stripeStart)
+            end = min(firstSlot + len(colors), stripeStart + slotCount)
+
+            if start < end:
+                # The stripe of the header document starts after the table
+                documentSlot = start - stripeStart + (self.__getTableSize__() if i == 0 else 0)
+                skippedSlotCount += gdoc.commitChunk(colors[start - firstSlot : end - firstSlot], channels, documentSlot)
+                self.writtenSlots[i] = max(self.writtenSlots[i], end - stripeStart)
+
+            stripeStart += slotCount
+
+        return skippedSlotCount
+
+    # Waits until all the chunks added to the current commit have been uploaded
+    def flushCommit(self):
+        with ThreadPoolExecutor(max_workers=min(len(self.documents), 16)) as executor:
+            list(executor.map(lambda gdoc: gdoc.flushCommit(), self.documents))
+
+    # Uploads the rest of the chunks, and then writes the header and the table, so the documents
+    # only have a complete table once all the stripes have been written
+    def endCommit(self):
+        with ThreadPoolExecutor(max_workers=min(len(self.documents), 16)) as executor:
+            list(executor.map(lambda gdoc: gdoc.endCommit(), self.documents))
+
+        self.layout = self.writtenSlots
+
+        # Build the header and the table
+        groups = [Header(stripeCount=len(self.documents), channels=self.channels, scrambling=self.scrambling).toGroup()]
+        for gdoc, slotCount in zip(self.documents, self.layout):
+            groups += [__hashDocumentId__(gdoc.documentId), slotCount]
+
+        # The header and the table use a single channel, so they are written apart from the stripes
+        self.documents[0].commit(self.set.getElemsAt(groups))
+
+    # Resets the slots after the stripe of each document. "firstSlot" is the number of slots
+    # of the message, which is already known from the table. Returns the number of requests sent
+    def compact(self, firstSlot):
+        # Without a striped message, it is not known which slots can be reset
+        if self.layout is None:
+            return 0
+
+        usedSlots = list(self.layout)
+        usedSlots[0] += self.__getTableSize__()
+
+        with ThreadPoolExecutor(max_workers=min(len(self.documents), 16)) as executor:
+            return sum(executor.map(lambda gdoc, slotCount: gdoc.compact(slotCount), self.documents, usedSlots))
+
+    # Returns the number of slots of the header and the table
+    def __getTableSize__(self):
+        return 1 + 2 * len(self.documents)
+
+    # Returns the number of slots of each document available for its stripe
+    def __getCapacities__(self):
+        capacities = [gdoc.getAvailableSpaceCount() for gdoc in self.documents]
+        if capacities:
+            capacities[0] = max(capacities[0] - self.__getTableSize__(), 0)
+
+        return capacities
+
+    # Returns the header and the table of the striped message if the document is its header
+    # document, or None. The first entry of the table must be the document itself
+    def __readTable__(self, gdoc):
+        header = Header.fromDoc(gdoc, self.set)
+        if header is None or header.stripeCount != len(self.documents) or gdoc.getAvailableSpaceCount() < self.__getTableSize__():
+            return None, None
+
+        table = self.set.getIndicesOf(gdoc.getColors()[1 : self.__getTableSize__()]).tolist()
+        if table[0] != __hashDocumentId__(gdoc.documentId):
+            return None, None
+
+        return header, table
+
+################################### AUX FUNCTIONS ###################################
+
+# Returns a 24-bit hash of the ID of a document, used to identify it in the table
+def __hashDocumentId__(documentId):
+    return int.from_bytes(hashlib.sha256(documentId.encode()).digest()[:3], "big")
+
+# Splits "slotCount" slots between some documents, proportionally to their capacities
+def __splitSlots__(slotCount, capacities):
+    totalCapacity = sum(capacities)
+    if totalCapacity == 0:
+        return [0] * len(capacities)
+
+    layout = [slotCount * capacity // totalCapacity for capacity in capacities]
+
+    # Give the slots left by the rounding to the documents with more free space
+    remainder = slotCount - sum(layout)
+    for i in sorted(range(len(capacities)), key=lambda i: layout[i] - capacities[i]):
+        if remainder == 0:
+            break
+        extra = min(remainder, capacities[i] - layout[i])
+        layout[i] += extra
+        remainder -= extra
+
+    return layout
@@ -0,0 +1,271 @@
+import os
+import sys
+
+from modules.ChecksumTable import ChecksumTable
+from modules.Compressor import Compressor
+from modules.Header import Header
+from modules.Messages import EncodedMessage
+from modules.Profiler import stage, profiled
+from modules.SetElem import DEFAULT_CHANNELS
+
+# The steps to send, resume, receive and compact a message, shared by the tool (main.py) and the
+# worker (see Worker), so both of them lay out the documents and record the uploads in the same
+# way. Like the rest of the tool, they print their progress, and print the errors and exit
+
+# Where the message of a document starts and how it was written, as read by readLayout
+class MessageLayout:
+    # Attributes:
+    # - header (Header):        The header of the message, or None if it uses the original layout
+    # - channels (list):        Names of the channels used by the message (see CHANNELS)
+    # - scrambling (str):       How the set of the message is scrambled (see Set.SCRAMBLINGS)
+    # - firstSlot (int):        The slot of its length indicator, after the header and the table
+    # - table (ChecksumTable):  The table of its checksums, or None (if it has none, or it is damaged)
+    # - hasMessage (bool):      Whether the document holds a message at all
+
+    def __init__(self, header=None, channels=DEFAULT_CHANNELS, scrambling="rot", firstSlot=0, table=None, hasMessage=True):
+        self.header = header
+        self.channels = channels
+        self.scrambling = scrambling
+        self.firstSlot = firstSlot
+        self.table = table
+        self.hasMessage = hasMessage
+
+# Returns the MessageLayout of the message of a GoogleDoc (or a StripedDoc, if "striped" is
+# set), reading its header with the "headerSet". "baseSlot" is the first slot of the message:
+# the start of its extent, if it is in a MessageDirectory
+# A damaged table of checksums is an error, unless "allowDamagedTable" is set (to repair it)
+def readLayout(gdoc, headerSet, striped=False, baseSlot=0, allowDamagedTable=False) -> MessageLayout:
+    if striped:
+        return MessageLayout(channels=gdoc.channels, scrambling=gdoc.scrambling)
+
+    header = Header.fromDoc(gdoc, headerSet, baseSlot)
+    if header is not None and header.stripeCount:
+        print('ERROR: The message is split across several documents. Use "--striped" to read it')
+        exit()
+    firstSlot = baseSlot + (1 if header else 0)
+
+    # Without a header, the message starts with its length indicator, which is never left
+    # with the default color. A document that is empty (or compacted) holds no message
+    hasMessage = header is not None or (firstSlot < gdoc.getAvailableSpaceCount() and not gdoc.getDefaults()[firstSlot])
+
+    # The message starts after the table of its checksums
+    table = None
+    if header is not None and header.checksums:
+        table = ChecksumTable.fromDoc(gdoc, headerSet, firstSlot)
+        if table is None and not allowDamagedTable:
+            print("ERROR: The table of the checksums of the message is damaged")
+            exit()
+        firstSlot += table.getSize() if table else 0
+
+    return MessageLayout(header, header.channels if header else DEFAULT_CHANNELS, header.scrambling if header else "rot", firstSlot, table, hasMessage)
+
+# Sends a file to a GoogleDoc (or a StripedDoc, if "striped" is set) with a SendPipeline, after
+# checking that it fits. The "header" describes the channels, the scrambling and the checksums of
+# the pipeline. In a single document, it is only written if the message does not use the
+# original layout. The upload is recorded in the "journal" (if given), so it can be resumed
+# If a MessageDirectory is given, the message is written in one of its free extents and added
+# to it. Otherwise, the leftovers of older messages after the new one are reset
+# Returns the number of slots of the message, how many of them already had the right color, and
+# the ID of the message in the directory or the number of ranges reset (the other one is None)
+def sendMessage(fileName, gdoc, backend, headerSet, pipeline, header, striped=False, codec="auto", journal=None, directory=None):
+    # Check if the document is long enough to hold the whole message, before doing anything
+    print("Checking the capacity...    ", end="")
+    sys.stdout.flush()
+
+    # A single document only has a header if the message does not use the default channels and
+    # scrambling or has checksums, and in that case the message starts after it. The messages of
+    # a directory always have a header, and they must fit in one of its free extents
+    firstSlot = 1 if not striped and (directory is not None or not header.isDefault()) else 0
+    if directory is not None:
+        if directory.isFull():
+            print("ERROR\nThe directory of the document is full. Delete some message first")
+            exit()
+        availableSlotCount = max([slotCount for _, slotCount in directory.getFreeExtents()], default=1) - 1
+    else:
+        availableSlotCount = gdoc.getAvailableSpaceCount() - firstSlot
+    neededSlotCount = pipeline.getMaxSlotCount(fileName)
+
+    # The size of the file once compressed is not known until it is compressed. If the
+    # document can not hold the file uncompressed, the file is compressed to know its size
+    # The extent of a message of a directory is always allocated with its exact size, so the
+    # slots that the message does not use are not taken from a larger free extent
+    if (availableSlotCount < neededSlotCount or directory is not None) and codec != "none":
+        with stage("checkCapacity"):
+            neededSlotCount = pipeline.getSlotCount(fileName)
+
+    if availableSlotCount < neededSlotCount:
+        print("ERROR\nThe document does not have the necessary length to fully hold the message to transmit. " +
+                "The document has", availableSlotCount, "slots" + (" free in a row" if directory is not None else "") + ", but", neededSlotCount, "are required")
+        exit()
+
+    baseSlot = 0
+    if directory is not None:
+        baseSlot = directory.allocate(1 + neededSlotCount)
+        firstSlot = baseSlot + 1
+
+    print("Done")
+
+
+    # Upload the message to the document
+    print("Uploading the message...    ", end="")
+    sys.stdout.flush()
+
+    # A new directory is written before the message, so the upload can be resumed in it
+    if directory is not None:
+        gdoc.commit(directory.toColors(headerSet))
+    if firstSlot:
+        gdoc.commit(header.toColors(headerSet), DEFAULT_CHANNELS, firstSlot - 1)
+
+    # Record the upload, so it can be resumed with "--resume" if it fails
+    if journal:
+        journal.start({
+            "fileName": os.path.basename(fileName),
+            "channels": header.channels,
+            "scrambling": header.scrambling,
+            "firstSlot": firstSlot,
+            "maxSlotCount": neededSlotCount,
+            "checksums": header.checksums,
+            "directory": directory is not None,
+            "baseSlot": baseSlot,
+            "slotFingerprint": gdoc.getSlotFingerprint(),
+            "revisionIds": { documentId: backend.getRevisionId(documentId) for documentId in gdoc.getDocumentIds() }
+        })
+    with stage("upload"):
+        messageSlotCount, skippedSlotCount = pipeline.send(fileName, gdoc, firstSlot, neededSlotCount, journal)
+
+    print("Done (" + str(skippedSlotCount) + " of " + str(messageSlotCount) + " slots already had the right color)")
+
+    return (messageSlotCount, skippedSlotCount) + __finishUpload__(gdoc, headerSet, journal, firstSlot, messageSlotCount, directory, baseSlot)
+
+# Resumes the upload recorded in a journal (already loaded) that failed, without sending again
+# the batches already confirmed. The "pipeline" and the "header" must use the channels, the
+# scrambling and the checksums of the journal, and the "directory" must be given if the
+# message was being added to it. Returns the same as sendMessage
+def resumeMessage(gdoc, backend, headerSet, pipeline, header, journal, directory=None):
+    # The text of the documents must not have changed, or the slots would be different
+    print("Checking the journal...     ", end="")
+    sys.stdout.flush()
+
+    if gdoc.getSlotFingerprint() != journal.meta["slotFingerprint"]:
+        print("ERROR\nThe text of the document has changed since the upload failed, so it can not be resumed")
+        exit()
+
+    # If the document was edited after the last confirmed batch, the colors of those batches
+    # can not be trusted, so all the slots are checked again against the document
+    knownRevisionIds = journal.revisionIds | set(journal.meta["revisionIds"].values())
+    if any(backend.getRevisionId(documentId) not in knownRevisionIds for documentId in gdoc.getDocumentIds()):
+        journal.confirmed = {}
+        print("Done (the document has been edited, so every slot will be checked)")
+    else:
+        print("Done")
+
+
+    # Upload the rest of the message
+    print("Resuming the upload...      ", end="")
+    sys.stdout.flush()
+
+    firstSlot = journal.meta["firstSlot"]
+    if firstSlot:
+        gdoc.commit(header.toColors(headerSet), DEFAULT_CHANNELS, firstSlot - 1)
+    with stage("upload"):
+        messageSlotCount, skippedSlotCount = pipeline.resume(gdoc, journal)
+
+    print("Done (" + str(skippedSlotCount) + " of " + str(messageSlotCount) + " slots already had the right color)")
+
+    return (messageSlotCount, skippedSlotCount) + __finishUpload__(gdoc, headerSet, journal, firstSlot, messageSlotCount, directory,
+                                                                  journal.meta.get("baseSlot", 0))
+
+# Reads the message of a document, with its MessageLayout, and writes the file it contains
+# inside "outputDir". Returns the path of the written file
+def receiveMessage(gdoc, layout, Set, pgp, outputDir, shardPool=None):
+    # Create an encoded message by reading the document
+    print("Reading the message...      ", end="")
+    sys.stdout.flush()
+
+    encoded = EncodedMessage.fromGoogleDoc(gdoc, layout.channels, layout.firstSlot)
+
+    print("Done")
+
+    # The message is still read if some blocks are damaged, as they may only be in the
+    # slots of the message that are not used
+    if layout.table:
+        damagedBlocks = layout.table.getDamagedBlocks(encoded.colors)
+        if damagedBlocks:
+            print("WARNING:", len(damagedBlocks), "of", layout.table.getBlockCount(), "blocks of the message are damaged. " +
+                  'The sender can repair them with "verify"')
+
+
+    # Only the slots of the message are decoded. The decoded bytes are decrypted and
+    # decompressed chunk by chunk, and written to the output file as they are ready
+    print("Writing the output file...  ", end="")
+    sys.stdout.flush()
+
+    decodedChunks = profiled("decode", encoded.decodeChunks(Set, shardPool=shardPool))
+    with stage("writeOutput"):
+        outputFile = Compressor.decompressChunks(profiled("decrypt", pgp.decryptChunks(decodedChunks)), outputDir)
+
+    print("Done")
+
+    return outputFile
+
+# Resets all the slots after the message of a document, with its MessageLayout (all of them if
+# it holds no message). Returns the number of ranges reset
+def compactMessage(gdoc, layout, Set):
+    # Find where the current message ends. Only its length indicator needs to be decoded
+    print("Reading the message...      ", end="")
+    sys.stdout.flush()
+
+    encoded = EncodedMessage.fromGoogleDoc(gdoc, layout.channels, layout.firstSlot)
+    messageSlotCount = layout.firstSlot + (encoded.getMessageSlotCount(Set) if layout.hasMessage else 0)
+
+    print("Done" if layout.hasMessage else "Done (the document does not hold any message)")
+
+
+    # Reset all the slots after the message
+    print("Compacting the document...  ", end="")
+    sys.stdout.flush()
+
+    with stage("compact"):
+        requestCount = gdoc.compact(messageSlotCount)
+
+    print("Done (" + str(requestCount) + " ranges reset)")
+
+    return requestCount
+
+################################### AUX FUNCTIONS ###################################
+
+# Adds a message that has just been uploaded to the directory, or resets the leftovers of older
+# messages after it. The upload is only finished after it, so if the directory is not updated
+# the upload can be resumed again. Returns the ID of the message and the number of ranges reset
+# (one of them is None)
+def __finishUpload__(gdoc, headerSet, journal, firstSlot, messageSlotCount, directory, baseSlot):
+    if directory is not None:
+        # Its extent ends with the message, so the rest of the free extent can hold other messages
+        print("Updating the directory...   ", end="")
+        sys.stdout.flush()
+
+        messageId = directory.add(baseSlot, 1 + messageSlotCount)
+        if messageId is None:
+            print("ERROR\nThe directory of the document is full. Delete some message and resume the upload again")
+            exit()
+        gdoc.commit(directory.toColors(headerSet))
+        if journal:
+            journal.finish()
+
+        print("Done (the ID of the message is " + str(messageId) + ")")
+
+        return messageId, None
+
+    if journal:
+        journal.finish()
+
+    # Clear the leftovers of older messages after the new one
+    print("Compacting the document...  ", end="")
+    sys.stdout.flush()
+
+    with stage("compact"):
+        requestCount = gdoc.compact(firstSlot + messageSlotCount)
+
+    print("Done (" + str(requestCount) + " ranges reset)")
+
+    return None, requestCount
@@ -0,0 +1,248 @@
+import contextlib
+import io
+import json
+import os
+import time
+import traceback
+
+from modules.BatchCommitter import DOCS_WRITE_REQUESTS_PER_MINUTE, MAX_BATCH_BYTES
+from modules.CommitJournal import CommitJournal
+from modules.Compressor import Compressor
+from modules.GoogleDoc import GoogleDoc
+from modules.Header import Header
+from modules.MessageDirectory import MessageDirectory
+from modules.PGP import PGP
+from modules.SendPipeline import SendPipeline
+from modules.Set import Set, SCRAMBLINGS
+from modules.SetElem import CHANNELS, BITS_PER_CHANNEL, DEFAULT_CHANNELS
+from modules.StripedDoc import StripedDoc
+from modules.Transfer import readLayout, sendMessage, receiveMessage, compactMessage
+
+# Subdirectories of the spool directory:
+# - incoming:   jobs waiting to be run, as JSON files. They are run in the order of their names
+# - processing: the job being run
+# - done:       jobs that succeeded, with their result
+# - failed:     jobs that failed, with the output that explains why
+SPOOL_DIRS = ["incoming", "processing", "done", "failed"]
+
+# Seconds between two checks of the "incoming" directory when there are no jobs
+POLL_INTERVAL = 1
+
+# Runs send, receive and compact jobs taken from a spool directory, in a single long-running
+# process. Everything that does not depend on the message is kept between jobs: the backend
+# (with its authorized services), the sets, the RSA keys and the parsed documents. Before each
+# job, a document is only read again if its revision has changed, and the changes made by a job
+# are applied to the document kept in memory, so small messages only cost their API calls
+# A job is a JSON file with these fields:
+# - direction:     "s", "r" or "compact"
+# - scramblingKey: The key used to scramble the set
+# - rsaKeyFile:    The public key of the receiver when sending, or its private key when receiving
+# - file:          The file to send, or the directory where the received file is written
+# - channels:      (optional, when sending) List of channels used to hide the message
+# - codec:         (optional, when sending) Compression of the file (see Compressor)
+# - scrambling:    (optional, when sending) How the set is scrambled (see Set.SCRAMBLINGS)
+# - checksums:     (optional, when sending) Write the checksums of the blocks of the message (true
+#                  by default, except for striped messages)
+# - striped:       (optional) Use all the documents of the "docs" folder
+# The result of a job is written to "done/<job>" or "failed/<job>", with the job, its status,
+# the lines that the tool would have printed and its result (like the received file)
+class Worker:
+    # Attributes:
+    # - backend (DocumentBackend): The service that stores the documents
+    # - spoolDir (str):            Directory with the jobs (see SPOOL_DIRS)
+    # - cache (SlotCache):         Where the documents are cached (None to not cache them)
+    # - cacheDir (str):            Directory of the cache, where the journals of the uploads are kept
+    # - uploadWorkers (int):       Number of batchUpdate calls sent concurrently
+    # - requestsPerMinute (int):   Quota of batchUpdate calls per minute of the account
+    # - maxBatchBytes (int):       Maximum size of the body of a batchUpdate call
+    # - documents (dict):          The GoogleDoc and the StripedDoc, once they have been read
+    # - sets (dict):               The Set of each group size, scrambling key and scrambling
+    # - keys (dict):               A PGP object for each RSA key file
+
+    def __init__(self, backend, spoolDir, cache=None, cacheDir=None, uploadWorkers=4, requestsPerMinute=DOCS_WRITE_REQUESTS_PER_MINUTE,
+                 maxBatchBytes=MAX_BATCH_BYTES):
+        self.backend = backend
+        self.spoolDir = spoolDir
+        self.cache = cache
+        self.cacheDir = cacheDir
+        self.uploadWorkers = uploadWorkers
+        self.requestsPerMinute = requestsPerMinute
+        self.maxBatchBytes = maxBatchBytes
+
+        self.documents = {}
+        self.sets = {}
+        self.keys = {}
+
+        for name in SPOOL_DIRS:
+            os.makedirs(os.path.join(self.spoolDir, name), exist_ok=True)
+
+        # Jobs left by a worker that was stopped while running them are run again
+        for name in os.listdir(os.path.join(self.spoolDir, "processing")):
+            os.replace(os.path.join(self.spoolDir, "processing", name), os.path.join(self.spoolDir, "incoming", name))
+
+    # Runs the jobs of the spool directory as they arrive. If "once" is set, it returns when
+    # there are no jobs left. Returns the number of jobs run
+    def run(self, once=False, pollInterval=POLL_INTERVAL):
+        jobCount = 0
+        while True:
+            names = sorted(name for name in os.listdir(os.path.join(self.spoolDir, "incoming")) if name.endswith(".json"))
+            if not names:
+                if once:
+                    return jobCount
+                time.sleep(pollInterval)
+                continue
+
+            for name in names:
+                start = time.perf_counter()
+                succeeded = self.runJob(name)
+                print(name + ":", "done" if succeeded else "failed", "(%.2fs)" % (time.perf_counter() - start))
+                jobCount += 1
+
+    # Runs the job of the file "name" of the "incoming" directory. Returns True if it succeeded
+    def runJob(self, name):
+        path = os.path.join(self.spoolDir, "processing", name)
+        try:
+            os.replace(os.path.join(self.spoolDir, "incoming", name), path)
+        except FileNotFoundError:
+            # It was taken by another worker
+            return False
+
+        job = None
+        result = None
+        output = io.StringIO()
+
+        # The tool reports the errors by printing them and exiting, so both are captured
+        with contextlib.redirect_stdout(output):
+            try:
+                with open(path, "r") as file:
+                    job = json.load(file)
+                result = self.__runJob__(job)
+            except SystemExit:
+                pass
+            except Exception:
+                traceback.print_exc(file=output)
+
+        status = "done" if result is not None else "failed"
+
+        # After a failure, the documents kept in memory may not match the real ones
+        if status == "failed":
+            self.documents = {}
+
+        with open(os.path.join(self.spoolDir, status, name), "w") as file:
+            json.dump({ "job": job, "status": status, "output": output.getvalue().splitlines(), "result": result }, file, indent=2)
+        os.remove(path)
+
+        return status == "done"
+
+    # Runs a job, and returns its result (a dict). On error, it prints it and exits like the tool does
+    def __runJob__(self, job):
+        direction = job.get("direction")
+        if direction not in ["s", "r", "compact"]:
+            print('ERROR: The direction should be "s", "r" or "compact"')
+            exit()
+
+        for field in ["scramblingKey", "rsaKeyFile"] + (["file"] if direction != "compact" else []):
+            if not isinstance(job.get(field), str):
+                print('ERROR: The job must have a "' + field + '" field')
+                exit()
+
+        if not os.path.isfile(job["rsaKeyFile"]):
+            print("ERROR: The rsaKeyFile must exist")
+            exit()
+
+        striped = bool(job.get("striped"))
+        headerSet = self.__getSet__(BITS_PER_CHANNEL, job["scramblingKey"])
+        gdoc = self.__getDocument__(striped, headerSet)
+
+        # The jobs use the whole document, so they would overwrite (or misread) its messages
+        if not striped and MessageDirectory.fromDoc(gdoc, headerSet) is not None:
+            print('ERROR: The document holds a directory of messages. Use "main.py" with "--directory" or "--message-id" instead')
+            exit()
+
+        if direction == "s":
+            return self.__send__(job, gdoc, headerSet, striped)
+
+        layout = readLayout(gdoc, headerSet, striped)
+        myset = self.__getSet__(BITS_PER_CHANNEL * len(layout.channels), job["scramblingKey"], layout.scrambling)
+        if direction == "r":
+            return self.__receive__(job, gdoc, layout, myset)
+
+        return { "rangesReset": compactMessage(gdoc, layout, myset) }
+
+    def __send__(self, job, gdoc, headerSet, striped):
+        channels = job.get("channels", DEFAULT_CHANNELS)
+        if not channels or any(channel not in CHANNELS for channel in channels) or len(set(channels)) != len(channels):
+            print('ERROR: The channels must be a list of "' + '", "'.join(CHANNELS) + '", without repetitions')
+            exit()
+
+        if not os.path.isfile(job["file"]):
+            print("ERROR: The input file must exist")
+            exit()
+
+        scrambling = job.get("scrambling", "feistel")
+        if scrambling not in SCRAMBLINGS:
+            print('ERROR: The scrambling must be "' + '" or "'.join(SCRAMBLINGS) + '"')
+            exit()
+
+        checksums = bool(job.get("checksums", True)) and not striped
+        header = Header(channels=channels, scrambling=scrambling, checksums=checksums)
+        if striped:
+            gdoc.scrambling = scrambling
+
+        myset = self.__getSet__(BITS_PER_CHANNEL * len(channels), job["scramblingKey"], scrambling)
+        codec = job.get("codec", "auto")
+        pipeline = SendPipeline(Compressor(codec), self.__getKey__(job["rsaKeyFile"], public=True), myset, channels,
+                                checksumSet=headerSet if checksums else None)
+
+        # The upload can be resumed with "main.py s --resume" if it fails
+        journal = CommitJournal(gdoc.getDocumentIds(), os.path.join(self.cacheDir, "journal")) if self.cacheDir else None
+        messageSlotCount, skippedSlotCount, _, rangesReset = sendMessage(job["file"], gdoc, self.backend, headerSet, pipeline, header, striped,
+                                                                         codec, journal)
+
+        return { "slots": messageSlotCount, "skippedSlots": skippedSlotCount, "rangesReset": rangesReset }
+
+    def __receive__(self, job, gdoc, layout, myset):
+        # The output directory is created when the file is written
+        if os.path.exists(job["file"]):
+            print("ERROR: The output directory already exists")
+            exit()
+
+        return { "outputFile": receiveMessage(gdoc, layout, myset, self.__getKey__(job["rsaKeyFile"], public=False), job["file"]) }
+
+    # Returns the document (or the striped documents), reading them only if they have changed
+    def __getDocument__(self, striped, headerSet):
+        if striped in self.documents:
+            gdoc = self.documents[striped]
+            # The table of the striped documents is read with the set of the job
+            if not striped or gdoc.set is headerSet:
+                gdoc.refresh()
+                return gdoc
+
+        if striped:
+            gdoc = StripedDoc(headerSet, self.backend, uploadWorkers=self.uploadWorkers, requestsPerMinute=self.requestsPerMinute, cache=self.cache,
+                              maxBatchBytes=self.maxBatchBytes)
+        else:
+            gdoc = GoogleDoc(uploadWorkers=self.uploadWorkers, requestsPerMinute=self.requestsPerMinute, backend=self.backend, cache=self.cache,
+                             maxBatchBytes=self.maxBatchBytes)
+
+        self.documents[striped] = gdoc
+        return gdoc
+
+    def __getSet__(self, groupSize, scramblingKey, scrambling="rot"):
+        if (groupSize, scramblingKey, scrambling) not in self.sets:
+            self.sets[(groupSize, scramblingKey, scrambling)] = Set(groupSize, scramblingKey, scrambling)
+
+        return self.sets[(groupSize, scramblingKey, scrambling)]
+
+    # Returns a PGP object with the public or the private key of a file
+    def __getKey__(self, rsaKeyFile, public):
+        key = (os.path.abspath(rsaKeyFile), public)
+        if key not in self.keys:
+            pgp = PGP()
+            if public:
+                pgp.addPublicKey(rsaKeyFile)
+            else:
+                pgp.addPrivateKey(rsaKeyFile)
+            self.keys[key] = pgp
+
+        return self.keys[key]
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+from modules.LocalBackend import LocalBackend
+
+# Root of the repository, where the tools are
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Creates a document in the "docs" folder of a LocalBackend stored in "rootDir", with
+# "spaceCount" spaces split in lines of 100 words. Returns the backend and the ID of the document
+def createLocalDocument(rootDir, spaceCount=3000):
+    backend = LocalBackend(rootDir)
+    lines = ["w " * 100 for _ in range(spaceCount // 100)]
+    documentId = backend.createDocument("docs", "cover", "\n".join(lines))
+
+    return backend, documentId
+
+# Writes a new pair of RSA keys inside "rootDir". Returns the paths of the public and the private keys
+def createKeys(rootDir):
+    import rsa
+
+    publicKey, privateKey = rsa.newkeys(1024)
+    publicKeyFile, privateKeyFile = os.path.join(rootDir, "public.pem"), os.path.join(rootDir, "private.pem")
+    with open(publicKeyFile, "wb") as file:
+        file.write(publicKey.save_pkcs1())
+    with open(privateKeyFile, "wb") as file:
+        file.write(privateKey.save_pkcs1())
+
+    return publicKeyFile, privateKeyFile
+
+# Writes a file with "size" random bytes inside "rootDir". Returns its path
+def createPayload(rootDir, size, name="payload.bin"):
+    path = os.path.join(rootDir, name)
+    with open(path, "wb") as file:
+        file.write(os.urandom(size))
+
+    return path
+
+# Runs main.py with some arguments on the documents of a LocalBackend stored in "rootDir", with
+# the cache inside it. Returns the output of the tool
+def runTool(rootDir, *args):
+    command = [sys.executable, os.path.join(ROOT_DIR, "main.py")] + list(args) + \
+              ["--backend", "local:" + rootDir, "--cache-dir", os.path.join(rootDir, "cache"), "--requests-per-minute", "600000"]
+
+    return subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True).stdout
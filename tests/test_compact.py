@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from modules.GoogleDoc import GoogleDoc
+from modules.MemoryBackend import MemoryBackend
+
+RED = { "color": { "rgbColor": { "red": 1.0 } } }
+
+# Returns the text style of the character at "index" of a document resource
+def getStyleAt(document, index):
+    for element in document["body"]["content"]:
+        for run in element.get("paragraph", {}).get("elements", []):
+            if run["startIndex"] <= index < run["endIndex"]:
+                return run["textRun"].get("textStyle", {})
+
+class CompactTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.documentId = self.backend.createDocument("docs", "cover", "ab cd ef gh ij kl\nmn op")
+
+    def __colorText__(self, startIndex, endIndex, field):
+        request = { "updateTextStyle": { "range": { "startIndex": startIndex, "endIndex": endIndex }, "textStyle": { field: RED }, "fields": field } }
+        self.backend.batchUpdate(self.documentId, { "requests": [request] })
+
+    # The word "ef" (indexes 7-8) is colored by the author of the cover text
+    def testStyledTextIsKept(self):
+        self.__colorText__(7, 9, "backgroundColor")
+
+        gdoc = GoogleDoc(backend=self.backend)
+        self.assertEqual(gdoc.content.styledGaps.tolist(), [False, False, True, False, False, False])
+
+        gdoc.commit(np.full((5, 3), 7, dtype=np.uint8))
+        self.assertEqual(gdoc.compact(0), 2)
+
+        document = self.backend.documents[self.documentId]
+        self.assertIn("backgroundColor", getStyleAt(document, 7))
+        self.assertIn("backgroundColor", getStyleAt(document, 8))
+        for startIndex in gdoc.content.startIndices.tolist():
+            self.assertEqual(getStyleAt(document, startIndex), {})
+
+        # The model of the document matches the document read again
+        reread = GoogleDoc(backend=self.backend)
+        self.assertEqual(reread.content.defaults.tolist(), gdoc.content.defaults.tolist())
+        self.assertEqual(reread.content.styledGaps.tolist(), gdoc.content.styledGaps.tolist())
+
+    # A colored run without spaces, inside a word
+    def testStyledRunWithoutSpaces(self):
+        self.__colorText__(10, 11, "foregroundColor")
+
+        gdoc = GoogleDoc(backend=self.backend)
+        self.assertEqual(gdoc.content.styledGaps.tolist(), [False, False, False, True, False, False])
+
+        gdoc.commit(np.full((5, 3), 7, dtype=np.uint8))
+        self.assertEqual(gdoc.compact(0), 2)
+        self.assertIn("foregroundColor", getStyleAt(self.backend.documents[self.documentId], 10))
+
+    def testPlainTextIsResetByParagraph(self):
+        gdoc = GoogleDoc(backend=self.backend)
+        gdoc.commit(np.full((6, 3), 7, dtype=np.uint8))
+
+        self.assertEqual(gdoc.compact(0), 2)
+        self.assertTrue(GoogleDoc(backend=self.backend).content.defaults.all())
+
+if __name__ == "__main__":
+    unittest.main()
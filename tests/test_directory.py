@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from modules.GoogleDoc import GoogleDoc
+from modules.LocalBackend import LocalBackend
+from modules.MessageDirectory import MessageDirectory
+from modules.Set import Set
+from modules.SetElem import BITS_PER_CHANNEL
+
+from tests.helpers import createLocalDocument, createKeys, createPayload, runTool
+
+# Returns the [firstSlot, slotCount] extent of each message of the directory of the document of
+# a LocalBackend stored in "rootDir"
+def getMessages(rootDir):
+    return MessageDirectory.fromDoc(GoogleDoc(backend=LocalBackend(rootDir)), Set(BITS_PER_CHANNEL, "key")).getMessages()
+
+class DirectoryTest(unittest.TestCase):
+    # A file that compresses well fits in the free extent left by a small message, even if it
+    # would not fit uncompressed
+    def testExtentOfCompressedMessage(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            createLocalDocument(rootDir, 20000)
+            publicKeyFile, privateKeyFile = createKeys(rootDir)
+
+            for name, size in [("a.bin", 3000), ("b.bin", 1000)]:
+                self.assertIn("successfully uploaded", runTool(rootDir, "s", "key", publicKeyFile, "x", createPayload(rootDir, size, name), "--directory"))
+            self.assertIn("successfully deleted", runTool(rootDir, "delete", "key", publicKeyFile, "x", "--message-id", "1"))
+
+            payload = os.path.join(rootDir, "c.txt")
+            with open(payload, "w") as file:
+                file.write("all work and no play makes jack a dull boy\n" * 1000)
+            self.assertIn("successfully uploaded", runTool(rootDir, "s", "key", publicKeyFile, "x", payload, "--directory"))
+
+            messages = getMessages(rootDir)
+            self.assertEqual(messages[3][0], MessageDirectory(20000).getSize())
+            self.assertLess(messages[3][0] + messages[3][1], messages[2][0])
+
+            outputDir = os.path.join(rootDir, "output")
+            self.assertIn("successfully read", runTool(rootDir, "r", "key", privateKeyFile, "x", outputDir, "--message-id", "3"))
+            with open(payload, "rb") as sent, open(os.path.join(outputDir, "c.txt"), "rb") as received:
+                self.assertEqual(sent.read(), received.read())
+
+    # The ID of a deleted message is not given to the next one, even if it was the last ID given
+    def testIdsAreNotReused(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            createLocalDocument(rootDir, 20000)
+            publicKeyFile, _ = createKeys(rootDir)
+            payload = createPayload(rootDir, 1000)
+
+            for _ in range(2):
+                self.assertIn("successfully uploaded", runTool(rootDir, "s", "key", publicKeyFile, "x", payload, "--directory"))
+            self.assertIn("successfully deleted", runTool(rootDir, "delete", "key", publicKeyFile, "x", "--message-id", "2"))
+            self.assertIn("the ID of the message is 3", runTool(rootDir, "s", "key", publicKeyFile, "x", payload, "--directory"))
+
+            self.assertEqual(sorted(getMessages(rootDir)), [1, 3])
+            self.assertIn("There is no message with ID 2", runTool(rootDir, "delete", "key", publicKeyFile, "x", "--message-id", "2"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+
+from modules.GoogleDoc import GoogleDoc
+from modules.Header import Header, HEADER_FLAG, DIRECTORY_FLAG, CHECKSUMS_FLAG
+from modules.MemoryBackend import MemoryBackend
+from modules.Set import Set
+from modules.SetElem import BITS_PER_CHANNEL
+
+from tests.helpers import createLocalDocument, createKeys, createPayload, runTool
+
+KEYS = ["key", "mySuperSecretScramblingKey", "a", "b", "c", "0", "1", "secret", "another key"]
+
+class HeaderTest(unittest.TestCase):
+    def testGroupRoundTrip(self):
+        for header in [Header(), Header(3, ["foreground", "background"], "feistel"), Header(checksums=True), Header(directory=True)]:
+            parsed = Header.fromGroup(header.toGroup())
+            self.assertEqual((parsed.stripeCount, parsed.channels, parsed.scrambling, parsed.checksums, parsed.directory),
+                             (header.stripeCount, header.channels, header.scrambling, header.checksums, header.directory))
+
+    def testImpossibleGroups(self):
+        self.assertIsNone(Header.fromGroup(HEADER_FLAG | (1 << 20)))
+        self.assertIsNone(Header.fromGroup(Header(stripeCount=2).toGroup() | CHECKSUMS_FLAG))
+        self.assertIsNone(Header.fromGroup(Header(stripeCount=2).toGroup() | DIRECTORY_FLAG))
+        self.assertIsNone(Header.fromGroup(HEADER_FLAG | (0b100 << 8)))
+
+    # A slot with the default color decodes to a group with the header flag set, but it is not a header
+    def testEmptyDocument(self):
+        backend = MemoryBackend()
+        backend.createDocument("docs", "cover", "w " * 100)
+        gdoc = GoogleDoc(backend=backend)
+
+        for key in KEYS:
+            self.assertIsNone(Header.fromDoc(gdoc, Set(BITS_PER_CHANNEL, key)))
+
+    def testToolOnEmptyDocument(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            createLocalDocument(rootDir)
+            publicKeyFile, privateKeyFile = createKeys(rootDir)
+
+            self.assertIn("does not hold any message", runTool(rootDir, "r", "key", privateKeyFile, "x", rootDir + "/output"))
+            self.assertIn("does not hold any message", runTool(rootDir, "verify", "key", publicKeyFile, "x"))
+            self.assertIn("successfully compacted", runTool(rootDir, "compact", "key", publicKeyFile, "x"))
+
+            # A message in the original layout (without header) is still found
+            self.assertIn("successfully uploaded", runTool(rootDir, "s", "key", publicKeyFile, "x", createPayload(rootDir, 500), "--no-checksums", "--scrambling", "rot"))
+            self.assertIn("successfully read", runTool(rootDir, "r", "key", privateKeyFile, "x", rootDir + "/output"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from modules.CommitJournal import CommitJournal
+from modules.Compressor import Compressor
+from modules.GoogleDoc import GoogleDoc
+from modules.MemoryBackend import MemoryBackend
+from modules.PGP import PGP
+from modules.SendPipeline import SendPipeline
+from modules.Set import Set
+from modules.SetElem import BITS_PER_CHANNEL
+
+from tests.helpers import createKeys, createPayload
+
+class JournalTest(unittest.TestCase):
+    # The tool exits when the message does not fit in the document, but the journal still
+    # records the whole ciphertext
+    def testCiphertextIsCompleteWhenOutOfCapacity(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            backend = MemoryBackend()
+            backend.createDocument("docs", "cover", "w " * 100)
+            gdoc = GoogleDoc(backend=backend)
+
+            publicKeyFile, _ = createKeys(rootDir)
+            pgp = PGP()
+            pgp.addPublicKey(publicKeyFile)
+            pipeline = SendPipeline(Compressor("none"), pgp, Set(BITS_PER_CHANNEL, "key"))
+
+            journal = CommitJournal(gdoc.getDocumentIds(), os.path.join(rootDir, "journal"))
+            journal.start({ "firstSlot": 0, "maxSlotCount": None })
+            payload = createPayload(rootDir, 5000)
+            with self.assertRaises(SystemExit):
+                pipeline.send(payload, gdoc, 0, None, journal)
+
+            resumed = CommitJournal(gdoc.getDocumentIds(), os.path.join(rootDir, "journal"))
+            self.assertTrue(resumed.load())
+            self.assertEqual(sum(len(chunk) for chunk in resumed.readCiphertext()), pgp.getEncryptedSize(os.path.getsize(payload) + 2 + len("payload.bin")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from modules.PGP import PGP, HEADER_FORMAT, NONCE_SIZE, TAG_SIZE
+
+from tests.helpers import createKeys
+
+# Small chunks, so the messages have several of them
+CHUNK_SIZE = 1024
+
+class PGPTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as rootDir:
+            publicKeyFile, privateKeyFile = createKeys(rootDir)
+            cls.pgp = PGP(workers=2)
+            cls.pgp.addPublicKey(publicKeyFile)
+            cls.pgp.addPrivateKey(privateKeyFile)
+
+    # Returns a message encrypted with the framed format, and its plaintext
+    def __encrypt__(self, size):
+        plainText = os.urandom(size)
+        encryptor = self.pgp.newEncryptor(CHUNK_SIZE)
+        chunks = [plainText[i : i + CHUNK_SIZE] for i in range(0, size, CHUNK_SIZE)]
+
+        return encryptor.header + b"".join(encryptor.encryptChunks(chunks)), plainText
+
+    # Returns the header and the encrypted chunks of a framed message
+    def __split__(self, message):
+        headerSize = struct.calcsize(HEADER_FORMAT) + 128
+        frameSize = NONCE_SIZE + CHUNK_SIZE + TAG_SIZE
+
+        return message[:headerSize], [message[i : i + frameSize] for i in range(headerSize, len(message), frameSize)]
+
+    # Decrypts a message given in pieces of "pieceSize" bytes
+    def __decrypt__(self, message, pieceSize=100):
+        return b"".join(self.pgp.decryptChunks(message[i : i + pieceSize] for i in range(0, len(message), pieceSize)))
+
+    def testRoundTrip(self):
+        for size in [0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, 3 * CHUNK_SIZE + 5]:
+            message, plainText = self.__encrypt__(size)
+            self.assertEqual(len(message), self.pgp.getEncryptedSize(size, CHUNK_SIZE))
+            self.assertEqual(self.__decrypt__(message), plainText, size)
+            self.assertEqual(self.__decrypt__(message, len(message) or 1), plainText, size)
+
+        plainText = os.urandom(5000)
+        self.assertEqual(self.pgp.decrypt(self.pgp.encrypt(plainText)), plainText)
+
+    # Messages sent with the original tool are a single AES ciphertext
+    def testLegacyFormat(self):
+        from Crypto.Cipher import AES
+
+        plainText = os.urandom(3000)
+        message = self.pgp.encrypt(plainText, AES.MODE_GCM)
+        self.assertEqual(self.pgp.decrypt(message), plainText)
+        self.assertEqual(self.__decrypt__(message), plainText)
+
+    def testTamperedChunk(self):
+        message, _ = self.__encrypt__(3 * CHUNK_SIZE)
+        header, frames = self.__split__(message)
+        frames[1] = frames[1][:50] + bytes([frames[1][50] ^ 1]) + frames[1][51:]
+
+        with self.assertRaises(SystemExit):
+            self.__decrypt__(header + b"".join(frames))
+
+    def testReorderedChunks(self):
+        message, _ = self.__encrypt__(3 * CHUNK_SIZE)
+        header, frames = self.__split__(message)
+        frames[0], frames[1] = frames[1], frames[0]
+
+        with self.assertRaises(SystemExit):
+            self.__decrypt__(header + b"".join(frames))
+
+    # A message cut at the end of a chunk is only detected because the last chunk is marked
+    def testTruncatedMessage(self):
+        message, _ = self.__encrypt__(3 * CHUNK_SIZE + 5)
+        header, frames = self.__split__(message)
+
+        for truncated in [header + b"".join(frames[:-1]), header + b"".join(frames[:2]), message[:-1], header]:
+            with self.assertRaises(SystemExit):
+                self.__decrypt__(truncated)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from modules.Compressor import Compressor
+
+from tests.helpers import createLocalDocument, createKeys, createPayload, runTool
+
+class ReceiveTest(unittest.TestCase):
+    # The message fails after part of the file has been written
+    def testFailedDecompressionLeavesNoOutput(self):
+        def chunks():
+            yield bytes([0, len(b"file.txt")]) + b"file.txt" + b"x" * 1000
+            raise ValueError("the chunk 1 of the message has been modified")
+
+        with tempfile.TemporaryDirectory() as rootDir:
+            outputDir = os.path.join(rootDir, "output")
+            with self.assertRaises(ValueError):
+                Compressor.decompressChunks(chunks(), outputDir)
+            self.assertEqual(os.listdir(rootDir), [])
+
+            path = Compressor.decompressChunks([bytes([0, len(b"file.txt")]) + b"file.txt" + b"y" * 10], outputDir)
+            self.assertEqual(path, os.path.join(outputDir, "file.txt"))
+            with open(path, "rb") as file:
+                self.assertEqual(file.read(), b"y" * 10)
+
+    # A receive that fails can be retried with the same output directory
+    def testRetryFailedReceive(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            createLocalDocument(rootDir)
+            publicKeyFile, privateKeyFile = createKeys(rootDir)
+            otherKeysDir = os.path.join(rootDir, "other")
+            os.makedirs(otherKeysDir)
+            _, otherPrivateKeyFile = createKeys(otherKeysDir)
+
+            payload = createPayload(rootDir, 2000)
+            self.assertIn("successfully uploaded", runTool(rootDir, "s", "key", publicKeyFile, "x", payload))
+
+            outputDir = os.path.join(rootDir, "output")
+            self.assertNotIn("successfully read", runTool(rootDir, "r", "key", otherPrivateKeyFile, "x", outputDir))
+            self.assertFalse(any(name.startswith(".output") or name == "output" for name in os.listdir(rootDir)))
+
+            self.assertIn("successfully read", runTool(rootDir, "r", "key", privateKeyFile, "x", outputDir))
+            with open(payload, "rb") as expected, open(os.path.join(outputDir, "payload.bin"), "rb") as received:
+                self.assertEqual(expected.read(), received.read())
+
+    # Messages sent with the original tool are ZIP files, whose member names are sanitized when
+    # they are extracted
+    def testLegacyZipMessage(self):
+        for memberName, fileName in [("file.txt", "file.txt"), ("../evil.txt", "evil.txt"), ("/abs/file.txt", os.path.join("abs", "file.txt"))]:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w") as zf:
+                zf.writestr(memberName, b"legacy message")
+
+            with tempfile.TemporaryDirectory() as rootDir:
+                outputDir = os.path.join(rootDir, "output")
+                path = Compressor.decompressChunks([buffer.getvalue()[:10], buffer.getvalue()[10:]], outputDir)
+                self.assertEqual(path, os.path.join(outputDir, fileName))
+                with open(path, "rb") as file:
+                    self.assertEqual(file.read(), b"legacy message")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import unittest
+
+import numpy as np
+
+from modules.RequestEncoder import RequestEncoder
+from modules.SetElem import CHANNELS
+
+# Returns the updateTextStyle request that writes the colors of a slot, built as a dict
+def buildRequest(channels, startIndex, row):
+    textStyle = {}
+    for i, channel in enumerate(channels):
+        red, green, blue = (int(component) / 255 for component in row[3 * i : 3 * i + 3])
+        textStyle[CHANNELS[channel]] = { "color": { "rgbColor": { "red": red, "green": green, "blue": blue } } }
+
+    return {
+        "updateTextStyle": {
+            "range": { "startIndex": startIndex, "endIndex": startIndex + 1 },
+            "textStyle": textStyle,
+            "fields": ",".join(CHANNELS[channel] for channel in channels)
+        }
+    }
+
+class RequestEncoderTest(unittest.TestCase):
+    # The JSON written by the encoder is the one of the requests built as dicts
+    def testRequestsMatchDicts(self):
+        rng = np.random.default_rng(0)
+        for channels in [["foreground"], ["background"], ["foreground", "background"], ["background", "foreground"]]:
+            # Every value of a component, and random colors
+            colors = np.concatenate([np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3 * len(channels), axis=1),
+                                     rng.integers(0, 256, (500, 3 * len(channels)), dtype=np.uint8)])
+            for firstIndex in [1, 10 ** 9]:
+                startIndices = firstIndex + np.sort(rng.choice(10 * len(colors), len(colors), replace=False))
+
+                encoded = RequestEncoder(channels).encode(startIndices, colors)
+                self.assertEqual(len(encoded), len(colors))
+                for text, startIndex, row in zip(encoded, startIndices.tolist(), colors):
+                    request = buildRequest(channels, startIndex, row)
+                    self.assertEqual(json.loads(text), request)
+                    self.assertEqual(text, json.dumps(request))
+
+    def testNoRequests(self):
+        self.assertEqual(RequestEncoder().encode(np.array([], dtype=np.int64), np.empty((0, 3), dtype=np.uint8)), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from modules.Set import Set
+
+class FeistelSetTest(unittest.TestCase):
+    # The permutation must be a bijection of the positions of the set. With an odd group size, the
+    # Feistel network permutes twice as many positions, and cycle walking brings them back
+    def testPermutationIsBijective(self):
+        for groupSize in [1, 3, 5, 8, 9, 11, 12, 13, 16]:
+            myset = Set(groupSize, "key", "feistel")
+            positions = np.arange(2 ** groupSize, dtype=np.uint64)
+
+            scrambled = myset.__scramble__(positions.copy())
+            self.assertTrue((scrambled < 2 ** groupSize).all(), groupSize)
+            self.assertEqual(np.sort(scrambled).tolist(), positions.tolist(), groupSize)
+            self.assertEqual(myset.__unscramble__(scrambled).tolist(), positions.tolist(), groupSize)
+
+    # The colors of the elements give back their positions, with one or several channels
+    def testColorsRoundTrip(self):
+        rng = np.random.default_rng(0)
+        for groupSize in [8, 16, 24, 48]:
+            myset = Set(groupSize, "key", "feistel")
+            positions = np.concatenate([[0, 2 ** groupSize - 1], rng.integers(0, 2 ** groupSize, 10000, dtype=np.uint64)]).astype(np.uint64)
+
+            colors = myset.getElemsAt(positions)
+            self.assertEqual(colors.shape, (len(positions), groupSize // 8))
+            self.assertEqual(myset.getIndicesOf(colors).tolist(), positions.tolist())
+
+            # The single element versions use the same permutation
+            if groupSize == 24:
+                for position in positions[:100].tolist():
+                    self.assertEqual(myset.getIndexOf(myset.getElemAt(position)), position)
+
+    # The precomputed table is the same permutation, also when it is memory-mapped by the next
+    # sets with the same key and when the set is sent to another process
+    def testTable(self):
+        for groupSize in [13, 16]:
+            positions = np.arange(2 ** groupSize, dtype=np.uint64)
+            expected = Set(groupSize, "key", "feistel").__scramble__(positions.copy()).tolist()
+
+            with tempfile.TemporaryDirectory() as tableDir:
+                computed = Set(groupSize, "key", "feistel", tableDir)
+                loaded = Set(groupSize, "key", "feistel", tableDir)
+                self.assertIsInstance(loaded.table, np.memmap)
+
+                for myset in [computed, loaded, pickle.loads(pickle.dumps(loaded))]:
+                    self.assertIsNotNone(myset.table)
+                    scrambled = myset.__scramble__(positions)
+                    self.assertEqual(scrambled.tolist(), expected)
+                    self.assertEqual(myset.__unscramble__(scrambled).tolist(), positions.tolist())
+
+                # Another key does not use the same table
+                self.assertNotEqual(Set(groupSize, "other", "feistel", tableDir).__scramble__(positions).tolist(), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+
+from modules.CommitJournal import CommitJournal
+from modules.Worker import Worker
+
+from tests.helpers import createLocalDocument, createKeys, createPayload, runTool
+
+# Runs a job with a worker that uses the documents and the cache of "rootDir". Returns the
+# result written by the worker
+def runJob(rootDir, backend, job, name="job.json"):
+    worker = Worker(backend, os.path.join(rootDir, "spool"), cacheDir=os.path.join(rootDir, "cache"), requestsPerMinute=600000)
+    with open(os.path.join(rootDir, "spool", "incoming", name), "w") as file:
+        json.dump(job, file)
+    worker.run(once=True)
+
+    status = "done" if os.path.exists(os.path.join(rootDir, "spool", "done", name)) else "failed"
+    with open(os.path.join(rootDir, "spool", status, name), "r") as file:
+        return json.load(file)
+
+class WorkerTest(unittest.TestCase):
+    # The messages sent by the worker and by the tool can be read by the other one, and their
+    # uploads are recorded in the same way
+    def testWorkerAndToolShareTheLayout(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            backend, documentId = createLocalDocument(rootDir)
+            publicKeyFile, privateKeyFile = createKeys(rootDir)
+            journal = CommitJournal([documentId], os.path.join(rootDir, "cache", "journal"))
+
+            payload = createPayload(rootDir, 2000, "sent.bin")
+            result = runJob(rootDir, backend, { "direction": "s", "scramblingKey": "key", "rsaKeyFile": publicKeyFile, "file": payload }, "1.json")
+            self.assertEqual(result["status"], "done", result["output"])
+            self.assertTrue(journal.load())
+            workerMeta = journal.meta
+
+            outputDir = os.path.join(rootDir, "output1")
+            self.assertIn("successfully read", runTool(rootDir, "r", "key", privateKeyFile, "x", outputDir))
+            with open(payload, "rb") as sent, open(os.path.join(outputDir, "sent.bin"), "rb") as received:
+                self.assertEqual(sent.read(), received.read())
+
+            self.assertIn("successfully uploaded", runTool(rootDir, "s", "key", publicKeyFile, "x", payload, "--channels", "foreground,background"))
+            self.assertTrue(journal.load())
+            self.assertEqual(sorted(journal.meta), sorted(workerMeta))
+
+            outputDir = os.path.join(rootDir, "output2")
+            result = runJob(rootDir, backend, { "direction": "r", "scramblingKey": "key", "rsaKeyFile": privateKeyFile, "file": outputDir }, "2.json")
+            self.assertEqual(result["status"], "done", result["output"])
+            self.assertEqual(result["result"]["outputFile"], os.path.join(outputDir, "sent.bin"))
+
+    # A fresh document holds no message, but the jobs can use it
+    def testJobsOnFreshDocument(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            backend, _ = createLocalDocument(rootDir)
+            publicKeyFile, privateKeyFile = createKeys(rootDir)
+
+            result = runJob(rootDir, backend, { "direction": "compact", "scramblingKey": "key", "rsaKeyFile": publicKeyFile }, "1.json")
+            self.assertEqual(result["status"], "done", result["output"])
+            self.assertEqual(result["result"], { "rangesReset": 0 })
+
+            payload = createPayload(rootDir, 2000)
+            result = runJob(rootDir, backend, { "direction": "s", "scramblingKey": "key", "rsaKeyFile": publicKeyFile, "file": payload }, "2.json")
+            self.assertEqual(result["status"], "done", result["output"])
+
+    # The jobs would overwrite the messages of a directory
+    def testJobsRejectDirectory(self):
+        with tempfile.TemporaryDirectory() as rootDir:
+            backend, _ = createLocalDocument(rootDir)
+            publicKeyFile, _ = createKeys(rootDir)
+            payload = createPayload(rootDir, 2000)
+            self.assertIn("successfully uploaded", runTool(rootDir, "s", "key", publicKeyFile, "x", payload, "--directory"))
+
+            result = runJob(rootDir, backend, { "direction": "s", "scramblingKey": "key", "rsaKeyFile": publicKeyFile, "file": payload })
+            self.assertEqual(result["status"], "failed")
+            self.assertIn("holds a directory of messages", result["output"][-1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import argparse, os
+
+from main import createBackend
+from modules.BatchCommitter import DOCS_WRITE_REQUESTS_PER_MINUTE, MAX_BATCH_BYTES
+from modules.SlotCache import SlotCache, DEFAULT_CACHE_DIR
+from modules.Worker import Worker
+
+if __name__ == "__main__":
+    ################################# PARAMS #################################
+    # Params:
+    # - spoolDir:           Directory where the jobs are queued (see Worker)
+    # - credentialsFile:    The JSON file with the credentials for the API
+    ##########################################################################
+
+    argParser = argparse.ArgumentParser(description="Google Docs stego-tool worker: runs the send, receive and compact jobs queued in a spool directory, keeping the documents and the keys loaded between them")
+
+    argParser.add_argument("spoolDir", metavar="<spoolDir>", help='Directory with the jobs. They are queued as JSON files in "<spoolDir>/incoming", and their results are written to "<spoolDir>/done" or "<spoolDir>/failed"')
+    argParser.add_argument("credentialsFile", metavar="<credentialsFile>", help="JSON file that contains the login access of the account used")
+    argParser.add_argument("--backend", default="google", help='Where the document is stored: "google" (default), "local:<dir>" or the URL of a server that implements the Google APIs')
+    argParser.add_argument("--cache-dir", default=None, help="Directory where the parsed documents are cached between runs (by default ~/.cache/gdoc-stego)")
+    argParser.add_argument("--no-cache", action="store_true", help="Do not cache the documents on disk (they are still kept in memory)")
+    argParser.add_argument("--upload-workers", type=int, default=4, help="Number of batchUpdate calls sent to the document concurrently")
+    argParser.add_argument("--requests-per-minute", type=int, default=DOCS_WRITE_REQUESTS_PER_MINUTE, help="Quota of batchUpdate calls per minute of the account")
+    argParser.add_argument("--max-batch-bytes", type=int, default=MAX_BATCH_BYTES, help="Maximum size of the body of a batchUpdate call")
+    argParser.add_argument("--once", action="store_true", help="Exit when there are no jobs left, instead of waiting for new ones")
+
+    args = argParser.parse_args()
+
+    ################################################################################
+
+    # Check that the credentialsFile exists
+    if args.backend == "google" and not os.path.isfile(args.credentialsFile):
+        print("ERROR: The credentialsFile must exist")
+        exit()
+
+    cacheDir = args.cache_dir or DEFAULT_CACHE_DIR
+    worker = Worker(createBackend(args.backend, args.credentialsFile), args.spoolDir, cache=None if args.no_cache else SlotCache(cacheDir),
+                    cacheDir=cacheDir, uploadWorkers=args.upload_workers, requestsPerMinute=args.requests_per_minute,
+                    maxBatchBytes=args.max_batch_bytes)
+
+    print("Waiting for jobs in", os.path.join(args.spoolDir, "incoming"))
+
+    jobCount = worker.run(once=args.once)
+
+    print(jobCount, "jobs run")